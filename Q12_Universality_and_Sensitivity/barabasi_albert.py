@@ -5,8 +5,7 @@ from utils.timer import time_mark
 import time
 from metrics.entropy import one_dimensional_structural_entropy
 from metrics.entropy import von_Neumann_entropy
-from metrics.entropy_bound import sharpened_lower_bound
-from metrics.entropy_bound import sharpened_upper_bound
+from metrics.entropy_bound import entropy_gap_bounds
 
 logging.config.dictConfig(settings.LOGGING_SETTINGS)
 logger = logging.getLogger('normal')
@@ -47,8 +46,7 @@ class BarabasiAlbertTest(object):
         structural_entropy = one_dimensional_structural_entropy(self.__graph)
         exact_von_neumann = von_Neumann_entropy(self.__graph)
         entropy_gap = structural_entropy - exact_von_neumann
-        gap_lower_bound = sharpened_lower_bound(self.__graph)
-        gap_upper_bound = sharpened_upper_bound(self.__graph)
+        gap_lower_bound, gap_upper_bound = entropy_gap_bounds(self.__graph.vs.degree())
         
         logger.info(f"structural entropy: ({structural_entropy:8.7f}), von Neumann entropy: ({exact_von_neumann:8.7f}), entropy gap: ({entropy_gap:8.7f}), "
                     f"lower bound: ({gap_lower_bound:8.7f}), upper bound: ({gap_upper_bound:8.7f})")
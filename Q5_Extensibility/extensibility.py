@@ -1,8 +1,9 @@
-from igraph import Graph
 import logging.config
 import settings
 import numpy as np
 from scipy.linalg import eigh
+from utils.xlogx import xlogx
+from utils.graphIO import read_graph
 
 logging.config.dictConfig(settings.LOGGING_SETTINGS)
 logger = logging.getLogger('normal')
@@ -18,28 +19,13 @@ class ExtensibilityTest(object):
         self.__graph_path = graph_path
         self.__weight_range = weight_range
 
-    def __xlogx(self, x):
-        if x <= 10 ** (-8):
-            return 0
-        else:
-            return x * np.log2(x)
-
     def __compute_structural_information(self, laplacian_matrix):
-        structural_information = 0
         degree_sum = np.trace(laplacian_matrix)
-        for d in np.diagonal(laplacian_matrix):
-            structural_information -= self.__xlogx(d / degree_sum)
-
-        return structural_information
+        return -xlogx(np.diagonal(laplacian_matrix) / degree_sum).sum()
 
     def __compute_von_Neumann_entropy(self, laplacian_matrix):
-        von_Neumann_entropy = 0
         degree_sum = np.trace(laplacian_matrix)
-
-        for eigval in eigh(laplacian_matrix, eigvals_only=True):
-            von_Neumann_entropy -= self.__xlogx(eigval / degree_sum)
-
-        return von_Neumann_entropy
+        return -xlogx(eigh(laplacian_matrix, eigvals_only=True) / degree_sum).sum()
 
     def __start(self):
         logger.info("=" * 60)
@@ -56,7 +42,7 @@ class ExtensibilityTest(object):
         self.__start()
 
         for w in self.__weight_range:
-            g = Graph.Read_GML(self.__graph_path)
+            g = read_graph(self.__graph_path)
             g.es['weight'] = 1.0
             for e in g.get_edgelist():
                 g[e[0], e[1]] = np.random.uniform(1, w)
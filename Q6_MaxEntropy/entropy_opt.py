@@ -1,5 +1,3 @@
-from igraph import Graph
-from math import log
 from scipy.sparse.linalg import eigsh
 import numpy as np 
 import logging.config
@@ -9,6 +7,9 @@ import sys
 import random
 from utils.timer import time_mark
 from metrics.entropy import von_Neumann_entropy
+from metrics.entropy_bound import EntropyGapTracker
+from utils.xlogx import xlogx_table
+from utils.graphIO import read_graph
 
 logging.config.dictConfig(settings.LOGGING_SETTINGS)
 logger = logging.getLogger('normal')
@@ -32,7 +33,7 @@ class MaxEntropy(object):
         self.__ecount = None
         self.__vcount = None
         self.__sorted_degree_sequence = list()
-        self.__sum_dlogd = 0
+        self.__tracker = None
         self.__von_Neumann_entropy = None
         self.__structural_information = None
 
@@ -41,24 +42,17 @@ class MaxEntropy(object):
         self.__end_time = None
         self.__count = 1
 
-    def __xlogx(self, x):
-        if x <= 10 ** (-8):
-            return 0
-        else:
-            return x * log(x, 2)
-
     def __preprocess(self):
-        self.__graph = Graph.Read_GML(self.__graph_path)
+        self.__graph = read_graph(self.__graph_path)
         self.__ecount = self.__graph.ecount()
         self.__vcount = self.__graph.vcount()
         self.__sorted_degree_sequence = list(range(self.__vcount))
         self.__von_Neumann_entropy = von_Neumann_entropy(self.__graph)
+        self.__tracker = EntropyGapTracker(self.__graph.vs.degree())
+        self.__structural_information = self.__tracker.structural_information()
 
         if self.__method == 'greedy':
-            self.__sorted_degree_sequence.sort(key=lambda x: self.__graph.degree(x))
-            for deg in self.__graph.vs.degree():
-                self.__sum_dlogd += self.__xlogx(deg)
-            self.__structural_information = log(2 * self.__ecount, 2) - self.__sum_dlogd / (2 * self.__ecount)
+            self.__sorted_degree_sequence.sort(key=self.__tracker.degree)
 
     def __start(self):
         logger.info("=" * 60)
@@ -99,8 +93,7 @@ class MaxEntropy(object):
             u = random.choice(self.__sorted_degree_sequence)
             v = random.choice(self.__sorted_degree_sequence)
         
-        self.__graph.add_edge(u, v)
-        self.__ecount += 1
+        self.__add_edge(u, v)
 
     def __max_algebraic_connectivity(self):
         laplacian = self.__graph.laplacian(normalized=False)
@@ -129,7 +122,12 @@ class MaxEntropy(object):
                     threshold = delta
                     break
         
+        self.__add_edge(u, v)
+
+    def __add_edge(self, u, v):
         self.__graph.add_edge(u, v)
+        self.__tracker.add_edge(u, v)
+        self.__structural_information = self.__tracker.structural_information()
         self.__ecount += 1
 
     def __greedy(self):
@@ -137,10 +135,10 @@ class MaxEntropy(object):
         threshold = sys.maxsize
 
         while head < tail:
-            d_head = self.__graph.degree(self.__sorted_degree_sequence[head])
+            d_head = self.__tracker.degree(self.__sorted_degree_sequence[head])
             for i in range(head+1, tail+1):
-                d_i = self.__graph.degree(self.__sorted_degree_sequence[i])
-                delta = self.__xlogx(d_head + 1) - self.__xlogx(d_head) + self.__xlogx(d_i + 1) - self.__xlogx(d_i)
+                d_i = self.__tracker.degree(self.__sorted_degree_sequence[i])
+                delta = xlogx_table[d_head + 1] - xlogx_table[d_head] + xlogx_table[d_i + 1] - xlogx_table[d_i]
                 if delta >= threshold:
                     tail = i - 1
                     break
@@ -152,22 +150,19 @@ class MaxEntropy(object):
                     break
             head += 1
         
-        new_structural_information = log(2 * self.__ecount + 2, 2) - (self.__sum_dlogd + threshold) / (2 * self.__ecount + 2)
         if np.abs(self.__structural_information - np.log2(self.__vcount)) <= 1e-9:
             self.__should_stop = True
         else:
-            self.__structural_information = new_structural_information
-            self.__sum_dlogd += threshold
-            self.__ecount += 1
-            self.__graph.add_edge(u, v)
-            self.__sorted_degree_sequence.sort(key=lambda x: self.__graph.degree(x))
+            self.__add_edge(u, v)
+            self.__sorted_degree_sequence.sort(key=self.__tracker.degree)
 
     def __analyze(self):
         self.__von_Neumann_entropy = von_Neumann_entropy(self.__graph)
+        bounds = f'lower bound: ({self.__tracker.lower_bound():8.7f}), upper bound: ({self.__tracker.upper_bound():8.7f})'
         if self.__method == 'greedy':
-            logger.info(f'structural information: ({self.__structural_information:8.7f}), von Neumann entropy: ({self.__von_Neumann_entropy:8.7f})')
+            logger.info(f'structural information: ({self.__structural_information:8.7f}), von Neumann entropy: ({self.__von_Neumann_entropy:8.7f}), {bounds}')
         else:
-            logger.info(f'von Neumann entropy: ({self.__von_Neumann_entropy:8.7f})')
+            logger.info(f'von Neumann entropy: ({self.__von_Neumann_entropy:8.7f}), {bounds}')
 
     def __tiktok(self):
         current_time = time.time() - self.__start_time
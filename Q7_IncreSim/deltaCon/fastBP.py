@@ -1,6 +1,7 @@
 import numpy as np
 from scipy.sparse import identity
 from scipy.sparse import diags
+from utils.spmm import spmm
 
 def fastBeliefPropagation(A, y):
     """A fast power method used to solve the equation (I+aD-cA)x=y
@@ -37,7 +38,7 @@ def fastBeliefPropagation(A, y):
         return x
 
     for i in range(10):
-        delta_x = W.dot(delta_x)
+        delta_x = spmm(W, delta_x)
         x += delta_x
     
     return x
\ No newline at end of file
@@ -1,9 +1,9 @@
 import numpy as np
 from collections import defaultdict
 from utils.graphIO import read_edgelist
-from utils.graphInfo import get_edgeinfo
+from utils.graphMatrix import get_edge_array
+from utils.graphMatrix import adjacency_from_edges
 from Q7_IncreSim.deltaCon.DeltaCon import deltaCon
-from scipy.sparse import csr_matrix
 import logging.config
 import settings
 
@@ -31,19 +31,9 @@ class GraphSimilarity(object):
         self.__similarity = np.zeros(len(self.__filepath_list) - 1)
 
     def __get_adjacency_sparse(self, g):
-        data = np.zeros(2 * g.ecount(), dtype=np.float64)
-        row = np.zeros(2 * g.ecount(), dtype=int)
-        col = np.zeros(2 * g.ecount(), dtype=int)
-        for idx, e in enumerate(g.get_edgelist()):
-            u, v, w = get_edgeinfo(g, e[0], e[1])
-            data[2 * idx] = w
-            row[2 * idx] = self.__node_indices[u]
-            col[2 * idx] = self.__node_indices[v]
-            data[2 * idx + 1] = w
-            row[2 * idx + 1] = self.__node_indices[v]
-            col[2 * idx + 1] = self.__node_indices[u]
-        
-        adjacency_matrix_sparse = csr_matrix((data, (row, col)), shape=(self.__vcount, self.__vcount), dtype=np.float64)
+        indices = np.array([self.__node_indices[name] for name in g.vs['name']], dtype=np.int64)
+        edges = indices[get_edge_array(g)]
+        adjacency_matrix_sparse = adjacency_from_edges(edges, self.__vcount, g.es['weight'])
         return adjacency_matrix_sparse
 
     def __preprocess(self):
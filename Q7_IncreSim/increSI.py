@@ -1,6 +1,6 @@
 import numpy as np
-from utils.graphIO import read_edgelist
-from utils.graphInfo import get_volume
+from utils.graphIO import read_shards
+from utils.xlogx import xlogx_scalar
 import logging.config
 import settings
 
@@ -14,43 +14,40 @@ class GraphSimilarity(object):
     Arguments:
         filepath_list (List[string]): a list of filepath for the edges
         head_name_list (List[str]): a list of string specifying the names of each data column
+        workers (int): the number of worker processes reading the edge files
 
     Returns:
         similarity_list (List[float]): a list of scores 
     """
-    def __init__(self, filepath_list, head_name_list=['from', 'to', 'weight']):
+    def __init__(self, filepath_list, head_name_list=['from', 'to', 'weight'], workers=1):
         self.__filepath_list = filepath_list
         self.__head_name_list = head_name_list
+        self.__workers = workers
 
+        self.__shards = None
         self.__degree_dict = dict()
         self.__volume = None
         self.__si = None
         self.__similarity = np.zeros(len(self.__filepath_list) - 1)
 
-    def __xlog2x(self, x):
-        if x <= 1e-8:
-            return 0
-        else:
-            return x * np.log2(x)
-
     def __preprocess(self):
-        g = read_edgelist(self.__filepath_list[0], self.__head_name_list)
-        self.__volume = get_volume(g)
-        for i in range(g.vcount()):
-            self.__degree_dict[g.vs[i]['name']] = g.strength(i, weights='weight')
+        # only the strengths of each snapshot are needed, so all files are parsed up front, in parallel, without building graphs
+        self.__shards = read_shards(self.__filepath_list, self.__head_name_list, workers=self.__workers)
+        strengths, _, labels = self.__shards[0]
+        self.__volume = strengths.sum()
+        self.__degree_dict = dict(zip(labels, strengths.tolist()))
 
         si = 0
         for d in self.__degree_dict.values():
-            si -= self.__xlog2x(d)
+            si -= xlogx_scalar(d)
         si /= self.__volume
         si += np.log2(self.__volume)
         self.__si = si
 
-    def __increSim(self, g):
-        g_volume = 2 * np.array(g.es['weight']).sum()
-        g_degree_dict = dict()
-        for i in range(g.vcount()):
-            g_degree_dict[g.vs[i]['name']] = g.strength(i, weights='weight')
+    def __increSim(self, shard):
+        strengths, _, labels = shard
+        g_volume = strengths.sum()
+        g_degree_dict = dict(zip(labels, strengths.tolist()))
         
         c = (self.__volume + g_volume / 2) / (self.__volume * (self.__volume + g_volume))
         a, b, y, z = 0, 0, 0, 0
@@ -58,13 +55,13 @@ class GraphSimilarity(object):
             g_deg = g_degree_dict[v]
             deg = self.__degree_dict[v] if v in self.__degree_dict else 0
 
-            a += self.__xlog2x(deg + g_deg) - self.__xlog2x(deg)
-            b += self.__xlog2x(deg / (2 * self.__volume) + (deg + g_deg) / (2 * (self.__volume + g_volume)))
+            a += xlogx_scalar(deg + g_deg) - xlogx_scalar(deg)
+            b += xlogx_scalar(deg / (2 * self.__volume) + (deg + g_deg) / (2 * (self.__volume + g_volume)))
             y += deg
-            z += self.__xlog2x(deg)
+            z += xlogx_scalar(deg)
         
-        new_si = (self.__xlog2x(self.__volume + g_volume) - a - self.__xlog2x(self.__volume) + self.__volume * self.__si) / (self.__volume + g_volume)
-        average_si = -b - (self.__volume - y) * self.__xlog2x(c) - c * (self.__xlog2x(self.__volume)- self.__volume * self.__si - z)
+        new_si = (xlogx_scalar(self.__volume + g_volume) - a - xlogx_scalar(self.__volume) + self.__volume * self.__si) / (self.__volume + g_volume)
+        average_si = -b - (self.__volume - y) * xlogx_scalar(c) - c * (xlogx_scalar(self.__volume)- self.__volume * self.__si - z)
         similarity = np.sqrt(average_si - (new_si + self.__si) / 2)
 
         self.__volume += g_volume
@@ -84,8 +81,7 @@ class GraphSimilarity(object):
         self.__preprocess()
 
         for i in range(len(self.__filepath_list) - 1):
-            g = read_edgelist(self.__filepath_list[i + 1], self.__head_name_list)
-            self.__similarity[i] = self.__increSim(g)
+            self.__similarity[i] = self.__increSim(self.__shards[i + 1])
             logger.info(f'({self.__similarity[i]:8.7f})')
         
         logger.info("=" * 60)
@@ -6,6 +6,7 @@ from Q8_AnomalyDetection.distance_measure import *
 import matplotlib.pyplot as plt
 import logging.config
 import settings
+from utils.graphIO import read_graph
 
 logging.config.dictConfig(settings.LOGGING_SETTINGS)
 logger = logging.getLogger('normal')
@@ -31,10 +32,10 @@ class AnomalyDetection4BAGraph(object):
 
     def __preprocess(self):
         for i in range(self.__num_graph):
-            self.__graph_stream[i] = Graph.Read_GML(f'datasets/synthetic/anomaly-BA-{i}.gml')
+            self.__graph_stream[i] = read_graph(f'datasets/synthetic/anomaly-BA-{i}.gml')
 
     def __generate_anomalous_graph(self, idx):
-        anomalous_graph = Graph.Read_GML(f'datasets/synthetic/anomaly-BA-{idx}.gml')
+        anomalous_graph = read_graph(f'datasets/synthetic/anomaly-BA-{idx}.gml')
 
         N = anomalous_graph.vcount()
         anomalous_source = np.random.choice(N)
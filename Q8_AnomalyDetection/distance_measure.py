@@ -1,90 +1,59 @@
 import numpy as np 
 from igraph import Graph
-from scipy.sparse import csr_matrix
 from Q7_IncreSim.deltaCon.DeltaCon import deltaCon
-from scipy.sparse import csgraph
-from scipy.sparse.linalg import eigsh
-
-def von_Neumann_distance(G1, G2):
-    A1 = __get_adjacency_sparse(G1)
-    A2 = __get_adjacency_sparse(G2)
-    L1 = csgraph.laplacian(A1, normed=False)
-    L2 = csgraph.laplacian(A2, normed=False)
-
-    L = L1 / L1.diagonal().sum() + L2 / L2.diagonal().sum()
-
-    S1 = __von_Neumann_entropy(L1)
-    S2 = __von_Neumann_entropy(L2)
-    S12 = __von_Neumann_entropy(L)
+from utils.graphMatrix import get_adjacency
+from utils.graphMatrix import get_laplacian_operator
+from utils.graphMatrix import get_array_graph
+from utils.graphMatrix import get_degree_sequence
+from utils.graphMatrix import get_ecount
+from utils.graphMatrix import get_vcount
+from utils.graphMatrix import LaplacianOperator
+from metrics.spectrum import laplacian_spectrum
+from utils.xlogx import xlogx
+
+def von_Neumann_distance(G1, G2, backend='auto', workers=1):
+    # 'backend' and 'workers' select the exact spectrum solver, see 'metrics.spectrum.laplacian_spectrum'
+    L1 = get_laplacian_operator(G1, 'density')
+    L2 = get_laplacian_operator(G2, 'density')
+
+    # L1 / tr(L1) + L2 / tr(L2) is the Laplacian of the adjacency matrix A1 / tr(L1) + A2 / tr(L2)
+    L = LaplacianOperator(L1.factor * L1.adjacency + L2.factor * L2.adjacency)
+
+    S1 = __von_Neumann_entropy(L1, backend, workers)
+    S2 = __von_Neumann_entropy(L2, backend, workers)
+    S12 = __von_Neumann_entropy(L, backend, workers)
 
     return np.sqrt(S12 - (S1 + S2) / 2)
 
 def delta_con(G1, G2):
-    A1 = __get_adjacency_sparse(G1)
-    A2 = __get_adjacency_sparse(G2)
+    A1 = get_adjacency(G1)
+    A2 = get_adjacency(G2)
 
     return 1 - deltaCon(A1, A2, 30)
 
 def veo_score(G1, G2):
-    N, M1, M2 = G1.vcount(), G1.ecount(), G2.ecount()
+    N, M1, M2 = get_vcount(G1), get_ecount(G1), get_ecount(G2)
 
-    M12 = 0
-    for e in G1.get_edgelist():
-        if G2.are_connected(e[0], e[1]):
-            M12 += 1
+    # the edges of G1 are looked up in the sorted edge keys of G2 at once
+    edges = get_array_graph(G1).edges()
+    M12 = int(get_array_graph(G2).has_edges(edges[:, 0], edges[:, 1]).sum())
 
     return 1 - 2 * (N + M12) / (2 * N + M1 + M2)
 
 def structural_information_distance(G1, G2):
-    N = G1.vcount()
-    degree_seq1 = np.array(G1.degree())
-    degree_seq2 = np.array(G2.degree())
+    degree_seq1 = get_degree_sequence(G1)
+    degree_seq2 = get_degree_sequence(G2)
     vol1 = degree_seq1.sum()
     vol2 = degree_seq2.sum()
 
-    S1 = 0
-    for deg in degree_seq1:
-        S1 -= __xlog2x(deg / vol1)
-
-    S2 = 0
-    for deg in degree_seq2:
-        S2 -= __xlog2x(deg / vol2)
-
-    S12 = 0
-    for i in range(N):
-        deg1 = degree_seq1[i]
-        deg2 = degree_seq2[i]
-        S12 -= __xlog2x(deg1 / (2 * vol1) + deg2 / (2 * vol2))
+    S1 = -xlogx(degree_seq1 / vol1).sum()
+    S2 = -xlogx(degree_seq2 / vol2).sum()
+    S12 = -xlogx(degree_seq1 / (2 * vol1) + degree_seq2 / (2 * vol2)).sum()
 
     return np.sqrt(S12 - (S1 + S2) / 2)
 
-def __xlog2x(x):
-    if x <= 1e-9:
-        return 0
-    else:
-        return x * np.log2(x)
-
-def __get_adjacency_sparse(g):
-    N, M = g.vcount(), g.ecount()
-    data = np.zeros(2 * M, dtype=np.float64)
-    row = np.zeros(2 * M, dtype=int)
-    col = np.zeros(2 * M, dtype=int)
-    for idx, e in enumerate(g.get_edgelist()):
-        data[2 * idx] = 1
-        row[2 * idx] = e[0]
-        col[2 * idx] = e[1]
-        data[2 * idx + 1] = 1
-        row[2 * idx + 1] = e[1]
-        col[2 * idx + 1] = e[0]
-    adjacency_matrix_sparse = csr_matrix((data, (row, col)), shape=(N, N), dtype=np.float64)
-    return adjacency_matrix_sparse
-
-def __von_Neumann_entropy(L):
-    eigenvalues = eigsh(L, L.shape[0] - 1, return_eigenvectors=False)
+def __von_Neumann_entropy(L, backend='auto', workers=1):
+    eigenvalues = laplacian_spectrum(L, backend, workers=workers)
     eigsum = eigenvalues.sum()
 
-    entropy = 0
-    for eigval in eigenvalues:
-        entropy -= __xlog2x(eigval / eigsum)
-
-    return entropy
\ No newline at end of file
+    return -xlogx(eigenvalues / eigsum).sum()
\ No newline at end of file
@@ -0,0 +1,65 @@
+from igraph import Graph
+import numpy as np
+import time
+import random
+import logging.config
+import settings
+from utils.graphMatrix import matrix_cache
+from metrics.finger.finger import finger_hat_entropy
+from metrics.finger.finger import FingerEvaluator
+
+logging.config.dictConfig(settings.LOGGING_SETTINGS)
+logger = logging.getLogger('console')
+
+class FingerStreamBenchmark(object):
+    """Compare the incremental FINGER evaluator with recomputing FINGER-hat from scratch on a stream of random edge insertions.
+
+    Arguments:
+        graph_path (str): the filepath of the initial graph
+        steps (int): the number of evaluations
+        edges_per_step (int): the number of edges inserted between evaluations
+        methods (List[str]): the eigensolvers of the evaluator
+    """
+    def __init__(self, graph_path, steps=50, edges_per_step=10, methods=['power', 'lobpcg', 'arpack']):
+        self.__graph_path = graph_path
+        self.__steps = steps
+        self.__edges_per_step = edges_per_step
+        self.__methods = methods
+
+    def __stream(self, vcount):
+        return [[(random.randrange(vcount), random.randrange(vcount)) for _ in range(self.__edges_per_step)] for _ in range(self.__steps)]
+
+    def run(self):
+        graph = Graph.Read_GML(self.__graph_path)
+        stream = self.__stream(graph.vcount())
+        logger.info("=" * 60)
+        logger.info(f'Benchmark: FINGER on a stream of {self.__steps} x {self.__edges_per_step} edges on {self.__graph_path}')
+        logger.info("=" * 60)
+
+        g = graph.copy()
+        reference = np.zeros(self.__steps)
+        start = time.perf_counter()
+        for i, edges in enumerate(stream):
+            g.add_edges(edges)
+            matrix_cache.invalidate(g)
+            reference[i] = finger_hat_entropy(g)
+        scratch_time = (time.perf_counter() - start) / self.__steps
+        logger.info(f'From scratch | {scratch_time * 1000:8.2f} ms per step')
+
+        for method in self.__methods:
+            evaluator = FingerEvaluator(graph, method)
+            evaluator.hat_entropy()
+            values = np.zeros(self.__steps)
+            start = time.perf_counter()
+            for i, edges in enumerate(stream):
+                for u, v in edges:
+                    evaluator.add_edge(u, v)
+                values[i] = evaluator.hat_entropy()
+            elapsed = (time.perf_counter() - start) / self.__steps
+            logger.info(f'{method:>12s} | {elapsed * 1000:8.2f} ms per step ({scratch_time / elapsed:5.1f}x) | '
+                        f'max difference: {np.abs(values - reference).max():.2e}')
+        logger.info("=" * 60)
+
+
+if __name__ == "__main__":
+    FingerStreamBenchmark('datasets/caida.gml').run()
@@ -0,0 +1,50 @@
+from igraph import Graph
+import numpy as np
+import time
+import logging.config
+import settings
+from metrics.slaq import slaq
+
+logging.config.dictConfig(settings.LOGGING_SETTINGS)
+logger = logging.getLogger('console')
+
+class NetLSDBatchBenchmark(object):
+    """Measure the throughput in graphs per second of batched NetLSD against one slaq.netlsd call per graph.
+
+    Arguments:
+        ngraphs (int): the number of random graphs
+        nrange (Tuple[int, int]): the range of the number of vertices of the random graphs
+        m (int): the number of edges attached by each new vertex of the Barabasi-Albert graphs
+        batch_sizes (List[int]): the numbers of graphs stacked at once, None for the default of netlsd_batch
+        nvectors (int): the number of random vectors per graph
+    """
+    def __init__(self, ngraphs=1000, nrange=(10, 100), m=3, batch_sizes=[None, 64, 256], nvectors=100):
+        self.__ngraphs = ngraphs
+        self.__nrange = nrange
+        self.__m = m
+        self.__batch_sizes = batch_sizes
+        self.__nvectors = nvectors
+
+    def run(self):
+        sizes = np.random.randint(self.__nrange[0], self.__nrange[1], size=self.__ngraphs)
+        graphs = [Graph.Barabasi(int(n), self.__m) for n in sizes]
+        logger.info("=" * 60)
+        logger.info(f'Benchmark: NetLSD of {self.__ngraphs} graphs with {self.__nrange[0]}-{self.__nrange[1]} vertices')
+        logger.info("=" * 60)
+
+        start = time.perf_counter()
+        reference = np.array([slaq.netlsd(graph, nvectors=self.__nvectors) for graph in graphs])
+        elapsed = time.perf_counter() - start
+        logger.info(f'Loop         | {self.__ngraphs / elapsed:8.1f} graphs/s')
+
+        for batch_size in self.__batch_sizes:
+            start = time.perf_counter()
+            signatures = slaq.netlsd_batch(graphs, nvectors=self.__nvectors, batch_size=batch_size)
+            elapsed = time.perf_counter() - start
+            error = np.median(np.abs(signatures - reference).max(axis=1) / reference.max(axis=1))
+            logger.info(f'Batch {str(batch_size):>6s} | {self.__ngraphs / elapsed:8.1f} graphs/s | median relative difference to the loop: {error:.4f}')
+        logger.info("=" * 60)
+
+
+if __name__ == "__main__":
+    NetLSDBatchBenchmark().run()
@@ -0,0 +1,59 @@
+from igraph import Graph
+import numpy as np
+import time
+import logging.config
+import settings
+from utils import spmm
+from utils.graphMatrix import get_adjacency
+from metrics.slaq import slaq
+
+logging.config.dictConfig(settings.LOGGING_SETTINGS)
+logger = logging.getLogger('console')
+
+class SpMMBenchmark(object):
+    """Measure the scaling of the threaded sparse x dense-block product and of SLaQ with the number of threads.
+
+    Arguments:
+        graph_path (str): the filepath of the graph
+        threads_range (List[int]): the thread counts
+        nvectors (int): the number of vectors in the dense block, as in SLaQ
+        repeat (int): the number of timed repetitions, the best one is reported
+    """
+    def __init__(self, graph_path, threads_range, nvectors=100, repeat=5):
+        self.__graph_path = graph_path
+        self.__threads_range = threads_range
+        self.__nvectors = nvectors
+        self.__repeat = repeat
+
+    def __best_time(self, func):
+        best = np.inf
+        for _ in range(self.__repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def run(self):
+        graph = Graph.Read_GML(self.__graph_path)
+        adjacency = get_adjacency(graph, dtype=np.float32)
+        vectors = np.random.randn(adjacency.shape[0], self.__nvectors).astype(np.float32)
+        default_threads = spmm.get_num_threads()
+
+        logger.info("=" * 60)
+        logger.info(f'Benchmark: threaded SpMM on {self.__graph_path} (n = {graph.vcount()}, nnz = {adjacency.nnz}, k = {self.__nvectors})')
+        logger.info("=" * 60)
+        base_spmm, base_slaq = None, None
+        for num_threads in self.__threads_range:
+            spmm.set_num_threads(num_threads)
+            time_spmm = self.__best_time(lambda: spmm.spmm(adjacency, vectors))
+            time_slaq = self.__best_time(lambda: slaq.vnge(graph, nvectors=self.__nvectors))
+            if base_spmm is None:
+                base_spmm, base_slaq = time_spmm, time_slaq
+            logger.info(f'Threads: {num_threads:>3d} | SpMM: {time_spmm * 1000:8.2f} ms ({base_spmm / time_spmm:5.2f}x) | '
+                        f'SLaQ VNGE: {time_slaq:6.3f} s ({base_slaq / time_slaq:5.2f}x)')
+        logger.info("=" * 60)
+        spmm.set_num_threads(default_threads)
+
+
+if __name__ == "__main__":
+    SpMMBenchmark('datasets/caida.gml', [1, 2, 4, 8, 16, 32]).run()
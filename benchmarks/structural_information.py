@@ -0,0 +1,78 @@
+from igraph import Graph
+from math import log
+import numpy as np 
+import logging.config
+import settings
+import time
+from metrics.entropy import structural_information
+
+logging.config.dictConfig(settings.LOGGING_SETTINGS)
+logger = logging.getLogger('console')
+
+def loop_structural_information(degree_seq):
+    # the per-vertex Python loop used before the vectorized kernel, kept as the reference
+    vol = sum(degree_seq)
+    entropy = 0
+    for deg in degree_seq:
+        x = deg / vol
+        if x > 10 ** (-8):
+            entropy -= x * log(x, 2)
+    return entropy
+
+class StructuralInformationBenchmark(object):
+    """Compare the throughput (vertices per second) of the vectorized structural information kernel
+       against the per-vertex Python loop on Barabasi Albert degree sequences.
+
+    Arguments:
+        nrange (List[int]): the number of nodes of each graph
+        m (int): the number of outgoing edges generated for each vertex
+        batch_size (int): the number of graphs evaluated together in the batched mode
+        repeat (int): the number of repetitions for each timing
+    """
+    def __init__(self, nrange, m=5, batch_size=100, repeat=3):
+        self.__nrange = nrange
+        self.__out_degree = m
+        self.__batch_size = batch_size
+        self.__repeat = repeat
+
+    def __timeit(self, func, *args, **kwargs):
+        best = np.inf
+        for _ in range(self.__repeat):
+            tik = time.perf_counter()
+            func(*args, **kwargs)
+            tok = time.perf_counter()
+            best = min(best, tok - tik)
+        return best
+
+    def __single(self, n):
+        degree_seq = Graph.Barabasi(n, self.__out_degree).degree()
+        degree_array = np.array(degree_seq, dtype=np.float64)
+
+        time_loop = self.__timeit(loop_structural_information, degree_seq)
+        time_kernel = self.__timeit(structural_information, degree_array)
+        logger.info(f'n: {n:>9d}, loop: ({n / time_loop:14.1f}) vertices/s, kernel: ({n / time_kernel:14.1f}) vertices/s, '
+                    f'speedup: ({time_loop / time_kernel:8.2f})')
+
+    def __batch(self, n):
+        degree_seqs = [Graph.Barabasi(n, self.__out_degree).degree() for _ in range(self.__batch_size)]
+        degree_arrays = [np.array(seq, dtype=np.float64) for seq in degree_seqs]
+        total = n * self.__batch_size
+
+        time_loop = self.__timeit(lambda: [loop_structural_information(seq) for seq in degree_seqs])
+        time_kernel = self.__timeit(structural_information, degree_arrays)
+        logger.info(f'batch of {self.__batch_size} x {n}: loop: ({total / time_loop:14.1f}) vertices/s, kernel: ({total / time_kernel:14.1f}) vertices/s, '
+                    f'speedup: ({time_loop / time_kernel:8.2f})')
+
+    def run(self):
+        logger.info("=" * 60)
+        logger.info('Benchmark: structural information throughput')
+        logger.info("=" * 60)
+        for n in self.__nrange:
+            self.__single(n)
+        for n in self.__nrange[:2]:
+            self.__batch(n)
+        logger.info("=" * 60)
+
+
+if __name__ == "__main__":
+    StructuralInformationBenchmark([1000, 10000, 100000, 1000000]).run()
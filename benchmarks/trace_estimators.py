@@ -0,0 +1,80 @@
+from igraph import Graph
+import numpy as np 
+import logging.config
+import settings
+from metrics.entropy import von_Neumann_entropy
+from metrics.slaq.slaq import _vnge_density
+from metrics.slaq.parallel import _entropy_function
+from metrics.slaq.parallel import _identity
+from metrics.slaq.slq import slq
+from metrics.slaq.slq import hutchpp_slq
+
+logging.config.dictConfig(settings.LOGGING_SETTINGS)
+logger = logging.getLogger('console')
+
+VNGE_FUNCTIONS = [_entropy_function, _identity]
+
+class TraceEstimatorBenchmark(object):
+    """Compare the matrix-vector products needed by SLQ and Hutch++ to reach a given accuracy of the VNGE.
+
+    The reference is the exact von Neumann entropy when it fits in memory, otherwise an SLQ estimate
+    with 'reference_vectors' random vectors.
+
+    Arguments:
+        graph_path_list (List[str]): the filepaths of the graphs
+        nvectors_range (List[int]): the vector budgets, both estimators use about nvectors * lanczos_steps matrix-vector products
+        runs (int): the number of independent estimates for each budget
+        lanczos_steps (int): the number of Lanczos steps
+        reference_vectors (int): the number of random vectors of the reference estimate
+    """
+    def __init__(self, graph_path_list, nvectors_range, runs=20, lanczos_steps=10, reference_vectors=4000):
+        self.__graph_path_list = graph_path_list
+        self.__nvectors_range = nvectors_range
+        self.__runs = runs
+        self.__lanczos_steps = lanczos_steps
+        self.__reference_vectors = reference_vectors
+
+    def __entropy(self, traces):
+        traces = traces.ravel()
+        return (traces[0] - traces[1] + 1) / np.log(2)
+
+    def __reference(self, graph, density):
+        try:
+            return von_Neumann_entropy(graph), 'exact'
+        except MemoryError:
+            traces = slq(density, self.__lanczos_steps, self.__reference_vectors, VNGE_FUNCTIONS, chunk_size=100, reorthogonalize=False)
+            return self.__entropy(traces), f'SLQ with {self.__reference_vectors} vectors'
+
+    def __compare(self, graph_path):
+        graph = Graph.Read_GML(graph_path)
+        density = _vnge_density(graph)
+        reference, kind = self.__reference(graph, density)
+        logger.info(f'Graph: {graph_path}, reference ({kind}): ({reference:8.7f})')
+
+        for nvectors in self.__nvectors_range:
+            # the range finder and its subspace iteration are paid from the same budget of nvectors * lanczos_steps matvecs
+            sketch_size = nvectors // 4
+            residual_vectors = max(1, nvectors - sketch_size - -(-2 * sketch_size // self.__lanczos_steps))
+            errors_slq = np.zeros(self.__runs)
+            errors_hutchpp = np.zeros(self.__runs)
+            for i in range(self.__runs):
+                errors_slq[i] = self.__entropy(slq(density, self.__lanczos_steps, nvectors, VNGE_FUNCTIONS)) - reference
+                traces, matvecs = hutchpp_slq(density, self.__lanczos_steps, residual_vectors, VNGE_FUNCTIONS, sketch_size=sketch_size)
+                errors_hutchpp[i] = self.__entropy(traces) - reference
+            rmse_slq = np.sqrt(np.mean(errors_slq ** 2))
+            rmse_hutchpp = np.sqrt(np.mean(errors_hutchpp ** 2))
+            logger.info(f'SLQ matvecs: {nvectors * self.__lanczos_steps:>6d}, RMSE: ({rmse_slq:8.7f}) | '
+                        f'Hutch++ matvecs: {matvecs:>6d}, RMSE: ({rmse_hutchpp:8.7f})')
+
+    def run(self):
+        logger.info("=" * 60)
+        logger.info('Benchmark: matvecs to accuracy of SLQ and Hutch++')
+        logger.info("=" * 60)
+        for graph_path in self.__graph_path_list:
+            self.__compare(graph_path)
+        logger.info("=" * 60)
+
+
+if __name__ == "__main__":
+    TraceEstimatorBenchmark(['datasets/zachary.gml', 'datasets/dolphins.gml', 'datasets/jazz.gml', 'datasets/caida.gml'],
+                            [8, 20, 40, 100, 200]).run()
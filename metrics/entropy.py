@@ -1,53 +1,125 @@
-from math import log
+from collections import namedtuple
 import numpy as np 
-from scipy.sparse import csr_matrix
-from scipy.sparse import csgraph
-from scipy.sparse.linalg import eigsh
-
-def __xlogx(x):
-    epsilon = 10 ** (-8)
-    if x <= epsilon:
-        return 0
-    else:
-        return x * log(x, 2)
-
-def __get_adjacency_sparse(graph):
-    # return the adjacency matrix of input graph in sparse matrix form
-    # 'Graph.get_adjacency_sparse()' has some bug dealing with undirected graph in igraph version 0.8.0
-    edges = graph.get_edgelist()
-    weights = [1] * len(edges)
-    N = graph.vcount()
-    sparse_matrix = csr_matrix((weights, list(zip(*edges))), shape=(N, N), dtype=np.float64)
-    sparse_matrix = sparse_matrix + sparse_matrix.T 
-    di = np.diag_indices(N)
-    sparse_matrix[di] /= 2
-    return sparse_matrix
-
-def one_dimensional_structural_entropy(graph):
-    degree_seq = graph.vs.degree()
-    vol = sum(degree_seq)
-
-    entropy = 0
-    for deg in degree_seq:
-        entropy -= __xlogx(deg / vol)
+import scipy.sparse
+from utils.graphMatrix import get_laplacian_operator
+from utils.graphMatrix import get_degree_sequence
+from utils.graphMatrix import get_membership
+from metrics.spectrum import laplacian_spectrum
+from metrics.spectrum import component_spectrum
+from metrics.slaq import slaq
+from metrics.entropy_bound import entropy_gap_bounds
+from utils.resultCache import memoize
+from utils.xlogx import xlogx
+from utils.graphIO import read_strengths
+from utils.graphIO import read_shards
+from utils.graphIO import merge_strengths
+
+# The structural information of an edgelist with its volume and the entropy-gap bounds of its unweighted degrees.
+# The degrees count every line of the edgelist, so the bounds are those of the multigraph: an edge listed twice
+# counts twice, while read_edgelist merges it into one edge, e.g. on temporal-fb/fb-0.txt the lower bound is
+# 6.10e-4 for the edgelist and 7.07e-4 for the simplified graph of read_edgelist.
+EdgelistEntropy = namedtuple('EdgelistEntropy', ['structural_information', 'volume', 'lower_bound', 'upper_bound'])
+
+def structural_information(degrees, offsets=None):
+    """Compute the structural information of one or many degree sequences in a single vectorized pass.
+
+    Arguments:
+        degrees (np.ndarray or List[np.ndarray]): a degree (or strength) sequence, a list of
+            degree sequences, or several sequences concatenated into one flat array
+        offsets (np.ndarray): the start index of each sequence in the flat 'degrees' array,
+            only used in the concatenated form
+
+    Returns:
+        entropy (float or np.ndarray): the structural information of a single sequence,
+            or an array with one value per sequence in the batched forms
+    """
+    if isinstance(degrees, (list, tuple)) and offsets is None and len(degrees) > 0 and np.ndim(degrees[0]) == 1:
+        lengths = np.array([len(seq) for seq in degrees], dtype=np.int64)
+        degrees = np.concatenate(degrees)
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    degrees = np.asarray(degrees, dtype=np.float64)
+
+    if offsets is None:
+        vol = degrees.sum()
+        if vol <= 0:
+            return 0.0
+        return -xlogx(degrees / vol).sum()
+
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(np.append(offsets, len(degrees)))
+    entropy = np.zeros(len(offsets), dtype=np.float64)
+    nonempty = lengths > 0 # 'np.add.reduceat' does not handle empty segments
+    starts, lengths = offsets[nonempty], lengths[nonempty]
+    if len(starts) == 0:
+        return entropy
+    vol = np.add.reduceat(degrees, starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = degrees[starts[0]:] / np.repeat(vol, lengths)
+    entropy[nonempty] = -np.add.reduceat(xlogx(p), starts - starts[0])
     return entropy
 
-def von_Neumann_entropy(graph, mode='laplacian'):
-    # compute the exact von Neumann entropy for small size graphs
-    adjacency = __get_adjacency_sparse(graph)
+def one_dimensional_structural_entropy(graph, weights=None):
+    # an adjacency matrix, e.g. from 'utils.graphIO.read_csr', is used as given and 'weights' is ignored
+    if weights is None or scipy.sparse.issparse(graph):
+        degree_seq = get_degree_sequence(graph)
+    else:
+        degree_seq = graph.strength(weights=weights)
+    return structural_information(degree_seq)
+
+def edgelist_structural_information(filepath, heads=['from', 'to', 'weight'], chunk_size=1 << 22, workers=1, integer_labels=False):
+    """Compute the structural information of an edgelist too large to be loaded as a graph.
+
+    The file is streamed in chunks by 'utils.graphIO.read_strengths', and only the strength and degree vectors are kept.
+    An edgelist split across several files is read shard by shard over 'workers' processes and the partial vectors
+    are merged by 'utils.graphIO.merge_strengths'.
+
+    Arguments:
+        filepath (str or List[str]): filepath of the edgelist, or the filepaths of its shards
+        heads (List[str]): titles of the leading columns, without 'weight' every edge has weight 1
+        chunk_size (int): the number of lines read at once
+        workers (int): the number of worker processes reading the shards
+        integer_labels (bool): parse the vertex labels as int64, several times faster for numeric edgelists
+
+    Returns:
+        entropy (EdgelistEntropy): the structural information and volume of the weighted graph,
+            and the sharpened entropy-gap bounds of its unweighted degree sequence
+    """
+    if isinstance(filepath, str):
+        strengths, degrees, _ = read_strengths(filepath, heads, chunk_size, integer_labels)
+    else:
+        strengths, degrees, _ = merge_strengths(read_shards(filepath, heads, chunk_size, workers, integer_labels))
+    lower_bound, upper_bound = entropy_gap_bounds(degrees)
+    return EdgelistEntropy(float(structural_information(strengths)), float(strengths.sum()), lower_bound, upper_bound)
+
+def von_Neumann_entropy(graph, mode='laplacian', backend='auto', max_memory=None, fallback=None, components=False, workers=1):
+    # compute the exact von Neumann entropy, see 'metrics.spectrum.laplacian_spectrum' for the backends
+    # if fallback is 'slaq', graphs whose dense Laplacian does not fit in memory are estimated by SLaQ instead
+    # if components is True, the spectrum is assembled from the connected components over 'workers' processes,
+    # see 'metrics.spectrum.component_spectrum', and only the largest component has to fit in memory
+    try:
+        return _exact_von_Neumann_entropy(graph, mode, backend, max_memory, components, workers)
+    except MemoryError:
+        # the randomized estimate is returned outside the cached exact computation, so it is never stored as exact
+        if fallback == 'slaq' and mode in ('laplacian', 'Laplacian'):
+            return slaq.vnge(graph)
+        raise
+
+@memoize('von_Neumann_entropy', ignore=('workers',))
+def _exact_von_Neumann_entropy(graph, mode='laplacian', backend='auto', max_memory=None, components=False, workers=1):
     if mode == 'laplacian' or mode == 'Laplacian':
         # laplacian = np.array(graph.laplacian(normalized=False))
-        laplacian = csgraph.laplacian(adjacency, normed=False)
+        laplacian = get_laplacian_operator(graph, 'combinatorial')
     elif mode == 'normalized laplacian' or mode == 'Normalized Laplacian':
         # laplacian = np.array(graph.laplacian(normalized=True))
-        laplacian = csgraph.laplacian(adjacency, normed=True)
+        laplacian = get_laplacian_operator(graph, 'normalized')
     else:
         raise Exception
 
-    eigenvalues = eigsh(laplacian, graph.vcount() - 1, return_eigenvectors=False)
+    if components:
+        eigenvalues = component_spectrum(laplacian, get_membership(graph), backend, max_memory, workers)
+    else:
+        eigenvalues = laplacian_spectrum(laplacian, backend, max_memory, workers)
     eigsum = eigenvalues.sum()
 
-    entropy = 0
-    for eigval in eigenvalues:
-        entropy -= __xlogx(eigval / eigsum)
-    return entropy
\ No newline at end of file
+    entropy = -xlogx(eigenvalues / eigsum).sum()
+    return entropy
@@ -1,51 +1,195 @@
 from math import log
 from math import exp
-import numpy as np 
+import numpy as np
+from utils.xlogx import xlogx
+from utils.xlogx import xlogx_table
+from utils.graphMatrix import get_degree_sequence
 
-def __func_f(x):
-    epsilon = 10 ** (-8)
-    if x <= epsilon:
-        return 0
-    else:
-        return x * log(x, 2)
+def __segments(degrees, offsets):
+    # normalize the single, list and concatenated forms into a flat integer array with its segment starts
+    if isinstance(degrees, (list, tuple)) and offsets is None and len(degrees) > 0 and np.ndim(degrees[0]) == 1:
+        lengths = np.array([len(seq) for seq in degrees], dtype=np.int64)
+        degrees = np.concatenate(degrees)
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    degrees = np.rint(np.asarray(degrees, dtype=np.float64)).astype(np.int64)
+    single = offsets is None
+    offsets = np.zeros(1, dtype=np.int64) if single else np.asarray(offsets, dtype=np.int64)
+    if len(offsets) > 0 and offsets[0] > 0:
+        degrees, offsets = degrees[offsets[0]:], offsets - offsets[0]
+    return degrees, offsets, single
+
+def entropy_gap_bounds(degrees, offsets=None):
+    """Compute the sharpened lower and upper bounds of the entropy gap of one or many degree sequences in a single vectorized pass.
+
+    The conjugate degree sequence d*_k = |{i : d_i >= k}| is constant between consecutive distinct degrees, so its terms
+    are summed over the distinct degrees of each sequence, in memory linear in the number of vertices whatever the
+    maximum degree. Isolated vertices are ignored.
+
+    Arguments:
+        degrees (np.ndarray or List[np.ndarray]): a degree sequence, a list of degree sequences,
+            or several sequences concatenated into one flat array
+        offsets (np.ndarray): the start index of each sequence in the flat 'degrees' array,
+            only used in the concatenated form
+
+    Returns:
+        lower_bound (float or np.ndarray): the lower bound of the entropy gap, one value per sequence in the batched forms
+        upper_bound (float or np.ndarray): the upper bound of the entropy gap, one value per sequence in the batched forms
+    """
+    degrees, offsets, single = __segments(degrees, offsets)
+    nseq = len(offsets)
+    lengths = np.diff(np.append(offsets, len(degrees)))
+    segment = np.repeat(np.arange(nseq), lengths)
+
+    vol = np.bincount(segment, weights=degrees, minlength=nseq)
+    sum_degree_log_degree = np.bincount(segment, weights=xlogx(degrees), minlength=nseq)
+    sum_square_degree = np.bincount(segment, weights=degrees.astype(np.float64) ** 2, minlength=nseq)
+
+    max_degree = np.zeros(nseq, dtype=np.int64)
+    min_degree = np.zeros(nseq, dtype=np.int64)
+    nonempty = lengths > 0 # 'np.minimum.reduceat' does not handle empty segments
+    if nonempty.any():
+        starts = offsets[nonempty]
+        max_degree[nonempty] = np.maximum.reduceat(degrees, starts)
+        min_degree[nonempty] = np.minimum.reduceat(np.where(degrees > 0, degrees, np.iinfo(np.int64).max), starts)
+
+    # the distinct (sequence, degree) pairs c_1 < ... < c_r of each sequence with their counts, whose suffix sums S_j are
+    # the conjugate entries d*_k for c_{j-1} < k <= c_j, so the sum of d*_k log d*_k is sum_j (c_j - c_{j-1}) S_j log S_j
+    width = int(max_degree.max()) + 1 if nseq > 0 else 1
+    pairs, counts = np.unique(segment * width + degrees, return_counts=True)
+    pair_segment, pair_degree = pairs // width, pairs % width
+    suffix = np.append(np.cumsum(counts[::-1])[::-1], 0)
+    conjugate = suffix[:-1] - suffix[np.searchsorted(pair_segment, pair_segment, side='right')]
+    first = np.ones(len(pairs), dtype=bool)
+    first[1:] = pair_segment[1:] != pair_segment[:-1]
+    steps = pair_degree - np.where(first, 0, np.roll(pair_degree, 1))
+    conjugate_sum_degree_log_degree = np.bincount(pair_segment, weights=steps * xlogx(conjugate), minlength=nseq)
+
+    lower_bound = np.zeros(nseq)
+    upper_bound = np.zeros(nseq)
+    edges = vol > 0
+    vol, max_degree, min_degree = vol[edges], max_degree[edges], min_degree[edges]
+    sum_degree_log_degree, sum_square_degree = sum_degree_log_degree[edges], sum_square_degree[edges]
+    lower_bound[edges] = (xlogx(max_degree + 1) - xlogx(max_degree) + xlogx(min_degree - 1) - xlogx(min_degree)) / vol
+    upper_bound[edges] = np.minimum.reduce([np.full(len(vol), log(exp(1), 2)),
+                                            (conjugate_sum_degree_log_degree[edges] - sum_degree_log_degree) / vol,
+                                            np.log2(1 + sum_square_degree / vol) - sum_degree_log_degree / vol])
+
+    if single:
+        return float(lower_bound[0]), float(upper_bound[0])
+    return lower_bound, upper_bound
 
 def sharpened_lower_bound(graph):
-    m = graph.ecount()
-    if m == 0:
-        lower_bound = 0
-    else:
-        degree_seq = graph.vs.degree()
-        if 0 in degree_seq:
-            degree_seq.remove(0)
-        max_degree = max(degree_seq)
-        min_degree = min(degree_seq)
-        lower_bound = __func_f(max_degree + 1) - __func_f(max_degree) + __func_f(min_degree - 1) - __func_f(min_degree)
-        lower_bound /= 2 * m
-    
-    return lower_bound
+    return entropy_gap_bounds(get_degree_sequence(graph))[0]
 
 def sharpened_upper_bound(graph):
-    m = graph.ecount()
-    n = graph.vcount()
-    if m == 0:
-        upper_bound = 0
-    else:
-        degree_seq = graph.vs.degree()
-        if 0 in degree_seq:
-            degree_seq.remove(0)
-
-        sum_degree_log_degree = 0
-        sum_square_degree = 0
-        conjugate_degree_seq = np.zeros(n, dtype=int)
-        for deg in degree_seq:
-            sum_degree_log_degree += __func_f(deg)
-            sum_square_degree += deg * deg
-            conjugate_degree_seq[:deg] += 1
-
-        conjugate_sum_degree_log_degree = 0
-        for conj_deg in conjugate_degree_seq:
-            conjugate_sum_degree_log_degree += __func_f(conj_deg)
-
-        upper_bound = min(log(exp(1), 2), (conjugate_sum_degree_log_degree - sum_degree_log_degree) / (2 * m), log(1 + sum_square_degree / (2 * m), 2) - sum_degree_log_degree / (2 * m))
-
-    return upper_bound
\ No newline at end of file
+    return entropy_gap_bounds(get_degree_sequence(graph))[1]
+
+class EntropyGapTracker(object):
+    """Maintain the structural information and the sharpened entropy-gap bounds of an unweighted graph under edge insertions and deletions.
+
+    The tracker keeps the degree of every vertex, the degree histogram, the conjugate degree sequence d*_k = |{i : d_i >= k}|,
+    the volume, the sums of d^2, of d log d and of d* log d*, and the maximum and minimum positive degrees.
+    Moving one endpoint from degree d to d + 1 only changes the histogram at d and d + 1 and the conjugate entry d*_{d+1},
+    so every update is O(1) amortized, and every query is O(1). Only deleting the last edge of a vertex of minimum degree
+    scans the histogram upwards for the next non-empty degree.
+
+    Arguments:
+        degrees (np.ndarray): the initial degree sequence, e.g. graph.vs.degree()
+    """
+    def __init__(self, degrees=()):
+        degrees = np.asarray(degrees, dtype=np.int64)
+        self.__degrees = degrees.tolist()
+        self.__histogram = np.bincount(degrees, minlength=1).tolist() if len(degrees) > 0 else [0]
+        self.__conjugate = np.cumsum(self.__histogram[::-1])[::-1].tolist()
+        self.__conjugate[0] = 0 # d*_0 is not part of the conjugate sequence
+        self.__volume = int(degrees.sum())
+        self.__sum_square_degree = int((degrees ** 2).sum())
+        positive = degrees[degrees > 0]
+        self.__sum_dlogd = float(xlogx(degrees).sum())
+        self.__conjugate_sum_dlogd = float(xlogx(np.array(self.__conjugate[1:], dtype=np.int64)).sum())
+        self.__max_degree = int(degrees.max()) if len(degrees) > 0 else 0
+        self.__min_degree = int(positive.min()) if len(positive) > 0 else 0
+
+    def __increment(self, v):
+        d = self.__degrees[v]
+        if d + 1 == len(self.__histogram):
+            self.__histogram.append(0)
+            self.__conjugate.append(0)
+        self.__degrees[v] = d + 1
+        self.__histogram[d] -= 1
+        self.__histogram[d + 1] += 1
+        conj = self.__conjugate[d + 1]
+        self.__conjugate[d + 1] = conj + 1
+        self.__conjugate_sum_dlogd += xlogx_table[conj + 1] - xlogx_table[conj]
+        self.__sum_dlogd += xlogx_table[d + 1] - xlogx_table[d]
+        self.__sum_square_degree += 2 * d + 1
+        self.__volume += 1
+
+        self.__max_degree = max(self.__max_degree, d + 1)
+        if d == 0:
+            self.__min_degree = 1
+        elif d == self.__min_degree and self.__histogram[d] == 0:
+            self.__min_degree = d + 1
+
+    def __decrement(self, v):
+        d = self.__degrees[v]
+        if d == 0:
+            raise ValueError("Cannot remove an edge from an isolated vertex", v)
+        self.__degrees[v] = d - 1
+        self.__histogram[d] -= 1
+        self.__histogram[d - 1] += 1
+        conj = self.__conjugate[d]
+        self.__conjugate[d] = conj - 1
+        self.__conjugate_sum_dlogd += xlogx_table[conj - 1] - xlogx_table[conj]
+        self.__sum_dlogd += xlogx_table[d - 1] - xlogx_table[d]
+        self.__sum_square_degree -= 2 * d - 1
+        self.__volume -= 1
+
+        if d == self.__max_degree and self.__histogram[d] == 0:
+            self.__max_degree = d - 1
+        if d - 1 > 0:
+            self.__min_degree = min(self.__min_degree, d - 1)
+        elif d == self.__min_degree and self.__histogram[d] == 0:
+            k = d + 1
+            while k <= self.__max_degree and self.__histogram[k] == 0:
+                k += 1
+            self.__min_degree = k if k <= self.__max_degree else 0
+
+    def add_vertices(self, count=1):
+        """Add isolated vertices, whose indices follow the existing ones."""
+        self.__degrees.extend([0] * count)
+        self.__histogram[0] += count
+
+    def add_edge(self, u, v):
+        """Insert the undirected edge (u, v), a self-loop adds 2 to the degree of u."""
+        self.__increment(u)
+        self.__increment(v)
+
+    def delete_edge(self, u, v):
+        """Delete the undirected edge (u, v), which must exist."""
+        self.__decrement(u)
+        self.__decrement(v)
+
+    def degree(self, v):
+        return self.__degrees[v]
+
+    def volume(self):
+        return self.__volume
+
+    def structural_information(self):
+        if self.__volume == 0:
+            return 0
+        return log(self.__volume, 2) - self.__sum_dlogd / self.__volume
+
+    def lower_bound(self):
+        if self.__volume == 0:
+            return 0
+        d_max, d_min = self.__max_degree, self.__min_degree
+        return (xlogx_table[d_max + 1] - xlogx_table[d_max] + xlogx_table[d_min - 1] - xlogx_table[d_min]) / self.__volume
+
+    def upper_bound(self):
+        if self.__volume == 0:
+            return 0
+        vol = self.__volume
+        return min(log(exp(1), 2), (self.__conjugate_sum_dlogd - self.__sum_dlogd) / vol,
+                   log(1 + self.__sum_square_degree / vol, 2) - self.__sum_dlogd / vol)
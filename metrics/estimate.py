@@ -0,0 +1,121 @@
+from collections import namedtuple
+import time
+import numpy as np
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import eigsh
+from utils.graphMatrix import get_adjacency
+from utils.graphMatrix import get_laplacian_operator
+from utils.graphMatrix import get_degree_sequence
+from utils.graphMatrix import get_vcount
+from metrics.entropy import structural_information
+from metrics.entropy import von_Neumann_entropy
+from metrics.entropy_bound import entropy_gap_bounds
+from metrics.slaq import slaq
+
+# The estimated von Neumann graph entropy, the interval containing it, the tier that produced it,
+# the total time spent and the time spent in each tier that was run.
+VNGEResult = namedtuple('VNGEResult', ['entropy', 'interval', 'tier', 'elapsed', 'timings'])
+
+TIERS = ('bounds', 'lambda_max', 'slaq', 'exact')
+
+# the Lanczos steps of the SLaQ tier, doubled up to the maximum while its interval misses the certified one
+LANCZOS_STEPS = 10
+MAX_LANCZOS_STEPS = 40
+
+def __binary_entropy(p):
+    if p <= 0 or p >= 1:
+        return 0.0
+    return float(-p * np.log2(p) - (1 - p) * np.log2(1 - p))
+
+def __result(interval, tier, start, timings):
+    lower, upper = interval
+    return VNGEResult((lower + upper) / 2, (lower, upper), tier, time.perf_counter() - start, timings)
+
+def estimate_vnge(graph, tolerance=1e-2, confidence=0.95, max_probes=1000, max_memory=None, tiers=TIERS):
+    """Estimate the von Neumann graph entropy with the cheapest method meeting the tolerance, escalating through tiers.
+
+    1. 'bounds': the structural information minus the sharpened entropy-gap bounds, a certified interval in O(n).
+    2. 'lambda_max': the largest Laplacian eigenvalue (by eigsh) certifies -log2(lambda_max / vol) <= H and
+       H <= h(p_max) + (1 - p_max) log2(r - 1), with p_max = lambda_max / vol and r the rank of the Laplacian.
+       The lower bound from the gap bounds already equals the Renyi-2 entropy -log2(1 - Q) of FINGER's Q,
+       so this tier only helps graphs dominated by one large eigenvalue.
+    3. 'slaq': adaptive SLaQ, a confidence interval at the given level intersected with the certified interval.
+       An interval disjoint from the certified one reveals the quadrature bias, SLaQ is then rerun with twice the
+       Lanczos steps up to MAX_LANCZOS_STEPS, and the tier is skipped if the intervals still do not meet.
+    4. 'exact': the full spectrum, if the dense Laplacian fits in 'max_memory'.
+
+    A tier is accepted when the half-width of its interval is at most 'tolerance', the returned entropy is the middle
+    of the interval. If no tier meets the tolerance, the narrowest interval found is returned.
+
+    Arguments:
+        graph (igraph.Graph, ArrayGraph or spmatrix): the unweighted, undirected graph, or its adjacency matrix
+        tolerance (float): the maximum half-width of the interval, in bits
+        confidence (float): the confidence level of the SLaQ interval
+        max_probes (int): the maximum number of SLaQ random vectors
+        max_memory (int): the memory budget in bytes of the exact tier, by default the available memory
+        tiers (Tuple[str]): the tiers to try, in order
+
+    Returns:
+        result (VNGEResult): the estimate, its interval, the tier that produced it and the time spent
+    """
+    start = time.perf_counter()
+    timings = dict()
+    for tier in tiers:
+        if tier not in TIERS:
+            raise ValueError(f"Unknown tier: expected one of {list(TIERS)}, got {tier}")
+
+    degrees = np.array(get_degree_sequence(graph), dtype=np.int64)
+    vol = degrees.sum()
+    if vol == 0:
+        return __result((0.0, 0.0), tiers[0] if len(tiers) > 0 else 'bounds', start, timings)
+
+    # the certified interval is always computed, the later tiers refine it
+    tier_start = time.perf_counter()
+    si = structural_information(degrees)
+    gap_lower_bound, gap_upper_bound = entropy_gap_bounds(degrees)
+    lower, upper = si - gap_upper_bound, si - gap_lower_bound
+    timings['bounds'] = time.perf_counter() - tier_start
+    best = ((lower, upper), 'bounds')
+    if 'bounds' in tiers and (upper - lower) / 2 <= tolerance:
+        return __result(best[0], 'bounds', start, timings)
+
+    for tier in tiers:
+        tier_start = time.perf_counter()
+        if tier == 'lambda_max':
+            eigmax = eigsh(get_laplacian_operator(graph), 1, return_eigenvectors=False)[0]
+            p_max = min(eigmax / vol, 1.0)
+            ncomponents = connected_components(get_adjacency(graph), directed=False, return_labels=False)
+            rank = get_vcount(graph) - ncomponents
+            lower = max(lower, -np.log2(p_max))
+            if rank > 1:
+                upper = min(upper, __binary_entropy(p_max) + (1 - p_max) * np.log2(rank - 1))
+            interval = (lower, max(lower, upper))
+        elif tier == 'slaq':
+            interval = None
+            lanczos_steps = LANCZOS_STEPS
+            while interval is None and lanczos_steps <= MAX_LANCZOS_STEPS:
+                estimate = slaq.vnge_adaptive(graph, atol=tolerance, rtol=None, confidence=confidence,
+                                              max_probes=max_probes, lanczos_steps=lanczos_steps)
+                if estimate.interval[0] <= upper and estimate.interval[1] >= lower:
+                    interval = (max(lower, estimate.interval[0]), min(upper, estimate.interval[1]))
+                lanczos_steps *= 2
+            if interval is None: # the quadrature bias pushed every interval past a certified bound
+                timings[tier] = time.perf_counter() - tier_start
+                continue
+        elif tier == 'exact':
+            try:
+                entropy = von_Neumann_entropy(graph, max_memory=max_memory)
+            except MemoryError:
+                timings[tier] = time.perf_counter() - tier_start
+                continue
+            interval = (entropy, entropy)
+        else:
+            continue
+        timings[tier] = time.perf_counter() - tier_start
+
+        if interval[1] - interval[0] < best[0][1] - best[0][0]:
+            best = (interval, tier)
+        if (interval[1] - interval[0]) / 2 <= tolerance:
+            return __result(interval, tier, start, timings)
+
+    return __result(best[0], best[1], start, timings)
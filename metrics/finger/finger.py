@@ -1,80 +1,227 @@
 from igraph import Graph
 import numpy as np 
-from scipy.sparse import csr_matrix
-from scipy.sparse import csgraph
+import scipy.sparse
+from utils.graphMatrix import get_adjacency
+from utils.graphMatrix import get_laplacian_operator
+from utils.graphMatrix import get_degree_sequence
+from utils.graphMatrix import get_ecount
+from utils.graphMatrix import get_vcount
+from utils.spmm import spmm
+from scipy.sparse.linalg import LinearOperator
 from scipy.sparse.linalg import eigsh
-
-def __get_adjacency_sparse(G):
-    """Get the adjacency matrix of the graph G in sparse form
-
-    Arguments:
-        G (igraph.Graph): the unweighted, undirected graph
-    
-    Returns:
-        A (csr_matrix): a sparse adjacency matrix
-    """
-    edges = G.get_edgelist()
-    weights = [1] * len(edges)
-    N = G.vcount()
-    sparse_matrix = csr_matrix((weights, list(zip(*edges))), shape=(N, N), dtype=np.float64)
-    A = sparse_matrix + sparse_matrix.T 
-    di = np.diag_indices(N)
-    A[di] /= 2
-    return A
+from scipy.sparse.linalg import lobpcg
+from utils.resultCache import memoize
 
 def __compute_Q(G):
     """Compute the quadratic approximation Q of the von Neumann graph entropy
 
     Arguments:
-        G (igraph.Graph): the unweighted, undirected graph to be analyzed
+        G (igraph.Graph, ArrayGraph or spmatrix): the unweighted, undirected graph to be analyzed, or its adjacency matrix
 
     Returns:
         Q (float): the quadratic approximation
     """
-    volume = 2 * G.ecount()
+    volume = 2 * get_ecount(G)
     
-    volume_square = 0
-    for deg in G.degree():
-        volume_square += deg * deg
+    degrees = np.array(get_degree_sequence(G), dtype=np.int64)
+    volume_square = int(np.dot(degrees, degrees))
     
-    W = G.ecount()
+    W = get_ecount(G)
 
     Q = 1 - (volume_square + 2 * W) / (volume ** 2)
     return Q
 
+@memoize('finger_hat_entropy')
 def finger_hat_entropy(G):
     """Compute an approximation of von Neumann graph entropy using Q and maximum eigenvalue
 
     Arguments:
-        G (igraph.Graph): the unweighted, undirected graph
+        G (igraph.Graph, ArrayGraph or spmatrix): the unweighted, undirected graph, or its adjacency matrix
 
     Returns:
         hat_H (float): an approximation of the von Neumann graph entropy
     """
-    volume = 2 * G.ecount()
+    volume = 2 * get_ecount(G)
     Q = __compute_Q(G)
 
-    adjacency = __get_adjacency_sparse(G)
-    laplacian = csgraph.laplacian(adjacency, normed=False)
+    laplacian = get_laplacian_operator(G)
     eigmax = eigsh(laplacian, 1, return_eigenvectors=False)[0]
 
     hat_H = -Q * np.log2(eigmax / volume)
 
     return hat_H
 
+@memoize('finger_tilde_entropy')
 def finger_tilde_entropy(G):
     """Compute an approximation of von Neumann graph entropy using Q and max_degree
 
     Arguments:
-        G (igraph.Graph): the unweighted, undirected graph to be analyzed
+        G (igraph.Graph, ArrayGraph or spmatrix): the unweighted, undirected graph to be analyzed, or its adjacency matrix
 
     Returns:
         tilde_H (float): an approximation of the von Neumann graph entropy
     """
-    volume = 2 * G.ecount()
-    max_degree = np.array(G.degree()).max()
+    volume = 2 * get_ecount(G)
+    max_degree = get_degree_sequence(G).max()
 
     Q = __compute_Q(G)
     tilde_H = -Q * np.log2(2 * max_degree / volume)
 
-    return tilde_H
\ No newline at end of file
+    return tilde_H
+
+class FingerEvaluator(object):
+    """Evaluate FINGER on a graph that changes by a few edges between evaluations.
+
+    Q is updated from the degree changes of each edge in O(1). Edge edits are kept as a small sparse correction
+    of the adjacency matrix, merged into it once it grows, and the largest Laplacian eigenvalue is recomputed
+    by a solver warm-started from the previous dominant eigenvector, which is close to the new one after small edits.
+
+    Arguments:
+        graph (igraph.Graph, ArrayGraph or spmatrix): the unweighted, undirected initial graph, or its adjacency matrix
+        method (str): the eigensolver, 'power' (power iteration), 'arpack' (eigsh with v0) or 'lobpcg'.
+            The power iteration is the cheapest after small edits, its first solve and any solve that does not converge
+            within max_iterations are done by 'arpack' instead
+        tol (float): the relative tolerance of the largest eigenvalue
+        max_iterations (int): the maximum number of iterations of 'lobpcg' and 'power'
+        merge_threshold (int): the number of pending edge edits merged into the adjacency matrix at once
+    """
+    def __init__(self, graph, method='power', tol=1e-6, max_iterations=1000, merge_threshold=1024):
+        if method not in ('arpack', 'lobpcg', 'power'):
+            raise ValueError("Unknown method: expected one of ['arpack', 'lobpcg', 'power'], got", method)
+        self.__method = method
+        self.__tol = tol
+        self.__max_iterations = max_iterations
+        self.__merge_threshold = merge_threshold
+
+        self.__vcount = get_vcount(graph)
+        self.__ecount = get_ecount(graph)
+        self.__adjacency = get_adjacency(graph)
+        self.__degrees = np.array(get_degree_sequence(graph), dtype=np.float64)
+        # the row sums of the adjacency matrix, where a self-loop counts once, give the Laplacian diagonal
+        self.__strengths = np.asarray(self.__adjacency.sum(axis=1), dtype=np.float64).ravel()
+        self.__volume_square = float(np.dot(self.__degrees, self.__degrees))
+        self.__pending_rows = []
+        self.__pending_cols = []
+        self.__pending_data = []
+
+        self.__eigenvector = None
+        self.__eigmax = None
+
+    def __edit(self, u, v, sign):
+        for w in (u, v):
+            d = self.__degrees[w]
+            self.__degrees[w] = d + sign
+            self.__volume_square += 2 * sign * d + 1
+        self.__strengths[u] += sign
+        if u != v:
+            self.__strengths[v] += sign
+        self.__ecount += sign
+        self.__pending_rows.append(u)
+        self.__pending_cols.append(v)
+        self.__pending_data.append(sign)
+        self.__eigmax = None
+        if len(self.__pending_data) >= self.__merge_threshold:
+            self.__merge()
+
+    def __correction(self):
+        # the pending edits as a symmetric sparse matrix, self-loops counted once like in the adjacency matrix
+        rows, cols = np.array(self.__pending_rows, dtype=np.int64), np.array(self.__pending_cols, dtype=np.int64)
+        data = np.array(self.__pending_data, dtype=np.float64)
+        loops = rows == cols
+        correction = scipy.sparse.coo_matrix((np.concatenate((data, data[~loops])), (np.concatenate((rows, cols[~loops])), np.concatenate((cols, rows[~loops])))),
+                                             shape=(self.__vcount, self.__vcount))
+        return correction.tocsr()
+
+    def __merge(self):
+        if len(self.__pending_data) == 0:
+            return
+        adjacency = self.__adjacency + self.__correction()
+        adjacency.eliminate_zeros()
+        self.__adjacency = adjacency
+        self.__pending_rows, self.__pending_cols, self.__pending_data = [], [], []
+
+    def __laplacian(self):
+        adjacency, degrees = self.__adjacency, self.__strengths.copy()
+        correction = self.__correction() if len(self.__pending_data) > 0 else None
+        def matmat(X):
+            X = X.reshape((X.shape[0], -1))
+            Y = spmm(adjacency, X)
+            if correction is not None:
+                Y += correction @ X
+            np.subtract(degrees[:, None] * X, Y, out=Y)
+            return Y
+        return LinearOperator((self.__vcount, self.__vcount), matvec=matmat, matmat=matmat, rmatvec=matmat, dtype=np.float64)
+
+    def __power_iteration(self, laplacian, v0):
+        # converges at rate lambda_2 / lambda_1, a warm start from the previous eigenvector makes few iterations enough.
+        # The Rayleigh quotient can stall long before convergence when lambda_2 / lambda_1 is close to 1, so the
+        # iteration stops on the residual ||L x - lambda x|| <= tol * lambda instead, like eigsh and lobpcg
+        x = v0 / np.linalg.norm(v0)
+        for _ in range(self.__max_iterations):
+            y = laplacian.matvec(x).ravel()
+            eigmax = np.dot(x, y)
+            norm = np.linalg.norm(y)
+            if norm == 0:
+                return 0, x
+            residual = np.linalg.norm(y - eigmax * x)
+            x = y / norm
+            if residual <= self.__tol * abs(eigmax):
+                return eigmax, x
+        return None, x
+
+    def add_vertices(self, count=1):
+        """Add isolated vertices, whose indices follow the existing ones."""
+        self.__merge()
+        self.__vcount += count
+        self.__adjacency = scipy.sparse.csr_matrix((self.__adjacency.data, self.__adjacency.indices,
+                                                    np.append(self.__adjacency.indptr, [self.__adjacency.indptr[-1]] * count)),
+                                                   shape=(self.__vcount, self.__vcount))
+        self.__degrees = np.append(self.__degrees, np.zeros(count))
+        self.__strengths = np.append(self.__strengths, np.zeros(count))
+        if self.__eigenvector is not None:
+            self.__eigenvector = np.append(self.__eigenvector, np.zeros(count))
+
+    def add_edge(self, u, v):
+        """Insert the undirected edge (u, v)."""
+        self.__edit(u, v, 1)
+
+    def delete_edge(self, u, v):
+        """Delete the undirected edge (u, v), which must exist."""
+        self.__edit(u, v, -1)
+
+    def Q(self):
+        """Get the quadratic approximation Q of the von Neumann graph entropy."""
+        volume = 2 * self.__ecount
+        return 1 - (self.__volume_square + 2 * self.__ecount) / (volume ** 2)
+
+    def largest_eigenvalue(self):
+        """Get the largest Laplacian eigenvalue, warm-started from the previous dominant eigenvector."""
+        if self.__eigmax is not None:
+            return self.__eigmax
+        laplacian = self.__laplacian()
+        v0 = self.__eigenvector
+        if v0 is None or not np.any(v0):
+            v0 = np.random.rand(self.__vcount)
+        eigmax = None
+        if self.__method == 'power' and self.__eigenvector is not None:
+            eigmax, eigenvector = self.__power_iteration(laplacian, v0)
+            v0 = eigenvector
+        if self.__method == 'lobpcg':
+            eigenvalues, eigenvectors = lobpcg(laplacian, v0.reshape((-1, 1)), tol=self.__tol, maxiter=self.__max_iterations, largest=True)
+            eigmax, eigenvector = eigenvalues[0], eigenvectors[:, 0]
+        elif eigmax is None:
+            eigenvalues, eigenvectors = eigsh(laplacian, 1, v0=v0, tol=self.__tol)
+            eigmax, eigenvector = eigenvalues[0], eigenvectors[:, 0]
+        self.__eigmax, self.__eigenvector = float(eigmax), eigenvector
+        return self.__eigmax
+
+    def hat_entropy(self):
+        """Get FINGER-hat, the approximation of the von Neumann graph entropy using Q and the largest eigenvalue."""
+        volume = 2 * self.__ecount
+        return -self.Q() * np.log2(self.largest_eigenvalue() / volume)
+
+    def tilde_entropy(self):
+        """Get FINGER-tilde, the approximation of the von Neumann graph entropy using Q and the maximum degree."""
+        volume = 2 * self.__ecount
+        return -self.Q() * np.log2(2 * self.__degrees.max() / volume)
+
@@ -0,0 +1,242 @@
+"""Fixed-memory sketch estimation of the structural information of unbounded weighted edge streams."""
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+# A sketched structural information (bits) with its confidence interval, the exact volume and the head of the stream.
+SketchEstimate = namedtuple('SketchEstimate', ['entropy', 'interval', 'volume', 'head_mass'])
+
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+def _splitmix64(x):
+    # a bijective 64-bit mixer, vectorized over uint64 arrays (the multiplications wrap modulo 2^64)
+    x = x + GOLDEN
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def _stable(keys, salts):
+    """Maximally skewed 1-stable variates S1(1, -1, 1, 0), one per key and salt, regenerated from the hashes alone.
+
+    Chambers-Mallows-Stuck with a = pi/2 - V: X = (2/pi) (a cos(a) / sin(a) + log((pi/2) W sin(a) / a)),
+    a uniform on (0, pi) and W standard exponential, both taken from 23-bit parts of a single hash, which float32
+    holds exactly. sin(a) is computed as sin(pi - a) from the complementary bits so that it stays positive near pi.
+    The variates are float32, which is enough for sketches summed in float64 and about three times as fast.
+    """
+    hashes = _splitmix64(keys[:, None] ^ salts[None, :])
+    bits = (hashes >> np.uint64(41)).astype(np.float32) + np.float32(0.5)
+    a = bits * np.float32(np.pi * 2.0 ** -23)
+    sin = np.sin((np.float32(2.0 ** 23) - bits) * np.float32(np.pi * 2.0 ** -23))
+    W = -np.log(((hashes & np.uint64(0x7FFFFF)).astype(np.float32) + np.float32(0.5)) * np.float32(2.0 ** -23))
+    return np.float32(2 / np.pi) * (a * np.cos(a) / sin + np.log(np.float32(np.pi / 2) * W * sin / a))
+
+def hash_labels(labels):
+    """Hash vertex labels (strings or integers) to uint64 keys with pandas' stable, vectorized hash."""
+    return pd.util.hash_array(np.asarray(labels, dtype=object))
+
+def _split_bias(prior, exact):
+    # the entropy (nats, times the volume) added by counting a vertex as two items of masses 'prior' and 'exact',
+    # increasing in 'prior', so an upper bound of the prior mass bounds the bias
+    total = prior + exact
+    def xlnx(x):
+        return np.where(x > 0, x * np.log(np.where(x > 0, x, 1)), 0)
+    return xlnx(total) - xlnx(prior) - xlnx(exact)
+
+class StructuralInformationSketch(object):
+    """Estimate the structural information of a weighted edge stream in memory independent of the number of vertices.
+
+    The structural information is the Shannon entropy of the strength distribution p_i = d_i / vol. The volume is
+    kept exactly and the entropy is split between a head of heavy vertices and the remaining tail:
+
+        * a Count-Min sketch (depth x width) of the strengths overestimates every strength by at most
+          e * vol / width with probability 1 - exp(-depth), and ranks the vertices of the stream,
+        * a heavy-hitter table keeps the 'heavy' vertices of largest Count-Min estimate, re-ranked after every batch,
+          and counts their strengths exactly from the batch in which they are admitted,
+        * a stable sketch (Clifford and Cosma) of the tail keeps y_j = sum_i d_i X_ij for 'projections' maximally
+          skewed 1-stable variables X_ij hashed from the vertex, such that y_j / vol = Z_j - (2 / pi) H with
+          Z_j ~ S1(1, -1, 1, 0), hence E[exp((pi/2) y_j / vol)] = (pi / 2) exp(-H).
+
+    The stable sketch is linear, so an evicted head vertex is moved back to the tail by adding its exact strength.
+    Subtracting Count-Min estimates instead would leave negative masses in the tail, which the heavy left tail of
+    the stable variables turns into unbounded errors. The strength of a head vertex before its admission therefore
+    stays in the tail, where the vertex would be counted a second time. The estimate merges the two parts back
+    with the Count-Mean-Min estimate of that earlier strength, and the interval covers any earlier strength between
+    zero and its Count-Min bound. The tail entropy is the median of the estimates of 'groups' groups of projections,
+    its standard error is about sqrt(3 / projections) nats scaled by the tail share of the volume.
+
+    Edges are buffered and applied in vectorized batches, call 'estimate' at any time to flush them.
+
+    Arguments:
+        width (int): the number of counters per Count-Min row
+        depth (int): the number of Count-Min rows
+        heavy (int): the size of the heavy-hitter table
+        projections (int): the number of stable projections
+        groups (int): the number of groups of projections of the median-of-means estimate of the tail
+        batch_size (int): the number of buffered edges applied at once
+        seed (int): the seed of the hash functions
+    """
+    def __init__(self, width=1 << 16, depth=4, heavy=1024, projections=1024, groups=3, batch_size=1 << 14, seed=0):
+        self.__width = width
+        self.__depth = depth
+        self.__heavy = heavy
+        self.__groups = max(1, min(groups, projections))
+        self.__batch_size = batch_size
+
+        salts = np.random.SeedSequence(seed).generate_state(depth + projections, dtype=np.uint64)
+        self.__row_salts, self.__projection_salts = salts[:depth], salts[depth:]
+        self.__counts = np.zeros((depth, width), dtype=np.float64)
+        self.__projections = np.zeros(projections, dtype=np.float64)
+        # the sorted keys of the head, their exact strengths since admission, and the bounds and the estimates
+        # of their strengths before admission
+        self.__head = np.zeros(0, dtype=np.uint64)
+        self.__head_strengths = np.zeros(0, dtype=np.float64)
+        self.__head_priors = np.zeros(0, dtype=np.float64)
+        self.__head_prior_estimates = np.zeros(0, dtype=np.float64)
+        self.__volume = 0.0
+        self.__buffer = ([], [], [])
+
+    def __columns(self, keys):
+        # the Count-Min column of every key in every row
+        return (_splitmix64(keys[None, :] ^ self.__row_salts[:, None]) % np.uint64(self.__width)).astype(np.int64)
+
+    def __stable_product(self, keys, weights):
+        # sum_i weights_i X_ij, the float32 variates generated in blocks of keys to bound their memory
+        result = np.zeros(len(self.__projections), dtype=np.float64)
+        block = max(1, (1 << 20) // len(self.__projections))
+        weights = np.asarray(weights, dtype=np.float32)
+        for start in range(0, len(keys), block):
+            result += weights[start:start + block] @ _stable(keys[start:start + block], self.__projection_salts)
+        return result
+
+    def __mean_min(self, keys):
+        # the Count-Mean-Min estimates: every counter less the mean of the other counters of its row,
+        # the median over the rows, clipped to the Count-Min bound
+        counters = self.__counts[np.arange(self.__depth)[:, None], self.__columns(keys)]
+        unbiased = counters - (self.__volume - counters) / max(self.__width - 1, 1)
+        return np.clip(np.median(unbiased, axis=0), 0, counters.min(axis=0))
+
+    def strengths(self, keys):
+        """Get the Count-Min estimates of the strengths of hashed vertices, never below the true strengths."""
+        keys = np.asarray(keys, dtype=np.uint64)
+        return self.__counts[np.arange(self.__depth)[:, None], self.__columns(keys)].min(axis=0)
+
+    def head(self):
+        """Get the hashed keys of the heavy-hitter table with their exact strengths since admission."""
+        return self.__head.copy(), self.__head_strengths.copy()
+
+    def update_hashed(self, sources, targets, weights):
+        """Apply a batch of edges whose endpoints are already hashed by hash_labels, self-loops are skipped."""
+        sources, targets = np.asarray(sources, dtype=np.uint64), np.asarray(targets, dtype=np.uint64)
+        weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), sources.shape)
+        keep = sources != targets
+        endpoints = np.concatenate((sources[keep], targets[keep]))
+        if len(endpoints) == 0:
+            return
+        keys, inverse = np.unique(endpoints, return_inverse=True)
+        strengths = np.bincount(inverse, weights=np.tile(weights[keep], 2), minlength=len(keys))
+
+        self.__volume += strengths.sum()
+        for row, columns in enumerate(self.__columns(keys)):
+            self.__counts[row] += np.bincount(columns, weights=strengths, minlength=self.__width)
+
+        # re-rank the current head and the vertices of the batch by their estimated strengths
+        head = self.__head
+        if self.__heavy > 0:
+            candidates = np.union1d(head, keys)
+            if len(candidates) > self.__heavy:
+                estimates = self.strengths(candidates)
+                candidates = np.sort(candidates[np.argpartition(-estimates, self.__heavy - 1)[:self.__heavy]])
+            head = candidates
+
+        # evicted vertices return to the tail with their exact strengths, the other head vertices carry over
+        kept = np.isin(self.__head, head, assume_unique=True)
+        self.__projections += self.__stable_product(self.__head[~kept], self.__head_strengths[~kept])
+        carried = np.isin(head, self.__head, assume_unique=True)
+        head_strengths = np.zeros(len(head), dtype=np.float64)
+        head_priors = np.zeros(len(head), dtype=np.float64)
+        head_prior_estimates = np.zeros(len(head), dtype=np.float64)
+        head_strengths[carried] = self.__head_strengths[kept]
+        head_priors[carried] = self.__head_priors[kept]
+        head_prior_estimates[carried] = self.__head_prior_estimates[kept]
+
+        # the batch strengths go to the head counters or to the tail sketch
+        in_head = np.isin(keys, head, assume_unique=True)
+        positions = np.searchsorted(head, keys[in_head])
+        head_strengths[positions] += strengths[in_head]
+        admitted = ~carried
+        head_priors[admitted] = np.maximum(self.strengths(head[admitted]) - head_strengths[admitted], 0)
+        head_prior_estimates[admitted] = np.clip(self.__mean_min(head[admitted]) - head_strengths[admitted], 0, head_priors[admitted])
+        self.__projections += self.__stable_product(keys[~in_head], strengths[~in_head])
+        self.__head, self.__head_strengths = head, head_strengths
+        self.__head_priors, self.__head_prior_estimates = head_priors, head_prior_estimates
+
+    def update_many(self, sources, targets, weights=1.0):
+        """Apply a batch of edges given by their vertex labels."""
+        self.update_hashed(hash_labels(sources), hash_labels(targets), weights)
+
+    def update(self, u, v, w=1.0):
+        """Insert the edge (u, v) of weight w, buffered until 'batch_size' edges are pending."""
+        self.__buffer[0].append(u)
+        self.__buffer[1].append(v)
+        self.__buffer[2].append(w)
+        if len(self.__buffer[0]) >= self.__batch_size:
+            self.flush()
+
+    def flush(self):
+        """Apply the buffered edges."""
+        sources, targets, weights = self.__buffer
+        if len(sources) > 0:
+            self.__buffer = ([], [], [])
+            self.update_many(sources, targets, np.array(weights, dtype=np.float64))
+
+    def volume(self):
+        self.flush()
+        return self.__volume
+
+    def nbytes(self):
+        """Get the memory of the sketches in bytes, excluding the edge buffer."""
+        return self.__counts.nbytes + self.__projections.nbytes + self.__heavy * (8 + 8 + 8 + 8)
+
+    def estimate(self, confidence=0.95):
+        """Estimate the structural information of the edges seen so far.
+
+        Arguments:
+            confidence (float): the confidence level of the interval, which covers the error of the stable sketch
+                and the strengths counted before the admission of head vertices
+
+        Returns:
+            estimate (SketchEstimate): the estimated structural information in bits with its interval,
+                the volume and the fraction of the volume held by the heavy-hitter table
+        """
+        self.flush()
+        vol = self.__volume
+        if vol <= 0:
+            return SketchEstimate(0.0, (0.0, 0.0), 0.0, 0.0)
+
+        head = self.__head_strengths
+        tail = vol - head.sum()
+        p = head[head > 0] / vol
+        head_entropy = -(p * np.log(p)).sum()
+
+        tail_entropy, tail_error = 0.0, 0.0
+        if tail > 1e-9 * vol:
+            exponents = np.pi / 2 * self.__projections / tail
+            terms = np.exp(exponents - exponents.max())
+            # H_tail = log(pi / 2) - log(E[exp((pi/2) y)]) per group, with the largest exponent factored out and
+            # the second-order bias of the logarithm of a mean of m terms, var / (2 m mean^2), added back
+            groups = np.array_split(terms, self.__groups)
+            H_tail = np.median([np.log(np.pi / 2) - np.log(g.mean()) - g.var() / (2 * len(g) * g.mean() ** 2) for g in groups]) - exponents.max()
+            share = tail / vol
+            tail_entropy = share * (H_tail - np.log(share))
+            # the median of the group means is about sqrt(pi / 2) times as spread as the mean of all the terms
+            tail_error = np.sqrt(np.pi / 2) * share * terms.std() / (terms.mean() * np.sqrt(len(terms)))
+        # a head vertex is counted as two items, its strengths before and after admission, which the estimate merges
+        # with the estimated earlier strengths; the true earlier strengths lie between zero and their bounds
+        merged = _split_bias(self.__head_prior_estimates, head).sum() / vol
+        bound = _split_bias(self.__head_priors, head).sum() / vol
+
+        entropy = (head_entropy + tail_entropy - merged) / np.log(2)
+        radius = norm.ppf((1 + confidence) / 2) * tail_error / np.log(2)
+        interval = (float(entropy - radius - (bound - merged) / np.log(2)), float(entropy + radius + merged / np.log(2)))
+        return SketchEstimate(float(entropy), interval, float(vol), float(head.sum() / vol))
@@ -0,0 +1,116 @@
+"""Kernel Polynomial Method routines approximating spectral sums with Chebyshev moments."""
+from collections import namedtuple
+import numpy as np
+import scipy.sparse
+from utils.spmm import spmm
+
+# Chebyshev moments mu_k = tr(T_k(A')) of the matrix A' = (A - center) / halfwidth, whose spectrum lies in [-1, 1].
+ChebyshevMoments = namedtuple('ChebyshevMoments', ['moments', 'center', 'halfwidth', 'matvecs'])
+
+def gershgorin_bounds(matrix):
+    """Bounds the spectrum of a sparse symmetric matrix with Gershgorin discs.
+
+    For a Laplacian this gives [0, 2 * max_degree].
+
+    Args:
+        matrix (spmatrix or LaplacianOperator): Sparse symmetric input matrix, or an operator bounding its own spectrum.
+
+    Returns:
+        tuple: Lower and upper bound of the spectrum.
+    """
+    if hasattr(matrix, 'gershgorin_bounds'):
+        return matrix.gershgorin_bounds()
+    matrix = scipy.sparse.csr_matrix(matrix)
+    diagonal = matrix.diagonal()
+    radius = np.asarray(abs(matrix).sum(axis=1)).ravel() - np.abs(diagonal)
+    return float((diagonal - radius).min()), float((diagonal + radius).max())
+
+def jackson_damping(degree):
+    """Computes the Jackson kernel damping factors that suppress Gibbs oscillations of truncated Chebyshev series.
+
+    Args:
+        degree (int): Number of Chebyshev moments.
+
+    Returns:
+        np.ndarray: Damping factor of each moment.
+    """
+    k = np.arange(degree)
+    q = np.pi / (degree + 1)
+    return ((degree - k + 1) * np.cos(q * k) + np.sin(q * k) / np.tan(q)) / (degree + 1)
+
+def chebyshev_moments(matrix, degree, nvectors, bounds=None, chunk_size=None):
+    """Estimates the Chebyshev moments of the spectral density of a matrix with random Rademacher vectors.
+
+    Only the current and the previous Chebyshev vectors are kept, so the memory does not grow with the degree.
+    Both <v_k, v_k> and <v_{k+1}, v_k> are used, so 'degree' moments cost about degree / 2 matrix-vector products per vector.
+
+    Args:
+        matrix (spmatrix or LinearOperator): Sparse symmetric input matrix.
+        degree (int): Number of Chebyshev moments.
+        nvectors (int): Number of random vectors.
+        bounds (tuple): Lower and upper bound of the spectrum, Gershgorin bounds by default.
+        chunk_size (int): Maximum number of random vectors processed at once. By default all of them.
+
+    Returns:
+        ChebyshevMoments: The estimated moments and the affine map of the spectrum onto [-1, 1].
+    """
+    if bounds is None:
+        bounds = gershgorin_bounds(matrix)
+    lower, upper = bounds
+    center = (upper + lower) / 2
+    halfwidth = max((upper - lower) / 2, 1e-12) * (1 + 1e-6) # keep the extreme eigenvalues strictly inside [-1, 1]
+    if chunk_size is None:
+        chunk_size = nvectors
+
+    n = matrix.shape[0]
+    half = (degree + 1) // 2
+    moments = np.zeros(2 * half + 1)
+    for start in range(0, nvectors, chunk_size):
+        size = min(chunk_size, nvectors - start)
+        z = np.random.choice([-1.0, 1.0], size=(n, size))
+        old_vectors = z
+        vectors = (spmm(matrix, z) - center * z) / halfwidth
+        # mu_{2k} = 2 <v_k, v_k> - mu_0 and mu_{2k+1} = 2 <v_{k+1}, v_k> - mu_1
+        products = np.zeros(2 * half + 1)
+        products[0] = np.einsum('ij,ij->', z, z)
+        products[1] = np.einsum('ij,ij->', z, vectors)
+        for k in range(1, half + 1):
+            products[2 * k] = 2 * np.einsum('ij,ij->', vectors, vectors) - products[0]
+            if k == half:
+                break
+            new_vectors = 2 * (spmm(matrix, vectors) - center * vectors) / halfwidth - old_vectors
+            products[2 * k + 1] = 2 * np.einsum('ij,ij->', new_vectors, vectors) - products[1]
+            old_vectors, vectors = vectors, new_vectors
+        moments += products
+
+    return ChebyshevMoments(moments[:degree] / nvectors, center, halfwidth, nvectors * half)
+
+def kpm_traces(moments, functions, scales=np.ones(1), damping=True):
+    """Approximates the traces of matrix functions from Chebyshev moments.
+
+    The functions are expanded in Chebyshev polynomials by Chebyshev-Gauss quadrature, for all scales at once,
+    so the same moments serve any number of functions and scales.
+
+    Args:
+        moments (ChebyshevMoments): Chebyshev moments of the matrix.
+        functions (List[Callable[np.ndarray, np.ndarray]]): A list of functions over the matrix spectrum.
+        scales (np.ndarray): An array of scales to parametrize the functions.
+        damping (bool): If True, apply the Jackson kernel.
+
+    Returns:
+        np.ndarray: a (len(functions) x len(scales)) array of the approximated traces.
+    """
+    degree = len(moments.moments)
+    nodes = 2 * degree
+    theta = np.pi * (np.arange(nodes) + 0.5) / nodes
+    x = moments.center + moments.halfwidth * np.cos(theta)
+    # coefficients[k] = (2 - delta_k0) / nodes * sum_j f(x_j) cos(k theta_j)
+    basis = np.cos(np.outer(theta, np.arange(degree))) * (2.0 / nodes)
+    basis[:, 0] /= 2
+    weights = moments.moments * (jackson_damping(degree) if damping else 1)
+
+    traces = np.zeros((len(functions), len(scales)))
+    for i, function in enumerate(functions):
+        values = function(np.outer(scales, x))
+        traces[i, :] = (values @ basis) @ weights
+    return traces
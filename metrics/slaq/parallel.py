@@ -0,0 +1,132 @@
+"""Multi-process Stochastic Lanczos Quadrature with reproducible probe-vector shards."""
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.sparse
+from metrics.slaq.slq import _quadrature
+from utils.graphMatrix import LaplacianOperator
+from utils.spmm import get_num_threads
+from utils.spmm import set_num_threads
+
+# The matrix of the current worker process, loaded once by _init_worker.
+_worker_matrix = None
+
+def _entropy_function(x):
+    """-x log(x) with the convention 0 log(0) = 0, a module-level function so that worker processes can unpickle it."""
+    return np.where(x > 0, -x * np.log(np.where(x > 0, x, 1)), 0)
+
+def _identity(x):
+    """The identity, a module-level function so that worker processes can unpickle it."""
+    return x
+
+def _share_matrix(matrix, directory):
+    """Saves the arrays of a CSR matrix or a LaplacianOperator so that workers can memory-map them.
+
+    Args:
+        matrix (csr_matrix or LaplacianOperator): Input matrix.
+        directory (str): Directory receiving one .npy file per array.
+
+    Returns:
+        dict: The description of the matrix passed to the workers.
+    """
+    operator = matrix if isinstance(matrix, LaplacianOperator) else None
+    adjacency = operator.adjacency if operator is not None else scipy.sparse.csr_matrix(matrix)
+    arrays = {'data': adjacency.data, 'indices': adjacency.indices, 'indptr': adjacency.indptr}
+    if operator is not None:
+        arrays['degree'] = operator.degree
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, name + '.npy'), array)
+
+    spec = {'directory': directory, 'shape': adjacency.shape}
+    if operator is not None:
+        spec.update(kind=operator.kind, factor=operator.factor, isolated=operator.isolated)
+    return spec
+
+def _load_matrix(spec):
+    """Rebuilds the matrix saved by _share_matrix on top of read-only memory maps."""
+    def load(name):
+        return np.load(os.path.join(spec['directory'], name + '.npy'), mmap_mode='r')
+    adjacency = scipy.sparse.csr_matrix((load('data'), load('indices'), load('indptr')), shape=spec['shape'], copy=False)
+    if 'kind' not in spec:
+        return adjacency
+    return LaplacianOperator(adjacency, spec['kind'], load('degree'), spec['factor'], spec['isolated'])
+
+def _init_worker(spec, num_threads):
+    # the SpMM threads of the workers share the CPUs of the parent instead of each taking all of them
+    global _worker_matrix
+    set_num_threads(num_threads)
+    _worker_matrix = _load_matrix(spec)
+
+def _shard_sums(matrix, m, functions, scales, reorthogonalize, seed_sequence, size):
+    """Sums of the quadratures of one shard, whose probe vectors come from the shard's own random stream."""
+    rng = np.random.default_rng(seed_sequence)
+    start_vectors = rng.standard_normal((matrix.shape[0], size))
+    return _quadrature(matrix, m, functions, scales, reorthogonalize, start_vectors).sum(axis=-1)
+
+def _worker_shard_sums(m, functions, scales, reorthogonalize, seed_sequence, size):
+    return _shard_sums(_worker_matrix, m, functions, scales, reorthogonalize, seed_sequence, size)
+
+def shard_sizes(nvectors, shard_size):
+    """Splits nvectors probe vectors into shards of shard_size vectors, the last one holding the remainder.
+
+    Args:
+        nvectors (int): Number of random vectors.
+        shard_size (int): Number of random vectors per shard.
+
+    Returns:
+        List[int]: The size of each shard.
+    """
+    sizes = [shard_size] * (nvectors // shard_size)
+    if nvectors % shard_size:
+        sizes.append(nvectors % shard_size)
+    return sizes
+
+def sharded_slq(matrix, m, nvectors, functions, scales=np.ones(1), reorthogonalize=True, workers=1, seed=None, shard_size=10):
+    """Stochastic Lanczos Quadrature with the random vectors split into fixed shards, optionally over a process pool.
+
+    Shard i draws its vectors from the i-th child of np.random.SeedSequence(seed), and the partial sums are merged
+    in shard order, so the estimate only depends on the seed and shard_size, not on the number of workers.
+    Workers memory-map the CSR arrays from a temporary directory instead of receiving a pickled copy, and split the
+    SpMM threads of the calling process between them, see 'utils.spmm.set_num_threads'.
+
+    Args:
+        matrix (csr_matrix or LaplacianOperator): Sparse symmetric input matrix.
+        m (int): Number of Lanczos steps.
+        nvectors (int): Number of random vectors.
+        functions (List[Callable[np.ndarray, np.ndarray]]): A list of module-level functions over the matrix spectrum,
+            which must be picklable when workers > 1.
+        scales (np.ndarray): An array of scales to parametrize the functions.
+        reorthogonalize (bool): If False, use the three-term recurrence without storing the Krylov basis.
+        workers (int): Number of worker processes, 1 computes all shards in the calling process.
+        seed (int): Seed of the random streams, fresh entropy if None.
+        shard_size (int): Number of random vectors per shard, which also bounds the vectors processed at once.
+
+    Returns:
+        np.ndarray: a (len(functions) x len(scales)) array of the approximated traces.
+    """
+    sizes = shard_sizes(nvectors, shard_size)
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(sizes))
+    scales = np.asarray(scales)
+
+    if workers <= 1 or len(sizes) <= 1:
+        sums = [_shard_sums(matrix, m, functions, scales, reorthogonalize, seed_sequence, size)
+                for seed_sequence, size in zip(seed_sequences, sizes)]
+    else:
+        directory = tempfile.mkdtemp(prefix='slaq-')
+        try:
+            spec = _share_matrix(matrix, directory)
+            processes = min(workers, len(sizes))
+            num_threads = max(1, get_num_threads() // processes)
+            with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(spec, num_threads)) as executor:
+                futures = [executor.submit(_worker_shard_sums, m, functions, scales, reorthogonalize, seed_sequence, size)
+                           for seed_sequence, size in zip(seed_sequences, sizes)]
+                sums = [future.result() for future in futures]
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    total = np.zeros((len(functions), len(scales)))
+    for partial in sums:
+        total += partial
+    return matrix.shape[-1] * total / nvectors
@@ -1,90 +1,374 @@
 """Main SLaQ interface for approximating graph descriptors NetLSD and VNGE."""
+from collections import namedtuple
 import numpy as np 
-from scipy.sparse.base import spmatrix
+import scipy.sparse
+from scipy.sparse import spmatrix
+from scipy.stats import norm
 from metrics.slaq.slq import slq
-from metrics.slaq.util import laplacian
+from metrics.slaq.slq import slq_samples
+from metrics.slaq.slq import hutchpp_slq
+from metrics.slaq.slq import lanczos_segmented
+from metrics.slaq.kpm import chebyshev_moments
+from metrics.slaq.kpm import kpm_traces
+from metrics.slaq.kpm import gershgorin_bounds
+from metrics.slaq.parallel import sharded_slq
+from metrics.slaq.parallel import _entropy_function
+from metrics.slaq.parallel import _identity
 from metrics.slaq.util import get_adjacency
 from igraph import Graph
+from utils.graphMatrix import LaplacianOperator
+from utils.resultCache import memoize
 
-def _slq_red_var_vnge(matrix, lanczos_steps, nvectors):
+# An adaptive VNGE estimate with its confidence interval and cost.
+VNGEEstimate = namedtuple('VNGEEstimate', ['entropy', 'interval', 'matvecs', 'nvectors'])
+
+def _slq_vnge_samples(matrix, lanczos_steps, nvectors, chunk_size=None, reorthogonalize=True):
+    """Computes one control variates VNGE estimate per random vector.
+
+    Args:
+        matrix (spmatrix or LinearOperator): Input density matrix of a graph.
+        lanczos_steps (int): Number of Lanczos steps.
+        nvectors (int): Number of random vectors for stochastic estimation.
+        chunk_size (int): Maximum number of random vectors processed at once. By default all of them.
+        reorthogonalize (bool): If False, run Lanczos without storing the Krylov basis.
+
+    Returns:
+        np.ndarray: Approximated von Neumann graph entropy of each random vector.
+    """
+    functions = [_entropy_function, _identity]
+    samples = slq_samples(matrix, lanczos_steps, nvectors, functions, chunk_size=chunk_size, reorthogonalize=reorthogonalize)[:, 0, :]
+    return (samples[0] - samples[1] + 1) / np.log(2) # base-2 entropy
+
+def _estimate_traces(matrix, lanczos_steps, nvectors, functions, scales, estimator, chunk_size, reorthogonalize, kpm_degree=100, bounds=None,
+                     workers=None, seed=None, shard_size=10):
+    """Estimates the traces of matrix functions with the chosen stochastic estimator.
+
+    Args:
+        matrix (spmatrix or LinearOperator): Input matrix.
+        lanczos_steps (int): Number of Lanczos steps.
+        nvectors (int): Number of vectors, for 'hutch++' a quarter of them spans the sketch and the rest are random vectors,
+            so that both estimators use about nvectors * lanczos_steps matrix-vector products.
+        functions (List[Callable[np.ndarray, np.ndarray]]): A list of functions over the matrix spectrum.
+        scales (np.ndarray): An array of scales to parametrize the functions.
+        estimator (str): 'slq' for plain Stochastic Lanczos Quadrature, 'hutch++' for the low-rank deflated variant,
+            'kpm' for the Kernel Polynomial Method with Jackson damped Chebyshev moments.
+        chunk_size (int): Maximum number of random vectors processed at once.
+        reorthogonalize (bool): If False, run Lanczos without storing the Krylov basis.
+        kpm_degree (int): Number of Chebyshev moments for 'kpm', costing about kpm_degree / 2 matrix-vector products per vector.
+            The resolution is uniform over the spectrum, so graphs with hubs much larger than the typical degree need more moments.
+        bounds (tuple): Spectral bounds for 'kpm'. By default 0 and the Gershgorin upper bound, as Laplacians are positive semi-definite.
+        workers (int): Number of worker processes for sharded 'slq'. If workers and seed are None, the global NumPy random state is used.
+        seed (int): Seed of the per-shard random streams of sharded 'slq'.
+        shard_size (int): Number of random vectors per shard of sharded 'slq'.
+
+    Returns:
+        np.ndarray: Approximated traces, one row per function.
+    """
+    if workers is not None or seed is not None:
+        if estimator != 'slq':
+            raise ValueError("Sharded estimation only supports the 'slq' estimator, got", estimator)
+        return sharded_slq(matrix, lanczos_steps, nvectors, functions, scales, reorthogonalize, workers or 1, seed, shard_size)
+    if estimator == 'slq':
+        return slq(matrix, lanczos_steps, nvectors, functions, scales, chunk_size, reorthogonalize)
+    elif estimator == 'hutch++':
+        sketch_size = nvectors // 4
+        return hutchpp_slq(matrix, lanczos_steps, nvectors - sketch_size, functions, scales, sketch_size,
+                           chunk_size=chunk_size, reorthogonalize=reorthogonalize)[0]
+    elif estimator == 'kpm':
+        if bounds is None:
+            bounds = (0.0, gershgorin_bounds(matrix)[1])
+        moments = chebyshev_moments(matrix, kpm_degree, nvectors, bounds, chunk_size)
+        return kpm_traces(moments, functions, scales)
+    else:
+        raise ValueError("Unknown estimator: expected one of ['slq', 'hutch++', 'kpm'], got", estimator)
+
+def _slq_red_var_vnge(matrix, lanczos_steps, nvectors, chunk_size=None, reorthogonalize=True, estimator='slq', kpm_degree=100,
+                      workers=None, seed=None, shard_size=10):
     """Approximates von Neumann graph entropy (VNGE) of a given matrix.
 
     Uses the control variates method to reduce the variance of VNGE estimation.
 
     Args:
-        matrix (sparse matrix): Input adjacency matrix of a graph.
+        matrix (spmatrix or LinearOperator): Input density matrix of a graph.
         lanczos_steps (int): Number of Lanczos steps.
         nvectors (int): Number of random vectors for stochastic estimation.
+        chunk_size (int): Maximum number of random vectors processed at once. By default all of them.
+        reorthogonalize (bool): If False, run Lanczos without storing the Krylov basis.
+        estimator (str): Trace estimator, 'slq', 'hutch++' or 'kpm'.
+        kpm_degree (int): Number of Chebyshev moments for 'kpm'.
+        workers (int): Number of worker processes for sharded 'slq'.
+        seed (int): Seed of the per-shard random streams of sharded 'slq'.
+        shard_size (int): Number of random vectors per shard.
 
     Returns:
         float: Approximated von Neumann graph entropy.
     """
-    functions = [lambda x: np.where(x > 0, -x * np.log(x), 0), lambda x: x]
-    traces = slq(matrix, lanczos_steps, nvectors, functions).ravel()
+    if estimator == 'slq' and workers is None and seed is None:
+        return _slq_vnge_samples(matrix, lanczos_steps, nvectors, chunk_size, reorthogonalize).mean()
+    functions = [_entropy_function, _identity]
+    traces = _estimate_traces(matrix, lanczos_steps, nvectors, functions, np.ones(1), estimator, chunk_size, reorthogonalize, kpm_degree,
+                              workers=workers, seed=seed, shard_size=shard_size).ravel()
     return (traces[0] - traces[1] + 1) / np.log(2) # base-2 entropy
 
-def vnge(graph, lanczos_steps=10, nvectors=100):
+def _vnge_density(graph):
+    """Builds the density matrix L / trace(L) that SLaQ estimates the VNGE of.
+
+    Args:
+        graph (igraph.Graph, ArrayGraph or spmatrix): Input graph, or its prebuilt adjacency matrix.
+
+    Returns:
+        LaplacianOperator: Matrix-free density operator, or None if the graph has no edges.
+    """
+    adjacency = get_adjacency(graph)
+    if adjacency.nnz == 0:
+        return None
+    return LaplacianOperator(adjacency, 'density')
+
+@memoize('slaq.vnge', seed='seed', ignore=('workers',))
+def vnge(graph, lanczos_steps=10, nvectors=100, chunk_size=None, reorthogonalize=True, estimator='slq', kpm_degree=100,
+         workers=None, seed=None, shard_size=10):
     """Computes von Neumann graph entropy (VNGE) using SLaQ.
 
     Args:
-        adjacency (scipy.sparse.base.spmatrix): Input adjacency matrix of a graph.
+        graph (igraph.Graph, ArrayGraph or spmatrix): Input graph, or its prebuilt adjacency matrix.
         lanczos_steps (int): Number of Lanczos steps. Setting lanczos_steps=10 is the default from SLaQ.
         nvectors (int): Number of random vectors for stochastic estimation. Setting nvectors=100 is the default values from the SLaQ paper.
+        chunk_size (int): Maximum number of random vectors processed at once, bounding the peak memory to O(n x chunk_size).
+        reorthogonalize (bool): If False, run Lanczos without storing the Krylov basis.
+        estimator (str): Trace estimator, 'slq' (recommended), 'hutch++' which computes the top of the spectrum from
+            a low-rank sketch and rarely pays off for the VNGE (see 'hutchpp_slq'), or 'kpm' which uses Chebyshev moments.
+        kpm_degree (int): Number of Chebyshev moments for 'kpm'.
+        workers (int): Number of worker processes. The random vectors are split into shards of 'shard_size' vectors
+            processed in parallel, with the CSR arrays shared through memory-mapped files.
+        seed (int): Seed of the per-shard random streams, the estimate is reproducible for a given seed and shard_size
+            whatever the number of workers. If workers and seed are None, the global NumPy random state is used as before.
+        shard_size (int): Number of random vectors per shard.
 
     Returns:
         float: Approximated VNGE.
     """
-    adjacency = get_adjacency(graph)
-    if adjacency.nnz == 0: # By convention, if x=0, x*log(x)=0.
+    density = _vnge_density(graph)
+    if density is None: # By convention, if x=0, x*log(x)=0.
         return 0
-    density = laplacian(adjacency, False)
-    density.data /= np.sum(density.diagonal()).astype(np.float32)
-    return _slq_red_var_vnge(density, lanczos_steps, nvectors)
+    return _slq_red_var_vnge(density, lanczos_steps, nvectors, chunk_size, reorthogonalize, estimator, kpm_degree, workers, seed, shard_size)
+
+def vnge_repeated(graph, runs, lanczos_steps=10, nvectors=100, chunk_size=None, reorthogonalize=True, estimator='slq', kpm_degree=100):
+    """Computes independent SLaQ estimates of the VNGE, building the density matrix only once.
+
+    Args:
+        graph (igraph.Graph, ArrayGraph or spmatrix): Input graph, or its prebuilt adjacency matrix.
+        runs (int): Number of independent estimates.
+        lanczos_steps (int): Number of Lanczos steps.
+        nvectors (int): Number of random vectors for each estimate.
+        chunk_size (int): Maximum number of random vectors processed at once.
+        reorthogonalize (bool): If False, run Lanczos without storing the Krylov basis.
+        estimator (str): Trace estimator, 'slq', 'hutch++' or 'kpm'.
+        kpm_degree (int): Number of Chebyshev moments for 'kpm'.
+
+    Returns:
+        np.ndarray: Approximated VNGE of each run.
+    """
+    density = _vnge_density(graph)
+    if density is None:
+        return np.zeros(runs)
+    return np.array([_slq_red_var_vnge(density, lanczos_steps, nvectors, chunk_size, reorthogonalize, estimator, kpm_degree) for _ in range(runs)])
+
+def vnge_adaptive(graph, atol=None, rtol=1e-2, confidence=0.95, batch_size=10, max_probes=1000, lanczos_steps=10, chunk_size=None, reorthogonalize=True):
+    """Computes von Neumann graph entropy (VNGE) using SLaQ, adding random vectors until a tolerance is met.
 
+    Random vectors are added in batches while the running mean and standard error of the estimate are tracked.
+    The estimation stops once the half-width of the confidence interval is at most max(atol, rtol * |estimate|),
+    or when 'max_probes' random vectors have been used.
 
-def _slq_red_var_netlsd(matrix, lanczos_steps, nvectors, timescales):
+    Args:
+        graph (igraph.Graph, ArrayGraph or spmatrix): Input graph, or its prebuilt adjacency matrix.
+        atol (float): Absolute tolerance on the confidence interval half-width. None to only use rtol.
+        rtol (float): Relative tolerance on the confidence interval half-width. None to only use atol.
+        confidence (float): Confidence level of the reported interval.
+        batch_size (int): Number of random vectors added at each round, at least 1.
+        max_probes (int): Maximum number of random vectors, at least 2 to estimate the standard error.
+        lanczos_steps (int): Number of Lanczos steps.
+        chunk_size (int): Maximum number of random vectors processed at once.
+        reorthogonalize (bool): If False, run Lanczos without storing the Krylov basis.
+
+    Returns:
+        VNGEEstimate: Approximated VNGE with its confidence interval, the number of sparse
+        matrix-vector products and the number of random vectors used.
+    """
+    if max_probes < 2:
+        raise ValueError("The maximum number of random vectors must be at least 2, got", max_probes)
+    if batch_size < 1:
+        raise ValueError("The batch size must be at least 1, got", batch_size)
+    density = _vnge_density(graph)
+    if density is None:
+        return VNGEEstimate(0.0, (0.0, 0.0), 0, 0)
+
+    z = norm.ppf(0.5 + confidence / 2)
+    samples = np.zeros(0)
+    halfwidth = np.inf
+    while len(samples) < max_probes:
+        size = min(batch_size, max_probes - len(samples))
+        samples = np.append(samples, _slq_vnge_samples(density, lanczos_steps, size, chunk_size, reorthogonalize))
+        if len(samples) < 2:
+            continue
+        halfwidth = float(z * samples.std(ddof=1) / np.sqrt(len(samples)))
+        tolerance = max(atol or 0, (rtol or 0) * np.abs(samples.mean()))
+        if halfwidth <= tolerance:
+            break
+
+    entropy = float(samples.mean())
+    return VNGEEstimate(entropy, (entropy - halfwidth, entropy + halfwidth), len(samples) * lanczos_steps, len(samples))
+
+def _slq_red_var_netlsd(matrix, lanczos_steps, nvectors, timescales, chunk_size=None, reorthogonalize=True, estimator='slq', kpm_degree=100,
+                        workers=None, seed=None, shard_size=10):
     """Computes unnormalized NetLSD signatures of a given matrix.
 
     Uses the control variates method to reduce the variance of NetLSD estimation.
 
     Args:
-        matrix (sparse matrix): Input adjacency matrix of a graph.
+        matrix (spmatrix or LinearOperator): Input Laplacian of a graph.
         lanczos_steps (int): Number of Lanczos steps.
         nvectors (int): Number of random vectors for stochastic estimation.
         timescales (np.ndarray): Timescale parameter for NetLSD computation. Default value is the one used in both NetLSD and SLaQ papers.
+        chunk_size (int): Maximum number of random vectors processed at once. By default all of them.
+        reorthogonalize (bool): If False, run Lanczos without storing the Krylov basis.
+        estimator (str): Trace estimator, 'slq', 'hutch++' or 'kpm'.
+        kpm_degree (int): Number of Chebyshev moments for 'kpm'.
+        workers (int): Number of worker processes for sharded 'slq'.
+        seed (int): Seed of the per-shard random streams of sharded 'slq'.
+        shard_size (int): Number of random vectors per shard.
 
     Returns:
         np.ndarray: Approximated NetLSD descriptors.
     """
-    functions = [np.exp, lambda x: x]
-    traces = slq(matrix, lanczos_steps, nvectors, functions, -timescales)
+    functions = [np.exp, _identity]
+    # The spectrum of the normalized Laplacian lies in [0, 2], tighter than its Gershgorin discs.
+    traces = _estimate_traces(matrix, lanczos_steps, nvectors, functions, -timescales, estimator, chunk_size, reorthogonalize, kpm_degree, (0.0, 2.0),
+                              workers, seed, shard_size)
     subee = traces[0, :] - traces[1, :] / np.exp(timescales)
     sub = -timescales * matrix.shape[0] / np.exp(timescales)
     return np.array(subee + sub)
 
-def netlsd(graph, timescales=np.logspace(-2, 2, 256), lanczos_steps=10, nvectors=100, normalization=None):
+def netlsd(graph, timescales=np.logspace(-2, 2, 256), lanczos_steps=10, nvectors=100, normalization=None, chunk_size=None, reorthogonalize=True, estimator='slq', kpm_degree=100,
+           workers=None, seed=None, shard_size=10):
     """Computes NetLSD descriptors using SLaQ.
     
     Args:
-        adjacency (sparse matrix): Input adjacency matrix of a graph.
+        graph (igraph.Graph, ArrayGraph or spmatrix): Input graph, or its prebuilt adjacency matrix.
         timescales (np.ndarray): Timescale parameter for NetLSD computation. Default value is the one used in both NetLSD and SLaQ papers.
         lanczos_steps (int): Number of Lanczos steps. Setting lanczos_steps=10 is the default from SLaQ.
         nvectors (int): Number of random vectors for stochastic estimation. Setting nvectors=100 is the default values from the SLaQ paper.
         normalization (str): Normalization type for NetLSD.
+        chunk_size (int): Maximum number of random vectors processed at once, bounding the peak memory to O(n x chunk_size).
+        reorthogonalize (bool): If False, run Lanczos without storing the Krylov basis.
+        estimator (str): Trace estimator, 'slq' (recommended), 'hutch++' which computes the top of the spectrum from
+            a low-rank sketch and rarely pays off for heat kernels (see 'hutchpp_slq'), or 'kpm' which evaluates
+            all timescales from a single set of Chebyshev moments.
+        kpm_degree (int): Number of Chebyshev moments for 'kpm'.
+        workers (int): Number of worker processes, see 'vnge'.
+        seed (int): Seed of the per-shard random streams, see 'vnge'.
+        shard_size (int): Number of random vectors per shard.
 
     Returns:
         np.ndarray: Approximated NetLSD descriptors.
     """
-    lap = laplacian(get_adjacency(graph), True)
-    hkt = _slq_red_var_netlsd(lap, lanczos_steps, nvectors, timescales)
+    lap = LaplacianOperator(get_adjacency(graph), 'normalized', isolated=1.0)
+    hkt = _slq_red_var_netlsd(lap, lanczos_steps, nvectors, timescales, chunk_size, reorthogonalize, estimator, kpm_degree, workers, seed, shard_size)
+    return _normalize_netlsd(hkt, lap.shape[0], timescales, normalization)
+
+def _normalize_netlsd(hkt, n, timescales, normalization):
+    """Normalizes NetLSD signatures of graphs with n vertices, broadcasting over graphs if n is an array."""
     if normalization is None:
         return hkt
-    n = lap.shape[0]
     if normalization == 'empty':
-        return hkt / n 
+        return hkt / n
     elif normalization == 'complete':
         return hkt / (1 + (n - 1) * np.exp(-timescales))
-    elif normalization is None:
-        return hkt
     else:
-        raise ValueError("Unknown normalization type: expected one of [None, 'empty', 'complete'], got", normalization)
\ No newline at end of file
+        raise ValueError("Unknown normalization type: expected one of [None, 'empty', 'complete'], got", normalization)
+
+def _netlsd_block(adjacency, sizes, timescales, lanczos_steps, nvectors, reorthogonalize):
+    """Computes unnormalized NetLSD signatures of the graphs stacked in a block-diagonal adjacency matrix.
+
+    Args:
+        adjacency (spmatrix): Block-diagonal adjacency matrix.
+        sizes (np.ndarray): Positive number of vertices of each graph.
+        timescales (np.ndarray): Timescale parameter for NetLSD computation.
+        lanczos_steps (int): Number of Lanczos steps.
+        nvectors (int): Number of random vectors per graph.
+        reorthogonalize (bool): If False, run Lanczos without storing the Krylov basis.
+
+    Returns:
+        np.ndarray: A (graphs x timescales) array of NetLSD descriptors.
+    """
+    lap = LaplacianOperator(scipy.sparse.csr_matrix(adjacency, dtype=np.float64), 'normalized', isolated=1.0)
+    T = lanczos_segmented(lap, sizes, lanczos_steps, nvectors, reorthogonalize)
+    eigenvalues, eigenvectors = np.linalg.eigh(T)
+    weights = eigenvectors[..., 0, :] ** 2 # (graphs x nvectors x m)
+
+    # One exp over all graphs, vectors and timescales, averaged over the random vectors. Single precision is far
+    # below the sampling error and halves the cost of the exp, which dominates for small graphs.
+    kernel = np.multiply.outer(-timescales.astype(np.float32), eigenvalues.astype(np.float32))
+    np.exp(kernel, out=kernel)
+    heat = np.einsum('sgkj,gkj->gs', kernel, weights.astype(np.float32), dtype=np.float64) / nvectors
+    linear = np.einsum('gkj,gkj->g', eigenvalues, weights) / nvectors
+    # Control variates as in _slq_red_var_netlsd: the estimated trace of -tL is replaced by its exact value -tn.
+    n = sizes[:, None]
+    decay = np.exp(-timescales)[None, :]
+    return n * heat + timescales * n * linear[:, None] * decay - timescales * n * decay
+
+def _diagonal_block(stack, start, stop):
+    """Gets rows and columns [start, stop) of a block-diagonal CSR matrix whose blocks do not cross them, sharing its data."""
+    if start == 0 and stop == stack.shape[0]:
+        return stack
+    lo, hi = stack.indptr[start], stack.indptr[stop]
+    return scipy.sparse.csr_matrix((stack.data[lo:hi], stack.indices[lo:hi] - start, stack.indptr[start:stop + 1] - lo),
+                                   shape=(stop - start, stop - start), copy=False)
+
+def netlsd_batch(graphs, timescales=np.logspace(-2, 2, 256), lanczos_steps=10, nvectors=100, normalization=None, reorthogonalize=True,
+                 sizes=None, batch_size=None):
+    """Computes NetLSD descriptors of many graphs using SLaQ on their block-diagonal stack.
+
+    Each batch of graphs is stacked into one block-diagonal matrix, so every Lanczos step is a single SpMM for the whole batch,
+    and the heat kernel of all graphs, random vectors and timescales is evaluated by one vectorized exp.
+
+    Args:
+        graphs (List[igraph.Graph, ArrayGraph or spmatrix] or spmatrix): Input graphs or their adjacency matrices,
+            or a block-diagonal adjacency matrix whose block orders are given by 'sizes'.
+        timescales (np.ndarray): Timescale parameter for NetLSD computation.
+        lanczos_steps (int): Number of Lanczos steps.
+        nvectors (int): Number of random vectors per graph.
+        normalization (str): Normalization type for NetLSD.
+        reorthogonalize (bool): If False, run Lanczos without storing the Krylov basis.
+        sizes (np.ndarray): The number of vertices of each graph when 'graphs' is a block-diagonal adjacency matrix.
+        batch_size (int): Number of graphs stacked at once, by default as many as keep the heat kernel array around 16 MiB,
+            larger batches spill out of the cache and get slower.
+
+    Returns:
+        np.ndarray: A (graphs x timescales) array of NetLSD descriptors.
+    """
+    timescales = np.asarray(timescales)
+    if sizes is None:
+        stack = None
+        adjacencies = [get_adjacency(graph) for graph in graphs]
+        sizes = np.array([adjacency.shape[0] for adjacency in adjacencies], dtype=np.int64)
+    else:
+        # a block-diagonal input is used as given, each batch being a range of its rows and columns
+        stack = scipy.sparse.csr_matrix(graphs)
+        sizes = np.asarray(sizes, dtype=np.int64)
+        bounds = np.concatenate(([0], np.cumsum(sizes)))
+    if batch_size is None:
+        batch_size = max(1, 2 ** 22 // (len(timescales) * nvectors * lanczos_steps))
+
+    signatures = np.zeros((len(sizes), len(timescales)))
+    nonempty = np.flatnonzero(sizes > 0)
+    for start in range(0, len(nonempty), batch_size):
+        batch = nonempty[start:start + batch_size]
+        if stack is None:
+            adjacency = scipy.sparse.block_diag([adjacencies[i] for i in batch], format='csr')
+        else:
+            adjacency = _diagonal_block(stack, bounds[batch[0]], bounds[batch[-1] + 1])
+        signatures[batch] = _netlsd_block(adjacency, sizes[batch], timescales, lanczos_steps, nvectors, reorthogonalize)
+
+    return _normalize_netlsd(signatures, np.maximum(sizes, 1)[:, None], timescales, normalization)
+
@@ -3,9 +3,10 @@ from typing import Callable
 from typing import List
 from typing import Union
 import numpy as np 
-from scipy.sparse.base import spmatrix
+from scipy.sparse import spmatrix
+from utils.spmm import spmm
 
-def lanczos_m(matrix, lanczos_steps, nvectors):
+def lanczos_m(matrix, lanczos_steps, nvectors, reorthogonalize=True, start_vectors=None):
     """Implementation of Lanczos algorithm for sparse matrices.
 
     Lanczos algorithm computes symmetric m x m tridiagonal matrix T
@@ -15,17 +16,25 @@ def lanczos_m(matrix, lanczos_steps, nvectors):
     The notation follows https://en.wikipedia.org/wiki/Lanczos_algorithm.
 
     Arguments:
-        matrix (spmatrix): Sparse input matrix.
+        matrix (spmatrix or LinearOperator): Sparse input matrix.
         lanczos_steps (int): Number of Lanczos steps.
         nvectors (int): Number of random vectors.
+        reorthogonalize (bool): If True, store the Krylov basis and fully reorthogonalize against it.
+            Otherwise run the plain three-term recurrence, which only keeps two (n x nvectors) blocks.
+        start_vectors (np.ndarray): Optional (n x nvectors) starting vectors, random Gaussian vectors by default.
     
     Returns:
         T (np.ndarray): A (nvectors x m x m) tensor, T[i, :, :] is the i-th symmetric
         tridiagonal matrix.
         V (np.ndarray): A (n x m x nvectors) tensor, V[:, :, i] is the i-th matrix
-        with orthogonal rows.
+        with orthogonal rows. None if reorthogonalize is False.
     """
-    start_vectors = np.random.randn(matrix.shape[0], nvectors).astype(np.float32) # Initialize random vectors in columns (n x nvectors).
+    if not reorthogonalize:
+        return _lanczos_three_term(matrix, lanczos_steps, nvectors, start_vectors), None
+
+    if start_vectors is None:
+        start_vectors = np.random.randn(matrix.shape[0], nvectors) # Initialize random vectors in columns (n x nvectors).
+    start_vectors = np.array(start_vectors, dtype=np.float32)
     V = np.zeros((start_vectors.shape[0], lanczos_steps, nvectors), dtype=np.float32)
     T = np.zeros((nvectors, lanczos_steps, lanczos_steps), dtype=np.float32)
 
@@ -33,7 +42,7 @@ def lanczos_m(matrix, lanczos_steps, nvectors):
     V[:, 0, :] = start_vectors
 
     # First Lanczos step.
-    w = matrix @ start_vectors
+    w = spmm(matrix, start_vectors)
     alpha = np.einsum('ij,ij->j', w, start_vectors)
     w -= alpha[None, :] * start_vectors
     beta = np.einsum('ij,ij->j', w, w)
@@ -53,7 +62,7 @@ def lanczos_m(matrix, lanczos_steps, nvectors):
         old_vectors = V[:, i - 1, :]
         start_vectors = V[:, i, :]
 
-        w = matrix @ start_vectors
+        w = spmm(matrix, start_vectors)
         w -= beta[None, :] * old_vectors
         np.einsum('ij,ij->j', w, start_vectors, out=alpha)
         T[:, i, i] = alpha
@@ -76,25 +85,244 @@ def lanczos_m(matrix, lanczos_steps, nvectors):
     
     return T, V
 
-def slq(matrix, m, nvectors, functions, scales = np.ones(1)):
+def _lanczos_three_term(matrix, lanczos_steps, nvectors, start_vectors=None):
+    """Lanczos algorithm without storing the Krylov basis.
+
+    Arguments:
+        matrix (spmatrix or LinearOperator): Sparse input matrix.
+        lanczos_steps (int): Number of Lanczos steps.
+        nvectors (int): Number of random vectors.
+        start_vectors (np.ndarray): Optional (n x nvectors) starting vectors, random Gaussian vectors by default.
+
+    Returns:
+        T (np.ndarray): A (nvectors x m x m) tensor, T[i, :, :] is the i-th symmetric
+        tridiagonal matrix.
+    """
+    if start_vectors is None:
+        start_vectors = np.random.randn(matrix.shape[0], nvectors)
+    vectors = np.array(start_vectors, dtype=np.float32)
+    np.divide(vectors, np.linalg.norm(vectors, axis=0), out=vectors)
+    old_vectors = np.zeros_like(vectors)
+    T = np.zeros((nvectors, lanczos_steps, lanczos_steps), dtype=np.float32)
+    beta = np.zeros(nvectors, dtype=np.float32)
+
+    for i in range(lanczos_steps):
+        w = spmm(matrix, vectors)
+        alpha = np.einsum('ij,ij->j', w, vectors)
+        w -= alpha[None, :] * vectors
+        w -= beta[None, :] * old_vectors
+        T[:, i, i] = alpha
+
+        if i < lanczos_steps - 1:
+            beta = np.sqrt(np.einsum('ij,ij->j', w, w))
+            T[:, i, i + 1] = beta
+            T[:, i + 1, i] = beta
+            if (np.abs(beta) > 1e-6).sum() == 0:
+                break
+            # Invariant subspaces found early give zero vectors instead of dividing by zero.
+            np.divide(w, beta[None, :], out=w, where=beta[None, :] > 1e-6)
+            w[:, beta <= 1e-6] = 0
+            old_vectors, vectors = vectors, w
+
+    return T
+
+def _quadrature(matrix, m, functions, scales, reorthogonalize=True, start_vectors=None, nvectors=None):
+    """Lanczos quadrature of u^T f(matrix) u for unit starting vectors u.
+
+    Arguments:
+        matrix (spmatrix or LinearOperator): Sparse input matrix.
+        m (int): Number of Lanczos steps.
+        functions (List[Callable[np.ndarray, np.ndarray]]): A list of functions over the matrix spectrum.
+        scales (np.ndarray): An array of scales to parametrize the functions.
+        reorthogonalize (bool): If False, use the three-term recurrence without storing the Krylov basis.
+        start_vectors (np.ndarray): The (n x k) starting vectors, random if None.
+        nvectors (int): Number of random starting vectors, only used if start_vectors is None.
+
+    Returns:
+        quadratures (np.ndarray): a (len(functions) x len(scales) x k) array.
+    """
+    if start_vectors is not None:
+        nvectors = start_vectors.shape[1]
+    T, _ = lanczos_m(matrix, m, nvectors, reorthogonalize, start_vectors)
+    eigenvalues, eigenvectors = np.linalg.eigh(T)
+    sqeigv1 = np.power(eigenvectors[:, 0, :], 2)
+    quadratures = np.zeros((len(functions), len(scales), nvectors))
+    for i, function in enumerate(functions):
+        expeig = function(np.outer(scales, eigenvalues)).reshape(len(scales), nvectors, m)
+        quadratures[i] = (expeig * sqeigv1).sum(axis=-1)
+    return quadratures
+
+def slq_samples(matrix, m, nvectors, functions, scales = np.ones(1), chunk_size=None, reorthogonalize=True):
+    """Per random vector Stochastic Lanczos Quadrature estimates of the traces of given matrix functions.
+
+    Arguments:
+        matrix (spmatrix or LinearOperator): Sparse input matrix.
+        m (int): Number of Lanczos steps.
+        nvectors(int): Number of random vectors.
+        functions (List[Callable[np.ndarray, np.ndarray]]): A list of functions over the matrix spectrum.
+        scales (np.ndarray): An array of scales to parametrize the functions. By default no scaling of the spectrum is used.
+        chunk_size (int): Maximum number of random vectors processed at once. By default all of them.
+        reorthogonalize (bool): If False, use the three-term recurrence without storing the Krylov basis.
+
+    Returns:
+        samples (np.ndarray): a (len(functions) x len(scales) x nvectors) array, whose mean over the
+        last axis is the SLQ estimate of the traces.
+    """
+    if chunk_size is None:
+        chunk_size = nvectors
+    samples = np.zeros((len(functions), len(scales), nvectors))
+    for start in range(0, nvectors, chunk_size):
+        size = min(chunk_size, nvectors - start)
+        samples[:, :, start:start + size] = matrix.shape[-1] * _quadrature(matrix, m, functions, scales, reorthogonalize, nvectors=size)
+
+    return samples
+
+def slq(matrix, m, nvectors, functions, scales = np.ones(1), chunk_size=None, reorthogonalize=True):
     """Stochastic Lanczos Quadrature approximation of given matrix functions.
 
+    The random vectors are processed in chunks of at most 'chunk_size' vectors, so the peak memory
+    is O(n x m x chunk_size) with reorthogonalization and O(n x chunk_size) without it.
+
     Arguments:
-        matrix (spmatrix): Sparse input matrix.
+        matrix (spmatrix or LinearOperator): Sparse input matrix.
         m (int): Number of Lanczos steps.
         nvectors(int): Number of random vectors.
         functions (List[Callable[np.ndarray, np.ndarray]]): A list of functions over the matrix spectrum.
         scales (np.ndarray): An array of scales to parametrize the functions. By default no scaling of the spectrum is used.
+        chunk_size (int): Maximum number of random vectors processed at once. By default all of them.
+        reorthogonalize (bool): If False, use the three-term recurrence without storing the Krylov basis.
     
     Returns:
-        traces (np.ndarray): a (nvectors x m x m) tensor, T[i, :, :] is the i-th symmetric tridiagonal matrix.
+        traces (np.ndarray): a (len(functions) x len(scales)) array of the approximated traces.
     """
-    T, _ = lanczos_m(matrix, m, nvectors)
-    eigenvalues, eigenvectors = np.linalg.eigh(T)
+    return slq_samples(matrix, m, nvectors, functions, scales, chunk_size, reorthogonalize).mean(axis=-1)
+
+
+def hutchpp_slq(matrix, m, nvectors, functions, scales = np.ones(1), sketch_size=None, power_iterations=1, chunk_size=None, reorthogonalize=True):
+    """Hutch++ style approximation of the traces of given matrix functions with Lanczos quadrature.
+
+    A randomized range finder builds an orthonormal basis Q of the dominant eigenspace, whose part of the trace
+    sum_j q_j^T f(matrix) q_j is computed by Lanczos quadrature started from each basis vector. The residual
+    trace of (I - QQ^T) f(matrix) (I - QQ^T) is estimated from random vectors projected onto the complement of Q,
+    so the variance only comes from the flat tail of the spectrum.
+
+    Plain 'slq' remains the recommended estimator. The sketch captures the largest eigenvalues of the matrix, which
+    only pays off when a few of them carry a large share of f(matrix), i.e. f is increasing and the spectrum decays
+    fast, or the sketch spans a sizable part of a small graph. The VNGE of density matrices and the heat kernel
+    traces of NetLSD have flat or decreasing f over the spectrum of sparse graphs, where the sketch costs
+    sketch_size * (1 + power_iterations + m) matrix-vector products without removing much variance, and Hutch++
+    is less accurate than 'slq' at an equal number of matrix-vector products.
+
+    Arguments:
+        matrix (spmatrix or LinearOperator): Sparse symmetric input matrix.
+        m (int): Number of Lanczos steps.
+        nvectors (int): Number of random vectors for the residual.
+        functions (List[Callable[np.ndarray, np.ndarray]]): A list of functions over the matrix spectrum.
+        scales (np.ndarray): An array of scales to parametrize the functions. By default no scaling of the spectrum is used.
+        sketch_size (int): Rank of the sketch, by default nvectors // 2.
+        power_iterations (int): Number of subspace iterations sharpening the sketch.
+        chunk_size (int): Maximum number of random vectors processed at once. By default all of them.
+        reorthogonalize (bool): If False, use the three-term recurrence without storing the Krylov basis.
+
+    Returns:
+        traces (np.ndarray): a (len(functions) x len(scales)) array of the approximated traces.
+        matvecs (int): Number of matrix-vector products used.
+    """
+    n = matrix.shape[0]
+    if sketch_size is None:
+        sketch_size = nvectors // 2
+    sketch_size = min(sketch_size, n - 1)
+    if chunk_size is None:
+        chunk_size = max(nvectors, sketch_size)
+
+    Q = np.linalg.qr(spmm(matrix, np.random.randn(n, sketch_size).astype(np.float32)))[0]
+    for _ in range(power_iterations):
+        Q = np.linalg.qr(spmm(matrix, Q.astype(np.float32)))[0]
+    matvecs = sketch_size * (1 + power_iterations)
+
     traces = np.zeros((len(functions), len(scales)))
-    for i, function in enumerate(functions):
-        expeig = function(np.outer(scales, eigenvalues)).reshape(len(scales), nvectors, m)
-        sqeigv1 = np.power(eigenvectors[:, 0, :], 2)
-        traces[i, :] = matrix.shape[-1] * (expeig * sqeigv1).sum(axis=-1).mean(axis=-1)
-    
-    return traces
\ No newline at end of file
+    for start in range(0, sketch_size, chunk_size):
+        basis = Q[:, start:start + chunk_size]
+        traces += _quadrature(matrix, m, functions, scales, reorthogonalize, basis).sum(axis=-1)
+    matvecs += sketch_size * m
+
+    for start in range(0, nvectors, chunk_size):
+        size = min(chunk_size, nvectors - start)
+        probes = np.random.randn(n, size)
+        probes -= Q @ (Q.T @ probes)
+        np.divide(probes, np.linalg.norm(probes, axis=0), out=probes)
+        # A uniform unit vector u of the (n - k)-dimensional complement satisfies E[u u^T] = (I - QQ^T) / (n - k).
+        traces += (n - sketch_size) * _quadrature(matrix, m, functions, scales, reorthogonalize, probes).sum(axis=-1) / nvectors
+    matvecs += nvectors * m
+
+    return traces, matvecs
+
+def segment_sums(X, offsets):
+    """Sums the rows of X within each segment of a block-diagonal stack.
+
+    Arguments:
+        X (np.ndarray): An (n x ...) array whose rows are grouped into contiguous non-empty segments.
+        offsets (np.ndarray): The first row of each segment.
+
+    Returns:
+        sums (np.ndarray): A (len(offsets) x ...) array of the sums of each segment.
+    """
+    return np.add.reduceat(X, offsets, axis=0)
+
+def lanczos_segmented(matrix, sizes, lanczos_steps, nvectors, reorthogonalize=True, start_vectors=None):
+    """Lanczos algorithm on a block-diagonal matrix, running an independent recurrence on each diagonal block.
+
+    All blocks share one sparse matrix product per step, while the inner products, normalizations and
+    reorthogonalizations are computed per block, so a batch of small graphs costs one SpMM per step.
+    Blocks smaller than the number of steps exhaust their Krylov subspace early, after which they continue
+    with zero vectors and decoupled zero blocks in T, which get zero quadrature weight.
+
+    Arguments:
+        matrix (spmatrix or LinearOperator): Sparse block-diagonal input matrix.
+        sizes (np.ndarray): The positive order of each diagonal block.
+        lanczos_steps (int): Number of Lanczos steps.
+        nvectors (int): Number of random vectors per block.
+        reorthogonalize (bool): If True, fully reorthogonalize each block against its Krylov basis.
+        start_vectors (np.ndarray): Optional (n x nvectors) starting vectors, random Gaussian vectors by default.
+
+    Returns:
+        T (np.ndarray): A (len(sizes) x nvectors x m x m) tensor of symmetric tridiagonal matrices.
+    """
+    sizes = np.asarray(sizes)
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    segments = np.repeat(np.arange(len(sizes)), sizes)
+    if start_vectors is None:
+        start_vectors = np.random.randn(matrix.shape[0], nvectors)
+    vectors = np.array(start_vectors, dtype=np.float64)
+    vectors /= np.sqrt(segment_sums(vectors * vectors, offsets))[segments]
+
+    T = np.zeros((len(sizes), nvectors, lanczos_steps, lanczos_steps))
+    old_vectors = np.zeros_like(vectors)
+    beta = np.zeros((len(sizes), nvectors))
+    if reorthogonalize:
+        V = np.zeros((matrix.shape[0], lanczos_steps, nvectors))
+
+    for i in range(lanczos_steps):
+        if reorthogonalize:
+            V[:, i, :] = vectors
+        w = spmm(matrix, vectors)
+        alpha = segment_sums(w * vectors, offsets)
+        T[:, :, i, i] = alpha
+        if i == lanczos_steps - 1:
+            break
+        w -= alpha[segments] * vectors
+        w -= beta[segments] * old_vectors
+        if reorthogonalize:
+            t = segment_sums(V[:, :i + 1, :] * w[:, None, :], offsets)
+            w -= np.einsum('ijk,ijk->ik', V[:, :i + 1, :], t[segments])
+
+        beta = np.sqrt(segment_sums(w * w, offsets))
+        # Blocks whose Krylov subspace is exhausted continue with zero vectors instead of dividing by zero.
+        beta[beta <= 1e-6] = 0
+        T[:, :, i, i + 1] = beta
+        T[:, :, i + 1, i] = beta
+        np.divide(w, beta[segments], out=w, where=beta[segments] > 0)
+        w[beta[segments] == 0] = 0
+        old_vectors, vectors = vectors, w
+
+    return T
@@ -2,7 +2,8 @@
 import numpy as np 
 from igraph import Graph
 import scipy.sparse
-from scipy.sparse.base import spmatrix
+from scipy.sparse import spmatrix
+from utils import graphMatrix
 
 def laplacian(adjacency, normalized = True):
     """Computes the sparse Laplacian matrix given sparse adjacency matrix as input.
@@ -24,13 +25,20 @@ def laplacian(adjacency, normalized = True):
     return scipy.sparse.eye(adjacency.shape[0], dtype=np.float32) - degree @ adjacency @ degree
 
 def get_adjacency(graph):
-    vcount = graph.vcount()
-    adjacency = scipy.sparse.dok_matrix((vcount, vcount), dtype=np.float32)
-    for e in graph.get_edgelist():
-        adjacency[e[0], e[1]] = 1
-        adjacency[e[1], e[0]] = 1
-    # Convert to the compressed sparse row format for efficiency.
-    adjacency = adjacency.tocsr()
-    adjacency.data = np.ones(adjacency.data.shape, dtype=np.float32) # Set all elements to one in case of duplicate rows.
+    """Gets the binary sparse adjacency matrix used by SLaQ.
 
-    return adjacency
\ No newline at end of file
+    Args:
+        graph (igraph.Graph, ArrayGraph or spmatrix): Input graph, or its prebuilt adjacency matrix which is used as given.
+
+    Returns:
+        csr_matrix: Sparse float32 adjacency matrix of the graph.
+    """
+    if scipy.sparse.issparse(graph):
+        return scipy.sparse.csr_matrix(graph, dtype=np.float32)
+    adjacency = graphMatrix.get_adjacency(graph, dtype=np.float32)
+    if np.any(adjacency.data != 1):
+        # Set all elements to one in case of multiple edges, on a copy since the cached matrix is shared.
+        adjacency = adjacency.copy()
+        adjacency.data = np.ones(adjacency.data.shape, dtype=np.float32)
+
+    return adjacency
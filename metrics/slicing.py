@@ -0,0 +1,214 @@
+"""Exact spectra of sparse symmetric matrices by spectrum slicing with shifted factorizations."""
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.sparse
+from scipy.linalg import eigvalsh
+from scipy.sparse.linalg import eigsh
+from scipy.sparse.linalg import LinearOperator
+from scipy.sparse.linalg import ArpackError
+from scipy.sparse.linalg import ArpackNoConvergence
+from scipy.sparse.linalg import splu
+from utils.graphMatrix import LaplacianOperator
+
+# The matrix of the current worker process, set once by _init_worker.
+_worker_matrix = None
+
+# Relative jitter of the shifts, so that they avoid the integer and half-integer eigenvalues common in graph spectra.
+SHIFT_JITTER = 1e-7 * np.pi
+
+def _init_worker(matrix):
+    global _worker_matrix
+    _worker_matrix = matrix
+
+def _worker_inertia(sigma):
+    return inertia(_worker_matrix, sigma)
+
+def _worker_slice(lower, upper, count, below, max_count):
+    return slice_eigenvalues(_worker_matrix, lower, upper, count, below, max_count)
+
+def __csc(laplacian):
+    if isinstance(laplacian, LaplacianOperator):
+        return laplacian.tocsr().tocsc()
+    return scipy.sparse.csc_matrix(laplacian, dtype=np.float64)
+
+def __factorize(matrix, shift):
+    # symmetric pivoting on the minimum degree ordering of A + A^T, both for the inertia and the shift-invert solves,
+    # keeps the fill-in and the factorization time of graph Laplacians an order of magnitude below SuperLU's defaults
+    identity = scipy.sparse.identity(matrix.shape[0], dtype=np.float64, format='csc')
+    return splu((matrix - shift * identity).tocsc(), permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0,
+                options=dict(SymmetricMode=True))
+
+def inertia(matrix, sigma, retries=3):
+    """Count the eigenvalues of a sparse symmetric matrix below sigma.
+
+    The factorization P (A - sigma I) P^T = L U uses the same row and column permutation and no pivoting
+    (diag_pivot_thresh=0), so U = D L^T and by Sylvester's law of inertia the number of negative eigenvalues
+    of A - sigma I is the number of negative entries of D. If SuperLU still deviates from the diagonal,
+    sigma is nudged upwards and the factorization retried.
+
+    Arguments:
+        matrix (spmatrix): the symmetric matrix
+        sigma (float): the shift
+        retries (int): the number of nudged factorizations tried
+
+    Returns:
+        count (int): the number of eigenvalues strictly below sigma
+    """
+    matrix = scipy.sparse.csc_matrix(matrix, dtype=np.float64)
+    scale = max(abs(sigma), 1.0)
+    for attempt in range(retries + 1):
+        shift = sigma + attempt * SHIFT_JITTER * scale
+        try:
+            lu = __factorize(matrix, shift)
+        except RuntimeError: # exactly singular
+            continue
+        if np.array_equal(lu.perm_r, lu.perm_c):
+            return int((lu.U.diagonal() < 0).sum())
+    raise ValueError("Cannot compute a symmetric LDL^T factorization at shift", sigma)
+
+def __lanczos(matrix, sigma, k):
+    # the k eigenvalues nearest to sigma, fewer if the Krylov space of a spectrum with few distinct eigenvalues is exhausted
+    lu = __factorize(matrix, sigma)
+    inverse = LinearOperator(matrix.shape, matvec=lu.solve, dtype=np.float64)
+    while True:
+        try:
+            return eigsh(matrix, k, sigma=sigma, which='LM', OPinv=inverse, return_eigenvectors=False)
+        except ArpackNoConvergence as error:
+            if len(error.eigenvalues) > 0 or k == 1:
+                return np.real(error.eigenvalues)
+        except ArpackError:
+            if k == 1:
+                raise
+        k = max(1, k // 2)
+
+def __multiplicities(matrix, values, lower, upper, below_lower, below_upper, resolution):
+    # split [lower, upper) between the distinct eigenvalues found until every part holds one value, whose multiplicity
+    # is then the difference of the inertias just around it, the eigenvalues of the part that were missed are solved again
+    count = below_upper - below_lower
+    if count == 0:
+        return np.zeros(0)
+    if len(values) == count:
+        return values
+    if len(values) == 0:
+        return slice_eigenvalues(matrix, lower, upper, count, below_lower)
+    if len(values) == 1:
+        value = values[0]
+        below_value, above_value = inertia(matrix, value - resolution), inertia(matrix, value + resolution)
+        return np.concatenate((__multiplicities(matrix, values[:0], lower, value - resolution, below_lower, below_value, resolution),
+                               np.full(above_value - below_value, value),
+                               __multiplicities(matrix, values[:0], value + resolution, upper, above_value, below_upper, resolution)))
+    middle = len(values) // 2
+    split = (values[middle - 1] + values[middle]) / 2
+    below_split = inertia(matrix, split)
+    return np.concatenate((__multiplicities(matrix, values[:middle], lower, split, below_lower, below_split, resolution),
+                           __multiplicities(matrix, values[middle:], split, upper, below_split, below_upper, resolution)))
+
+def slice_eigenvalues(matrix, lower, upper, count, below=None, max_count=1000):
+    """Compute the 'count' eigenvalues of a sparse symmetric matrix in [lower, upper) by shift-invert Lanczos.
+
+    Shifting to the middle of the slice makes the eigenvalues of the slice the nearest ones. Lanczos finds few copies
+    of a multiple eigenvalue (graph Laplacians have eigenvalues such as 1 with multiplicities in the thousands), so when
+    fewer than 'count' are found, the slice is split between the distinct eigenvalues and the multiplicity of each one
+    is counted by inertia.
+
+    Arguments:
+        matrix (spmatrix): the symmetric matrix
+        lower (float): the lower end of the slice
+        upper (float): the upper end of the slice
+        count (int): the number of eigenvalues in the slice, from the inertia at both ends
+        below (int): the number of eigenvalues below 'lower', computed if None and needed
+        max_count (int): the maximum number of eigenvalues requested from Lanczos
+
+    Returns:
+        eigenvalues (np.ndarray): the eigenvalues of the slice in ascending order
+    """
+    n = matrix.shape[0]
+    if count == 0:
+        return np.zeros(0)
+    sigma = (lower + upper) / 2 + SHIFT_JITTER * (upper - lower)
+    k = min(count, max_count) + max(4, min(count, max_count) // 10)
+    if k >= n - 1:
+        eigenvalues = eigvalsh(matrix.toarray())
+    else:
+        eigenvalues = __lanczos(matrix, sigma, k)
+    eigenvalues = np.sort(eigenvalues)
+    inside = eigenvalues[(eigenvalues >= lower) & (eigenvalues < upper)]
+    if len(inside) >= count:
+        # keep the 'count' eigenvalues closest to the shift if rounding moved one across an end
+        nearest = np.argsort(np.abs(inside - sigma), kind='stable')[:count]
+        return np.sort(inside[nearest])
+
+    # merge the copies of multiple eigenvalues that were found, then recover the missing ones
+    resolution = 1e-9 * max(abs(lower), abs(upper), 1.0)
+    distinct = inside[np.concatenate(([True], np.diff(inside) > resolution))] if len(inside) > 0 else inside
+    if below is None:
+        below = inertia(matrix, lower)
+    return __multiplicities(matrix, distinct, lower, upper, below, below + count, resolution)
+
+def __upper_bound(matrix, laplacian):
+    if isinstance(laplacian, LaplacianOperator):
+        return laplacian.gershgorin_bounds()[1]
+    # Gershgorin discs of a general symmetric matrix
+    absolute = abs(matrix)
+    return float((absolute.sum(axis=1).A1 - absolute.diagonal() + matrix.diagonal()).max())
+
+def sliced_spectrum(laplacian, slice_size=1000, workers=1):
+    """Compute all eigenvalues of a sparse symmetric positive semi-definite matrix by spectrum slicing.
+
+    The spectrum lies in [0, b], b the Gershgorin bound (2 * max_degree for the combinatorial Laplacian).
+    The interval is cut by jittered shifts, the number of eigenvalues per slice is counted by the inertia of the
+    shifted factorizations, crowded slices are bisected until they hold at most 'slice_size' eigenvalues,
+    and every slice is then solved independently by shift-invert Lanczos. Both the inertia counts and the
+    slices are spread over a process pool.
+
+    Arguments:
+        laplacian (spmatrix or LaplacianOperator): the Laplacian matrix
+        slice_size (int): the maximum number of eigenvalues solved at once
+        workers (int): the number of worker processes, 1 computes everything in the calling process
+
+    Returns:
+        eigenvalues (np.ndarray): the eigenvalues in ascending order
+    """
+    matrix = __csc(laplacian)
+    n = matrix.shape[0]
+    if n <= slice_size:
+        return eigvalsh(matrix.toarray())
+    upper = __upper_bound(matrix, laplacian)
+    margin = 1e-8 * max(upper, 1.0)
+    lower, upper = -margin, upper * (1 + 1e-9) + margin
+    resolution = 1e-6 * upper
+
+    executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(matrix,)) if workers > 1 else None
+    try:
+        def counts(shifts):
+            if executor is None:
+                return [inertia(matrix, sigma) for sigma in shifts]
+            return list(executor.map(_worker_inertia, shifts))
+
+        # the eigenvalue counts below each shift, the ends are known without factorization
+        nslices = -(-n // slice_size)
+        shifts = np.linspace(lower, upper, nslices + 1)
+        shifts[1:-1] += SHIFT_JITTER * upper
+        below = [0] + counts(shifts[1:-1]) + [n]
+        while True:
+            # a slice narrower than the resolution holds one multiple eigenvalue and cannot be split further
+            crowded = [i for i in range(len(shifts) - 1)
+                       if below[i + 1] - below[i] > slice_size and shifts[i + 1] - shifts[i] > resolution]
+            if len(crowded) == 0:
+                break
+            middles = [(shifts[i] + shifts[i + 1]) / 2 + SHIFT_JITTER * (shifts[i + 1] - shifts[i]) for i in crowded]
+            for i, sigma, count in sorted(zip(crowded, middles, counts(middles)), reverse=True):
+                shifts = np.insert(shifts, i + 1, sigma)
+                below.insert(i + 1, count)
+
+        slices = [(shifts[i], shifts[i + 1], below[i + 1] - below[i], below[i], slice_size)
+                  for i in range(len(shifts) - 1) if below[i + 1] > below[i]]
+        if executor is None:
+            spectra = [slice_eigenvalues(matrix, *item) for item in slices]
+        else:
+            spectra = list(executor.map(_worker_slice, *zip(*slices)))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return np.concatenate(spectra)
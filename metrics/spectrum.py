@@ -0,0 +1,265 @@
+"""Exact Laplacian spectra with automatic backend selection."""
+import os
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np 
+from scipy.linalg import eigvalsh
+from scipy.sparse import issparse
+from scipy.sparse.linalg import eigsh
+from utils.graphMatrix import LaplacianOperator
+from metrics.slicing import sliced_spectrum
+
+# Bytes needed per matrix entry by the dense backend: the float64 matrix plus LAPACK's workspace.
+DENSE_BYTES_PER_ENTRY = 2 * 8
+
+# Components up to this order are solved together by a batched dense eigvalsh, grouped by order.
+SMALL_COMPONENT = 256
+
+def available_memory():
+    """Get the memory currently available to the process.
+
+    Returns:
+        memory (int): the available memory in bytes, or None if it cannot be determined
+    """
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def dense_memory(n):
+    """Estimate the peak memory of the dense backend on an n x n matrix.
+
+    Arguments:
+        n (int): the order of the matrix
+
+    Returns:
+        memory (int): the estimated peak memory in bytes
+    """
+    return DENSE_BYTES_PER_ENTRY * n * n
+
+def select_backend(n, max_memory=None):
+    """Select the backend for the exact spectrum of an n x n Laplacian matrix.
+
+    Computing the full spectrum with ARPACK needs a Lanczos basis larger than the dense matrix
+    and is always slower than LAPACK, so the dense backend is selected whenever it fits in memory.
+
+    Arguments:
+        n (int): the order of the matrix, after isolated vertices have been removed
+        max_memory (int): the memory budget in bytes, by default the available memory
+
+    Returns:
+        backend (str): 'dense', or None if no exact backend fits in the memory budget
+    """
+    if max_memory is None:
+        max_memory = available_memory()
+    if max_memory is None or dense_memory(n) <= max_memory:
+        return 'dense'
+    return None
+
+def __dense_spectrum(laplacian):
+    if issparse(laplacian) or isinstance(laplacian, LaplacianOperator):
+        laplacian = laplacian.toarray()
+    return eigvalsh(np.asarray(laplacian, dtype=np.float64), overwrite_a=True, check_finite=False)
+
+def __sparse_spectrum(laplacian):
+    # ARPACK cannot return all n eigenvalues, the missing one is recovered from the trace
+    n = laplacian.shape[0]
+    if n < 3:
+        return __dense_spectrum(laplacian)
+    eigenvalues = eigsh(laplacian, n - 1, return_eigenvectors=False)
+    missing = laplacian.diagonal().sum() - eigenvalues.sum()
+    return np.sort(np.append(eigenvalues, missing))
+
+def laplacian_spectrum(laplacian, backend='auto', max_memory=None, workers=1):
+    """Compute all eigenvalues of a symmetric positive semi-definite (Laplacian) matrix.
+
+    Isolated vertices only contribute zero eigenvalues, so their empty rows are removed before solving.
+
+    Arguments:
+        laplacian (spmatrix, np.ndarray or LaplacianOperator): the Laplacian matrix, an operator is only materialized by the dense backend
+        backend (str): 'auto', 'dense' (LAPACK eigvalsh), 'sparse' (ARPACK eigsh)
+            or 'slicing' (shift-invert spectrum slicing, see metrics.slicing.sliced_spectrum)
+        max_memory (int): the memory budget in bytes for 'auto', by default the available memory
+        workers (int): the number of worker processes of the 'slicing' backend
+
+    Returns:
+        eigenvalues (np.ndarray): the eigenvalues in ascending order
+
+    Raises:
+        MemoryError: if backend is 'auto' and the dense matrix does not fit in the memory budget
+    """
+    n = laplacian.shape[0]
+    diagonal = laplacian.diagonal()
+    active = np.flatnonzero(diagonal)
+    if len(active) < n:
+        if isinstance(laplacian, LaplacianOperator):
+            laplacian = laplacian.restrict(active)
+        else:
+            if issparse(laplacian):
+                laplacian = laplacian.tocsr()
+            laplacian = laplacian[active][:, active]
+
+    if backend == 'auto':
+        backend = select_backend(len(active), max_memory)
+        if backend is None:
+            raise MemoryError(f"the dense {len(active)} x {len(active)} Laplacian needs about {dense_memory(len(active)) / 2 ** 30:.1f} GiB, "
+                              "use an estimator such as SLaQ instead")
+
+    if len(active) == 0:
+        eigenvalues = np.zeros(0)
+    elif backend == 'dense':
+        eigenvalues = __dense_spectrum(laplacian)
+    elif backend == 'sparse':
+        eigenvalues = __sparse_spectrum(laplacian)
+    elif backend == 'slicing':
+        eigenvalues = sliced_spectrum(laplacian, workers=workers)
+    else:
+        raise ValueError(f"Unknown backend: expected one of ['auto', 'dense', 'sparse', 'slicing'], got {backend}")
+
+    return np.concatenate((np.zeros(n - len(active)), eigenvalues))
+
+
+class SpectrumCache(object):
+    """A bounded LRU cache of the spectra of connected components, keyed by a digest of the component's Laplacian.
+
+    The key covers the kind, the scaling, the degrees and the CSR arrays of the component in its vertex order,
+    so a component whose edges are unchanged is found again after other components of the graph have been edited.
+
+    Arguments:
+        maxsize (int): the maximum number of spectra kept
+    """
+    def __init__(self, maxsize=4096):
+        self.__maxsize = maxsize
+        self.__entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, laplacian):
+        """Get the digest of a LaplacianOperator or a sparse Laplacian matrix."""
+        digest = hashlib.blake2b(digest_size=16)
+        if isinstance(laplacian, LaplacianOperator):
+            digest.update(repr((laplacian.kind, float(laplacian.factor), float(laplacian.isolated))).encode())
+            digest.update(np.ascontiguousarray(laplacian.degree, dtype=np.float64).tobytes())
+            matrix = laplacian.adjacency
+        else:
+            matrix = laplacian.tocsr()
+        if not matrix.has_sorted_indices:
+            matrix = matrix.sorted_indices()
+        digest.update(repr(matrix.shape).encode())
+        for array in (matrix.indptr, matrix.indices, matrix.data):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.digest()
+
+    def get(self, key):
+        eigenvalues = self.__entries.get(key)
+        if eigenvalues is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__entries.move_to_end(key)
+        return eigenvalues
+
+    def put(self, key, eigenvalues):
+        self.__entries[key] = eigenvalues
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.__maxsize:
+            self.__entries.popitem(last=False)
+
+    def clear(self):
+        self.__entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+spectrum_cache = SpectrumCache()
+
+def _stacked_spectra(stack):
+    # the eigenvalues of a (count x order x order) stack of dense Laplacians, one LAPACK call per matrix inside numpy
+    return np.linalg.eigvalsh(stack)
+
+def _component_spectrum(laplacian, backend, max_memory):
+    return laplacian_spectrum(laplacian, backend, max_memory)
+
+def component_spectrum(laplacian, membership, backend='auto', max_memory=None, workers=1, cache=spectrum_cache):
+    """Compute all eigenvalues of a block-diagonal Laplacian as the union of the spectra of its connected components.
+
+    Components of at most SMALL_COMPONENT vertices are materialized and solved by batched dense eigvalsh calls,
+    one stack per component order, and larger components by laplacian_spectrum, which only has to fit the largest
+    component in memory. With several workers, the stacks and all large components but the largest are solved
+    in a process pool while the calling process solves the largest component.
+
+    Arguments:
+        laplacian (spmatrix or LaplacianOperator): the Laplacian matrix, scaled by a global factor for 'density'
+        membership (np.ndarray): the connected component of every vertex, e.g. graph.components().membership
+        backend (str): the backend of the large components, see laplacian_spectrum
+        max_memory (int): the memory budget in bytes of each large component, by default the available memory
+        workers (int): the number of worker processes, 1 solves every component in the calling process
+        cache (SpectrumCache): the cache of component spectra, None to disable caching
+
+    Returns:
+        eigenvalues (np.ndarray): the eigenvalues in ascending order
+    """
+    membership = np.asarray(membership, dtype=np.int64)
+    order = np.argsort(membership, kind='stable')
+    sizes = np.bincount(membership)
+    sizes = sizes[sizes > 0]
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    if issparse(laplacian):
+        laplacian = laplacian.tocsr()
+
+    # a single vertex only contributes its diagonal entry, which is zero without a self-loop
+    diagonal = laplacian.diagonal()
+    spectra = [diagonal[order[starts[sizes == 1]]]]
+    small = dict()
+    large = []
+    for start, size in zip(starts[sizes > 1], sizes[sizes > 1]):
+        indices = order[start:start + size]
+        if isinstance(laplacian, LaplacianOperator):
+            component = laplacian.restrict(indices)
+        else:
+            component = laplacian[indices][:, indices]
+        key = cache.key(component) if cache is not None else None
+        eigenvalues = cache.get(key) if cache is not None else None
+        if eigenvalues is not None:
+            spectra.append(eigenvalues)
+        elif size <= SMALL_COMPONENT:
+            small.setdefault(int(size), []).append((key, component))
+        else:
+            large.append((key, component))
+
+    stacks = [(size, [key for key, _ in items], np.stack([component.toarray() for _, component in items]))
+              for size, items in small.items()]
+    large.sort(key=lambda item: item[1].shape[0], reverse=True)
+    solved = []
+    if workers is not None and workers > 1 and len(stacks) + len(large) > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            stack_futures = [(keys, executor.submit(_stacked_spectra, stack)) for _, keys, stack in stacks]
+            large_futures = [(key, executor.submit(_component_spectrum, component, backend, max_memory))
+                             for key, component in large[1:]]
+            if len(large) > 0:
+                solved.append((large[0][0], laplacian_spectrum(large[0][1], backend, max_memory)))
+            for keys, future in stack_futures:
+                solved.extend(zip(keys, future.result()))
+            for key, future in large_futures:
+                solved.append((key, future.result()))
+    else:
+        for _, keys, stack in stacks:
+            solved.extend(zip(keys, _stacked_spectra(stack)))
+        for key, component in large:
+            solved.append((key, laplacian_spectrum(component, backend, max_memory)))
+
+    for key, eigenvalues in solved:
+        if cache is not None:
+            cache.put(key, eigenvalues)
+        spectra.append(eigenvalues)
+    return np.sort(np.concatenate(spectra))
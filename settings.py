@@ -38,4 +38,17 @@ LOGGING_SETTINGS = {
             'level': 'DEBUG'
         }
     }
-}
\ No newline at end of file
+}
+
+# the persistent result cache of the metrics, see 'utils.resultCache.ResultCache'
+# it is disabled by default; bump 'version' to invalidate every stored result, e.g. after changing a metric
+CACHE_SETTINGS = {
+    'directory': 'cache',
+    'max_bytes': 1024 * 1024 * 1024,
+    'min_seconds': 0.5,
+    'enabled': False,
+    'version': 1
+}
+
+# the directory of the binary CSR sidecars of the datasets, see 'utils.graphIO.read_csr'
+CSR_CACHE_DIRECTORY = 'cache/csr'
@@ -0,0 +1,289 @@
+from itertools import chain
+import numpy as np
+import scipy.sparse
+from igraph import Graph
+
+def get_edge_array(graph):
+    """Get the edges of a graph as an integer array, without building per-edge Python tuples in Python code.
+
+    Arguments:
+        graph (igraph.Graph or ArrayGraph): the graph
+
+    Returns:
+        edges (np.ndarray): a (m x 2) array of endpoint indices
+    """
+    if isinstance(graph, ArrayGraph):
+        return graph.edges()
+    m = graph.ecount()
+    edges = np.fromiter(chain.from_iterable(graph.get_edgelist()), dtype=np.int64, count=2 * m)
+    return edges.reshape((m, 2))
+
+def adjacency_from_edges(edges, vcount, weights=None, dtype=np.float64):
+    """Build the symmetric adjacency matrix of an undirected graph from its edge array.
+
+    Arguments:
+        edges (np.ndarray): a (m x 2) array of endpoint indices
+        vcount (int): the number of vertices
+        weights (np.ndarray): the weight of each edge, by default all ones
+        dtype (np.dtype): the dtype of the matrix
+
+    Returns:
+        A (csr_matrix): the adjacency matrix, multiple edges are summed and self-loops appear once on the diagonal
+    """
+    edges = np.asarray(edges, dtype=np.int64).reshape((-1, 2))
+    if weights is None:
+        weights = np.ones(len(edges), dtype=dtype)
+    weights = np.asarray(weights, dtype=dtype)
+
+    loops = edges[:, 0] == edges[:, 1]
+    row = np.concatenate((edges[:, 0], edges[~loops, 1]))
+    col = np.concatenate((edges[:, 1], edges[~loops, 0]))
+    data = np.concatenate((weights, weights[~loops]))
+    A = scipy.sparse.coo_matrix((data, (row, col)), shape=(vcount, vcount), dtype=dtype).tocsr()
+    return A
+
+def edge_keys(sources, targets):
+    """Encode undirected edges as int64 keys (min << 32) | max, equal for (u, v) and (v, u)."""
+    sources, targets = np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64)
+    return (np.minimum(sources, targets) << 32) | np.maximum(sources, targets)
+
+class ArrayGraph(object):
+    """An undirected (multi)graph held in NumPy arrays, for the metrics on graphs too large for per-edge Python objects.
+
+    The edges and their optional weights are stored in arrays grown by doubling, so batches of edges are appended
+    in amortized O(batch) time, and the degree and strength vectors are updated by one bincount per batch.
+    The adjacency matrix (CSR) and the sorted edge keys used for O(log m) membership tests are built on first use;
+    appended batches are merged into them rather than rebuilding them.
+
+    The class mirrors the igraph methods the metrics rely on (vcount, ecount, degree, strength, is_directed,
+    are_adjacent), and every helper of 'utils.graphMatrix' accepts it. A graph built from a CSR matrix keeps
+    that matrix as its adjacency matrix without copying, e.g. the memory-mapped arrays of 'utils.graphIO.read_csr'.
+
+    Arguments:
+        vcount (int): the number of vertices
+        edges (np.ndarray): a (m x 2) array of endpoint indices
+        weights (np.ndarray): the weight of each edge, None for an unweighted graph
+        labels (np.ndarray): the label of every vertex, None if the vertices have none
+    """
+    __slots__ = ('__weakref__', '__vcount', '__ecount', '__edges', '__weights', '__degree', '__strength',
+                 '__keys', '__pending_keys', '__adjacency', '__version', 'labels')
+
+    def __init__(self, vcount=0, edges=None, weights=None, labels=None):
+        self.__vcount = int(vcount)
+        self.__ecount = 0
+        self.__edges = np.zeros((0, 2), dtype=np.int64)
+        self.__weights = None
+        self.__degree = np.zeros(self.__vcount, dtype=np.int64)
+        self.__strength = None
+        self.__keys = None
+        self.__pending_keys = []
+        self.__adjacency = None
+        self.__version = 0
+        self.labels = labels
+        if edges is not None:
+            self.add_edges(edges, weights)
+
+    @classmethod
+    def from_igraph(cls, graph, weights=None):
+        """Convert an undirected igraph graph, reading its edge list once.
+
+        Arguments:
+            graph (igraph.Graph): the undirected graph
+            weights (str or np.ndarray): the name of the edge attribute holding the weights, or the weights themselves
+
+        Returns:
+            graph (ArrayGraph): the converted graph, labelled by the 'name' vertex attribute if any
+        """
+        if isinstance(weights, str):
+            weights = graph.es[weights]
+        labels = np.array(graph.vs['name'], dtype=str) if 'name' in graph.vs.attributes() else None
+        return cls(graph.vcount(), get_edge_array(graph), weights, labels)
+
+    @classmethod
+    def from_csr(cls, adjacency, labels=None, multiplicities=False):
+        """Wrap a symmetric adjacency matrix, which is kept without copying as the adjacency matrix of the graph.
+
+        By default every non-zero of the upper triangle becomes one edge whose weight is the entry, so multiple edges
+        stored as counts become one weighted edge, and the graph is unweighted if all entries are 1. With
+        'multiplicities', the entries are the edge counts of an unweighted multigraph and an entry k becomes
+        k parallel edges, so the degrees and the edge count are those of the multigraph.
+
+        Arguments:
+            adjacency (spmatrix): the symmetric adjacency matrix, e.g. from 'utils.graphIO.read_csr'
+            labels (np.ndarray): the label of every vertex
+            multiplicities (bool): whether the entries are the (integer) multiplicities of unweighted edges
+
+        Returns:
+            graph (ArrayGraph): the graph
+        """
+        adjacency = scipy.sparse.csr_matrix(adjacency, dtype=np.float64, copy=False)
+        rows = np.repeat(np.arange(adjacency.shape[0], dtype=np.int64), np.diff(adjacency.indptr))
+        upper = adjacency.indices >= rows
+        edges = np.column_stack((rows[upper], adjacency.indices[upper]))
+        weights = np.asarray(adjacency.data[upper], dtype=np.float64)
+        if multiplicities:
+            counts = np.rint(weights).astype(np.int64)
+            if np.any(counts != weights) or np.any(counts < 0):
+                raise ValueError("Edge multiplicities must be non-negative integers")
+            edges, weights = np.repeat(edges, counts, axis=0), None
+        elif not np.any(weights != 1):
+            weights = None
+        graph = cls(adjacency.shape[0], edges, weights, labels)
+        graph.__adjacency = adjacency
+        return graph
+
+    def to_igraph(self):
+        """Convert to an undirected igraph graph, with the 'weight' edge attribute and the 'name' vertex attribute if set."""
+        g = Graph(n=self.__vcount, edges=self.edges(), directed=False)
+        if self.__weights is not None:
+            g.es['weight'] = self.weights().tolist()
+        if self.labels is not None:
+            g.vs['name'] = np.asarray(self.labels).tolist()
+        return g
+
+    def vcount(self):
+        return self.__vcount
+
+    def ecount(self):
+        return self.__ecount
+
+    def is_directed(self):
+        return False
+
+    def version(self):
+        """Get the number of edits (vertex or edge additions) so far, which identifies the content of the graph."""
+        return self.__version
+
+    def is_weighted(self):
+        return self.__weights is not None
+
+    def edges(self):
+        """Get the (m x 2) array of endpoint indices, a view that must not be modified."""
+        return self.__edges[:self.__ecount]
+
+    def weights(self):
+        """Get the weight of each edge, a view that must not be modified, None for an unweighted graph."""
+        if self.__weights is None:
+            return None
+        return self.__weights[:self.__ecount]
+
+    def degree(self):
+        """Get the number of edge endpoints at every vertex, a self-loop counting twice as in igraph."""
+        return self.__degree
+
+    def strength(self, weights=None):
+        """Get the sum of the incident edge weights of every vertex, a self-loop counting twice as in igraph.
+
+        Arguments:
+            weights (str or np.ndarray): None for the degrees, any attribute name for the stored weights
+                (all ones in an unweighted graph), or the weights themselves
+        """
+        if weights is None:
+            return self.__degree
+        if isinstance(weights, str):
+            return self.__degree.astype(np.float64) if self.__strength is None else self.__strength
+        return np.bincount(self.edges().ravel(), weights=np.repeat(np.asarray(weights, dtype=np.float64), 2),
+                           minlength=self.__vcount)
+
+    def adjacency(self):
+        """Get the float64 adjacency matrix of the stored weights, shared and not to be modified in place."""
+        if self.__adjacency is None:
+            self.__adjacency = adjacency_from_edges(self.edges(), self.__vcount, self.weights())
+        return self.__adjacency
+
+    def neighbors(self, v):
+        """Get the neighbors of a vertex from the adjacency matrix, each listed once."""
+        adjacency = self.adjacency()
+        return adjacency.indices[adjacency.indptr[v]:adjacency.indptr[v + 1]]
+
+    def __sorted_keys(self):
+        if self.__keys is None:
+            self.__keys = np.sort(edge_keys(self.edges()[:, 0], self.edges()[:, 1]))
+        elif len(self.__pending_keys) > 0:
+            # the stable sort merges the sorted runs in linear time
+            self.__keys = np.sort(np.concatenate([self.__keys] + self.__pending_keys), kind='stable')
+        self.__pending_keys = []
+        return self.__keys
+
+    def has_edges(self, sources, targets):
+        """Test whether the undirected edges (sources[i], targets[i]) exist, by binary search in the sorted edge keys."""
+        keys = self.__sorted_keys()
+        queries = edge_keys(sources, targets)
+        if len(keys) == 0:
+            return np.zeros(queries.shape, dtype=bool)
+        if queries.size > 1:
+            # sorted queries walk the keys in order, random ones miss the cache on every probe
+            order = np.argsort(queries, axis=None)
+            positions = np.empty(queries.size, dtype=np.int64)
+            positions[order] = np.searchsorted(keys, queries.ravel()[order])
+            positions = positions.reshape(queries.shape)
+        else:
+            positions = np.searchsorted(keys, queries)
+        positions = np.minimum(positions, len(keys) - 1)
+        return keys[positions] == queries
+
+    def are_adjacent(self, u, v):
+        return bool(self.has_edges(u, v))
+
+    are_connected = are_adjacent
+
+    def add_vertices(self, count=1):
+        """Add isolated vertices, whose indices follow the existing ones."""
+        self.__vcount += count
+        self.__version += 1
+        self.__degree = np.append(self.__degree, np.zeros(count, dtype=np.int64))
+        if self.__strength is not None:
+            self.__strength = np.append(self.__strength, np.zeros(count))
+        if self.__adjacency is not None:
+            adjacency = self.__adjacency
+            self.__adjacency = scipy.sparse.csr_matrix((adjacency.data, adjacency.indices,
+                                                        np.append(adjacency.indptr, [adjacency.indptr[-1]] * count)),
+                                                       shape=(self.__vcount, self.__vcount))
+
+    def add_edges(self, edges, weights=None):
+        """Append a batch of undirected edges.
+
+        Arguments:
+            edges (np.ndarray): a (k x 2) array of endpoint indices, below vcount
+            weights (np.ndarray): the weight of each edge, all ones if None
+        """
+        edges = np.asarray(edges, dtype=np.int64).reshape((-1, 2))
+        count = len(edges)
+        if count == 0:
+            return
+        if edges.min() < 0 or edges.max() >= self.__vcount:
+            raise ValueError("Edge endpoints must be vertex indices below", self.__vcount)
+        if self.__vcount > 1 << 31:
+            raise ValueError("Too many vertices for 64-bit edge keys:", self.__vcount)
+        if weights is not None:
+            weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), (count,))
+            if self.__weights is None:
+                self.__weights = np.ones(len(self.__edges), dtype=np.float64)
+                self.__strength = self.__degree.astype(np.float64)
+        elif self.__weights is not None:
+            weights = np.ones(count, dtype=np.float64)
+
+        start, stop = self.__ecount, self.__ecount + count
+        if stop > len(self.__edges):
+            capacity = max(stop, 2 * len(self.__edges))
+            grown = np.empty((capacity, 2), dtype=np.int64)
+            grown[:start] = self.__edges[:start]
+            self.__edges = grown
+            if self.__weights is not None:
+                grown = np.empty(capacity, dtype=np.float64)
+                grown[:start] = self.__weights[:start]
+                self.__weights = grown
+        self.__edges[start:stop] = edges
+        if weights is not None:
+            self.__weights[start:stop] = weights
+        self.__ecount = stop
+        self.__version += 1
+
+        endpoints = edges.ravel()
+        self.__degree += np.bincount(endpoints, minlength=self.__vcount)
+        if self.__strength is not None:
+            self.__strength += np.bincount(endpoints, weights=np.repeat(weights, 2), minlength=self.__vcount)
+        if self.__keys is not None:
+            self.__pending_keys.append(np.sort(edge_keys(edges[:, 0], edges[:, 1])))
+        if self.__adjacency is not None:
+            self.__adjacency = (self.__adjacency + adjacency_from_edges(edges, self.__vcount, weights)).tocsr()
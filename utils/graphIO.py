@@ -1,6 +1,24 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
 import pandas as pd 
 from igraph import Graph
 import numpy as np 
+import scipy.sparse
+from utils.graphMatrix import get_adjacency
+from utils.arrayGraph import ArrayGraph
+import settings
+
+# The version of the binary CSR format, a sidecar of another version is rebuilt.
+CSR_FORMAT_VERSION = 3
+
+# The versions of a sidecar other than the published one are removed once left unmodified for this long, so that
+# readers still opening a replaced version and writers still filling an unpublished one are never disturbed.
+CSR_PRUNE_SECONDS = 60
 
 def read_edgelist(filepath, heads=['from', 'to', 'weight']):
     """Read a graph from its edgelist.
@@ -16,3 +34,316 @@ def read_edgelist(filepath, heads=['from', 'to', 'weight']):
     g = Graph.TupleList(df.values, directed=False, edge_attrs=heads[2:])
     g.simplify(combine_edges={'weight':sum})
     return g
+
+def __grow(array, size):
+    # extend an accumulator to at least 'size' entries, doubling to keep the number of copies logarithmic
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+def read_strengths(filepath, heads=['from', 'to', 'weight'], chunk_size=1 << 22, integer_labels=False):
+    """Read the strength and degree of every vertex from an edgelist, in chunks and without building a graph.
+
+    Vertex labels are mapped to dense integer ids chunk by chunk, the new sources of a chunk before its new targets.
+    Each chunk is factorized first, and its distinct labels are looked up in a pandas Index of the labels seen so far
+    with 'get_indexer', the new ones being appended to it. The strengths and degrees are accumulated with
+    'np.bincount', so the memory scales with the number of vertices and the chunk size, not the number of edges.
+    Self-loops are skipped as in read_edgelist. Multiple edges add up to the same strengths as their merged edge,
+    but they are counted once per line in the degrees, as deduplicating them would take memory linear in the
+    number of edges: the degrees are those of the multigraph, which read_edgelist simplifies.
+
+    Arguments:
+        filepath (str): filepath of the edgelist
+        heads (List[str]): titles of the leading columns, without 'weight' every edge has weight 1
+        chunk_size (int): the number of lines read at once
+        integer_labels (bool): parse the labels as int64, several times faster than strings for numeric edgelists,
+            labels with the same integer value such as '7' and '07' then being the same vertex
+
+    Returns:
+        strengths (np.ndarray): the weighted degree of every vertex
+        degrees (np.ndarray): the number of edges incident to every vertex
+        labels (List[str] or List[int]): the label of every vertex
+    """
+    weighted = 'weight' in heads
+    dtype = {name: np.int64 if integer_labels else 'str' for name in heads[:2]}
+    if weighted:
+        dtype['weight'] = np.float64
+    reader = pd.read_csv(filepath, sep=r'\s+', header=None, names=heads, usecols=range(len(heads)), dtype=dtype,
+                         chunksize=chunk_size)
+
+    labels = pd.Index([], dtype=np.int64 if integer_labels else object)
+    strengths = np.zeros(0, dtype=np.float64)
+    degrees = np.zeros(0, dtype=np.int64)
+    for chunk in reader:
+        codes, uniques = pd.factorize(np.concatenate((chunk[heads[0]].values, chunk[heads[1]].values)))
+        mapping = labels.get_indexer(uniques)
+        new = mapping < 0
+        mapping[new] = len(labels) + np.arange(new.sum())
+        labels = labels.append(pd.Index(uniques[new], dtype=labels.dtype))
+        endpoints = mapping[codes].reshape((2, -1))
+        weights = chunk['weight'].values if weighted else np.ones(len(chunk), dtype=np.float64)
+
+        keep = endpoints[0] != endpoints[1]
+        endpoints, weights = endpoints[:, keep].ravel(), np.tile(weights[keep], 2)
+        strengths = __grow(strengths, len(labels))
+        degrees = __grow(degrees, len(labels))
+        strengths[:len(labels)] += np.bincount(endpoints, weights=weights, minlength=len(labels))
+        degrees[:len(labels)] += np.bincount(endpoints, minlength=len(labels))
+
+    return strengths[:len(labels)], degrees[:len(labels)], labels.tolist()
+
+def read_shards(filepaths, heads=['from', 'to', 'weight'], chunk_size=1 << 22, workers=1, integer_labels=False):
+    """Read the strengths and degrees of every shard of an edgelist split across files, one shard per task.
+
+    Arguments:
+        filepaths (List[str]): filepaths of the shards
+        heads (List[str]): titles of the leading columns, see read_strengths
+        chunk_size (int): the number of lines read at once
+        workers (int): the number of worker processes, 1 reads every shard in the calling process
+        integer_labels (bool): parse the labels as int64, see read_strengths
+
+    Returns:
+        shards (List[tuple]): the (strengths, degrees, labels) of every shard, see read_strengths, in the order of filepaths
+    """
+    if workers == 1 or len(filepaths) <= 1:
+        return [read_strengths(filepath, heads, chunk_size, integer_labels) for filepath in filepaths]
+    with ProcessPoolExecutor(min(workers, len(filepaths))) as executor:
+        return list(executor.map(read_strengths, filepaths, [heads] * len(filepaths), [chunk_size] * len(filepaths),
+                                 [integer_labels] * len(filepaths)))
+
+def merge_strengths(shards):
+    """Merge the strengths and degrees of shards with their own vertex ids into global vectors.
+
+    Every shard numbers its vertices locally. The merge factorizes the concatenated local labels once, which maps
+    every local id to a global id, the vertices of the first shard keeping their ids, and sums the partial vectors
+    with 'np.bincount'. Only the labels cross process boundaries, never the edges.
+
+    Arguments:
+        shards (List[tuple]): the (strengths, degrees, labels) of every shard, e.g. from read_shards
+
+    Returns:
+        strengths (np.ndarray): the weighted degree of every vertex
+        degrees (np.ndarray): the number of edges incident to every vertex
+        labels (List[str]): the label of every vertex
+    """
+    if len(shards) == 0:
+        return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.int64), []
+    local_labels = np.empty(sum(len(labels) for _, _, labels in shards), dtype=object)
+    local_labels[:] = [label for _, _, labels in shards for label in labels]
+    codes, labels = pd.factorize(local_labels)
+    strengths = np.bincount(codes, weights=np.concatenate([strengths for strengths, _, _ in shards]), minlength=len(labels))
+    degrees = np.bincount(codes, weights=np.concatenate([degrees for _, degrees, _ in shards]), minlength=len(labels))
+    return strengths, np.rint(degrees).astype(np.int64), list(labels)
+
+def save_csr(directory, adjacency, labels=None, source=None, weighted=True, attributes=None):
+    """Save a sparse adjacency matrix in the binary CSR format, one .npy file per array and a JSON header.
+
+    Every save writes a new version into its own subdirectory, then atomically replaces the 'CURRENT' file naming
+    the published version, so readers never see a partial graph or the arrays of two versions, even while another
+    process saves the same graph. The other versions are removed after CSR_PRUNE_SECONDS without modification.
+
+    Arguments:
+        directory (str): the directory receiving the versions, each with indptr.npy, indices.npy, data.npy,
+            labels.npy, vertex-<name>.npy and header.json
+        adjacency (spmatrix): the symmetric adjacency matrix
+        labels (np.ndarray): the label of every vertex, stored as fixed-width unicode so that it can be memory-mapped
+        source (str): the filepath the graph was converted from, whose size and modification time are recorded
+        weighted (bool): whether the entries are weights, or the multiplicities of the edges of an unweighted multigraph
+        attributes (dict): vertex attributes, e.g. the 'id' and 'label' of a GML file, each a sequence with a value
+            per vertex stored as numbers or, if not numeric, as unicode
+    """
+    adjacency = scipy.sparse.csr_matrix(adjacency)
+    adjacency.sort_indices()
+    attributes = dict() if attributes is None else attributes
+    header = {'version': CSR_FORMAT_VERSION, 'shape': list(adjacency.shape), 'nnz': int(adjacency.nnz), 'weighted': bool(weighted),
+              'vertex_attributes': list(attributes)}
+    if source is not None:
+        stat = os.stat(source)
+        header.update(source_size=stat.st_size, source_mtime=stat.st_mtime)
+
+    os.makedirs(directory, exist_ok=True)
+    version = tempfile.mkdtemp(dir=directory, prefix='v-')
+    try:
+        np.save(os.path.join(version, 'indptr.npy'), adjacency.indptr.astype(np.int64))
+        np.save(os.path.join(version, 'indices.npy'), adjacency.indices.astype(np.int32))
+        np.save(os.path.join(version, 'data.npy'), adjacency.data.astype(np.float64))
+        if labels is not None:
+            np.save(os.path.join(version, 'labels.npy'), np.asarray(labels, dtype=str))
+        for name, values in attributes.items():
+            values = np.asarray(values)
+            np.save(os.path.join(version, f'vertex-{name}.npy'), values if values.dtype.kind in 'biuf' else values.astype(str))
+        with open(os.path.join(version, 'header.json'), 'w') as file:
+            json.dump(header, file)
+        descriptor, pointer = tempfile.mkstemp(dir=directory, prefix='.CURRENT-')
+        try:
+            with os.fdopen(descriptor, 'w') as file:
+                file.write(os.path.basename(version))
+            os.replace(pointer, os.path.join(directory, 'CURRENT'))
+        except BaseException:
+            os.unlink(pointer)
+            raise
+    except BaseException:
+        shutil.rmtree(version, ignore_errors=True)
+        raise
+    __prune(directory)
+
+def __current(directory):
+    # the directory of the published version, None if none is
+    try:
+        with open(os.path.join(directory, 'CURRENT')) as file:
+            return os.path.join(directory, file.read().strip())
+    except FileNotFoundError:
+        return None
+
+def __modified(version):
+    # the last modification time of a version or of any of its files, None if it was removed meanwhile
+    try:
+        with os.scandir(version) as entries:
+            return max([os.stat(version).st_mtime] + [entry.stat().st_mtime for entry in entries])
+    except FileNotFoundError:
+        return None
+
+def __prune(directory):
+    # remove the versions other than the published one that were left unmodified for CSR_PRUNE_SECONDS
+    current = __current(directory)
+    now = time.time()
+    with os.scandir(directory) as entries:
+        versions = [entry.path for entry in entries if entry.is_dir() and entry.name.startswith('v')]
+    for version in versions:
+        modified = __modified(version)
+        if version != current and modified is not None and now - modified > CSR_PRUNE_SECONDS:
+            shutil.rmtree(version, ignore_errors=True)
+
+def __load(directory):
+    # the memory-mapped arrays, labels, header and vertex attributes of the published version
+    version = __current(directory)
+    if version is None:
+        raise FileNotFoundError("No graph saved in", directory)
+    def load(name):
+        return np.load(os.path.join(version, name + '.npy'), mmap_mode='r')
+    with open(os.path.join(version, 'header.json')) as file:
+        header = json.load(file)
+    adjacency = scipy.sparse.csr_matrix((load('data'), load('indices'), load('indptr')), shape=tuple(header['shape']), copy=False)
+    labels = load('labels') if os.path.exists(os.path.join(version, 'labels.npy')) else None
+    attributes = {name: load(f'vertex-{name}') for name in header.get('vertex_attributes', [])}
+    return adjacency, labels, header, attributes
+
+def load_csr(directory):
+    """Load the graph published by save_csr on top of read-only memory maps, without copying the arrays.
+
+    Returns:
+        adjacency (csr_matrix): the adjacency matrix, whose arrays are memory-mapped
+        labels (np.ndarray): the memory-mapped vertex labels, None if none were saved
+    """
+    adjacency, labels, _, _ = __load(directory)
+    return adjacency, labels
+
+def __is_fresh(header, source):
+    # a sidecar is used if it has the current format and was converted from the current version of the source
+    stat = os.stat(source)
+    return (header.get('version') == CSR_FORMAT_VERSION and header.get('source_size') == stat.st_size
+            and header.get('source_mtime') == stat.st_mtime)
+
+def __convert(filepath, heads):
+    # read a GML file or an edgelist once, into its adjacency matrix, vertex labels, whether it is weighted
+    # and its vertex attributes
+    if filepath.endswith('.gml'):
+        g = Graph.Read_GML(filepath)
+        weights = 'weight' if 'weight' in g.es.attributes() else None
+        attributes = {name: g.vs[name] for name in g.vs.attributes()}
+        for name in ('label', 'name', 'id'):
+            if name in g.vs.attributes():
+                return get_adjacency(g, weights), np.array([str(label) for label in g.vs[name]]), weights is not None, attributes
+        return get_adjacency(g, weights), None, weights is not None, attributes
+    g = read_edgelist(filepath, heads)
+    weights = 'weight' if 'weight' in heads else None
+    return get_adjacency(g, weights), np.array(g.vs['name'], dtype=str), weights is not None, dict()
+
+def __sidecar(filepath, cache_directory):
+    # the sidecar of a source, named after the file and a digest of its absolute path
+    digest = hashlib.blake2b(os.path.abspath(filepath).encode(), digest_size=8).hexdigest()
+    directory = settings.CSR_CACHE_DIRECTORY if cache_directory is None else cache_directory
+    return os.path.join(directory, f'{os.path.basename(filepath)}-{digest}.csr')
+
+def __read(filepath, heads, cache, cache_directory):
+    # the adjacency matrix and labels of read_csr, whether the source is weighted and its vertex attributes
+    if not cache:
+        return __convert(filepath, heads)
+    directory = __sidecar(filepath, cache_directory)
+    try:
+        adjacency, labels, header, attributes = __load(directory)
+    except (OSError, ValueError, KeyError):
+        header = None
+    if header is None or not __is_fresh(header, filepath):
+        adjacency, labels, weighted, attributes = __convert(filepath, heads)
+        save_csr(directory, adjacency, labels, filepath, weighted, attributes)
+        adjacency, labels, header, attributes = __load(directory)
+    return adjacency, labels, header.get('weighted', True), attributes
+
+def read_csr(filepath, heads=['from', 'to', 'weight'], cache=True, cache_directory=None):
+    """Read the adjacency matrix of a GML file or an edgelist through a binary sidecar cache.
+
+    The first read converts the file and saves it as a sidecar in 'cache_directory', see save_csr. Later reads
+    memory-map the sidecar, which is rebuilt whenever the size or the modification time of the source changes.
+
+    The entries of an unweighted source are edge multiplicities: k parallel edges give an entry k, and a self-loop
+    is one diagonal entry per loop, which read_array_graph and read_graph expand back into separate edges.
+    The multiple edges of a weighted source are collapsed into one entry holding the sum of their weights,
+    so they come back as a single weighted edge.
+
+    Arguments:
+        filepath (str): filepath of the .gml file or of the edgelist
+        heads (List[str]): titles of each column of an edgelist, see read_edgelist
+        cache (bool): if False, convert the file without reading or writing the sidecar
+        cache_directory (str): the directory of the sidecars, by default CSR_CACHE_DIRECTORY in settings.py
+
+    Returns:
+        adjacency (csr_matrix): the adjacency matrix, weighted if the source has weights
+        labels (np.ndarray): the label of every vertex, None if the source has none
+    """
+    adjacency, labels, _, _ = __read(filepath, heads, cache, cache_directory)
+    return adjacency, labels
+
+def read_graph(filepath, heads=['from', 'to', 'weight'], cache=True, cache_directory=None):
+    """Read an undirected igraph graph from a GML file or an edgelist through the binary sidecar cache of read_csr.
+
+    The graph is rebuilt from the upper triangle of the adjacency matrix. The multiple edges and self-loops of an
+    unweighted source are restored, so the vertex and edge counts and the degrees match Graph.Read_GML, while
+    the multiple edges of a weighted source become one edge whose 'weight' is their sum. Weights are only set
+    if some differ from 1. The labels are stored in the 'name' attribute, and the vertex attributes of a GML
+    file, such as 'id' and 'label', are restored as Graph.Read_GML sets them.
+
+    Arguments:
+        filepath (str): filepath of the .gml file or of the edgelist
+        heads (List[str]): titles of each column of an edgelist, see read_edgelist
+        cache (bool): if False, convert the file without reading or writing the sidecar
+        cache_directory (str): the directory of the sidecars, see read_csr
+
+    Returns:
+        g (igraph.Graph): the undirected graph
+    """
+    adjacency, labels, weighted, attributes = __read(filepath, heads, cache, cache_directory)
+    g = ArrayGraph.from_csr(adjacency, labels, multiplicities=not weighted).to_igraph()
+    for name, values in attributes.items():
+        g.vs[name] = np.asarray(values).tolist()
+    return g
+
+def read_array_graph(filepath, heads=['from', 'to', 'weight'], cache=True, cache_directory=None):
+    """Read an undirected ArrayGraph from a GML file or an edgelist through the binary sidecar cache of read_csr.
+
+    The memory-mapped adjacency matrix is kept as the adjacency matrix of the graph, so no per-edge Python object
+    is created. Edges and weights follow the conventions of read_graph.
+
+    Arguments:
+        filepath (str): filepath of the .gml file or of the edgelist
+        heads (List[str]): titles of each column of an edgelist, see read_edgelist
+        cache (bool): if False, convert the file without reading or writing the sidecar
+        cache_directory (str): the directory of the sidecars, see read_csr
+
+    Returns:
+        g (ArrayGraph): the undirected graph, labelled by the vertex labels of the source if any
+    """
+    adjacency, labels, weighted, _ = __read(filepath, heads, cache, cache_directory)
+    return ArrayGraph.from_csr(adjacency, labels, multiplicities=not weighted)
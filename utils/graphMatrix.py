@@ -0,0 +1,329 @@
+from collections import OrderedDict
+import weakref
+import numpy as np
+import scipy.sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import LinearOperator
+from utils.spmm import spmm
+from utils.arrayGraph import ArrayGraph
+from utils.arrayGraph import adjacency_from_edges
+from utils.arrayGraph import get_edge_array
+
+class GraphMatrixCache(object):
+    """A bounded LRU cache of the matrices built from igraph graphs or ArrayGraphs, keyed by graph object.
+
+    An entry is dropped when its graph is garbage collected. The entries of an ArrayGraph are rebuilt after
+    any of its edits, which it counts itself. The entries of an igraph graph are rebuilt when its vertex or edge count
+    changes, a lookup costs O(1) and never reads the edges: edits that keep both counts (deleting and adding
+    an edge, rewiring, changing weights in place) are not detected, call 'invalidate' after them.
+
+    Arguments:
+        maxsize (int): the maximum number of graphs whose matrices are kept
+    """
+    def __init__(self, maxsize=32):
+        self.__maxsize = maxsize
+        self.__entries = OrderedDict()
+
+    def __token(self, graph):
+        if isinstance(graph, ArrayGraph):
+            return (graph.vcount(), graph.version())
+        return (graph.vcount(), graph.ecount())
+
+    def __drop(self, ident):
+        self.__entries.pop(ident, None)
+
+    def get(self, graph, key, build):
+        """Get a cached matrix of a graph, building it on a miss.
+
+        Arguments:
+            graph (igraph.Graph or ArrayGraph): the graph
+            key (tuple): the description of the matrix, e.g. ('adjacency', None)
+            build (Callable[[], object]): the function building the matrix
+
+        Returns:
+            value (object): the cached or newly built matrix
+        """
+        ident = id(graph)
+        token = self.__token(graph)
+        entry = self.__entries.get(ident)
+        if entry is None or entry[0]() is not graph or entry[1] != token:
+            ref = weakref.ref(graph, lambda _, ident=ident: self.__drop(ident))
+            entry = (ref, token, dict())
+            self.__entries[ident] = entry
+            while len(self.__entries) > self.__maxsize:
+                self.__entries.popitem(last=False)
+        self.__entries.move_to_end(ident)
+
+        values = entry[2]
+        if key not in values:
+            values[key] = build()
+        return values[key]
+
+    def invalidate(self, graph=None):
+        """Drop the cached matrices of a graph, or of all graphs if graph is None."""
+        if graph is None:
+            self.__entries.clear()
+        else:
+            self.__drop(id(graph))
+
+    def resize(self, maxsize):
+        """Change the maximum number of graphs kept, evicting the least recently used ones."""
+        self.__maxsize = maxsize
+        while len(self.__entries) > self.__maxsize:
+            self.__entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.__entries)
+
+matrix_cache = GraphMatrixCache()
+
+def __edge_weights(graph, weights):
+    if weights is None:
+        return None
+    if isinstance(weights, str):
+        if isinstance(graph, ArrayGraph):
+            return graph.weights()
+        return np.array(graph.es[weights], dtype=np.float64)
+    return np.asarray(weights, dtype=np.float64)
+
+def __cached(graph, key, weights, build):
+    # weights given as arrays cannot be used as a cache key
+    if weights is None or isinstance(weights, str):
+        return matrix_cache.get(graph, key, build)
+    return build()
+
+def get_adjacency(graph, weights=None, dtype=np.float64):
+    """Get the sparse adjacency matrix of an undirected graph.
+
+    The returned matrix is shared through the cache and must not be modified in place.
+
+    Arguments:
+        graph (igraph.Graph, ArrayGraph or spmatrix): the undirected graph, or its adjacency matrix which is used as given
+            (e.g. a memory-mapped matrix from 'utils.graphIO.read_csr'), its entries being the weights
+        weights (str or np.ndarray): the name of the edge attribute holding the weights, or the weights themselves
+        dtype (np.dtype): the dtype of the matrix
+
+    Returns:
+        A (csr_matrix): the adjacency matrix
+    """
+    if scipy.sparse.issparse(graph):
+        return scipy.sparse.csr_matrix(graph, dtype=dtype)
+    if isinstance(graph, ArrayGraph) and np.dtype(dtype) == np.float64 and (isinstance(weights, str) or weights is None and not graph.is_weighted()):
+        return graph.adjacency()
+    def build():
+        return adjacency_from_edges(get_edge_array(graph), graph.vcount(), __edge_weights(graph, weights), dtype)
+    return __cached(graph, ('adjacency', weights, np.dtype(dtype).str), weights, build)
+
+def get_degree(graph, weights=None):
+    """Get the degree (or strength) vector of an undirected graph from its adjacency matrix.
+
+    Arguments:
+        graph (igraph.Graph, ArrayGraph or spmatrix): the undirected graph, or its adjacency matrix
+        weights (str or np.ndarray): the name of the edge attribute holding the weights, or the weights themselves
+
+    Returns:
+        d (np.ndarray): the row sums of the adjacency matrix
+    """
+    if scipy.sparse.issparse(graph):
+        return np.asarray(get_adjacency(graph).sum(axis=1)).ravel()
+    def build():
+        return np.asarray(get_adjacency(graph, weights).sum(axis=1)).ravel()
+    return __cached(graph, ('degree', weights), weights, build)
+
+def get_vcount(graph):
+    """Get the number of vertices of a graph or of its adjacency matrix."""
+    if scipy.sparse.issparse(graph):
+        return graph.shape[0]
+    return graph.vcount()
+
+def get_ecount(graph):
+    """Get the number of edges of a graph, or of an adjacency matrix whose entries are edge multiplicities,
+       a self-loop being one diagonal entry."""
+    if scipy.sparse.issparse(graph):
+        adjacency = get_adjacency(graph)
+        return int(round((adjacency.sum() + adjacency.diagonal().sum()) / 2))
+    return graph.ecount()
+
+def get_degree_sequence(graph):
+    """Get the degree sequence of a graph as igraph counts it, a self-loop counting twice. For an adjacency matrix
+       these are the row sums plus the diagonal, the degrees of a multigraph whose entries are edge multiplicities."""
+    if scipy.sparse.issparse(graph):
+        adjacency = get_adjacency(graph)
+        return get_degree(adjacency) + adjacency.diagonal()
+    return np.array(graph.degree(), dtype=np.int64)
+
+def get_membership(graph):
+    """Get the connected component of every vertex of a graph or of its adjacency matrix."""
+    if scipy.sparse.issparse(graph) or isinstance(graph, ArrayGraph):
+        return connected_components(get_adjacency(graph), directed=False)[1]
+    return graph.components().membership
+
+def get_array_graph(graph, weights=None):
+    """Get a graph as an ArrayGraph, converting an igraph graph once and caching the conversion.
+
+    Arguments:
+        graph (igraph.Graph, ArrayGraph or spmatrix): the undirected graph, or its adjacency matrix
+        weights (str or np.ndarray): the name of the edge attribute of an igraph graph holding the weights,
+            or the weights themselves
+
+    Returns:
+        graph (ArrayGraph): the graph itself if already an ArrayGraph
+    """
+    if isinstance(graph, ArrayGraph):
+        return graph
+    if scipy.sparse.issparse(graph):
+        return ArrayGraph.from_csr(graph)
+    def build():
+        return ArrayGraph.from_igraph(graph, weights)
+    return __cached(graph, ('array_graph', weights), weights, build)
+
+def laplacian_from_adjacency(adjacency, normalized=False):
+    """Build the combinatorial or normalized Laplacian matrix from a sparse adjacency matrix.
+
+    Arguments:
+        adjacency (spmatrix): the symmetric adjacency matrix
+        normalized (bool): if True, return I - D^{-1/2} A D^{-1/2}, with zero rows for isolated vertices
+
+    Returns:
+        L (csr_matrix): the Laplacian matrix
+    """
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    if not normalized:
+        return (scipy.sparse.diags(degree) - adjacency).tocsr()
+    with np.errstate(divide='ignore'):
+        scale = 1 / np.sqrt(degree)
+    scale[degree == 0] = 0
+    scale = scipy.sparse.diags(scale)
+    return (scipy.sparse.diags((degree > 0).astype(adjacency.dtype)) - scale @ adjacency @ scale).tocsr()
+
+def get_laplacian(graph, normalized=False, weights=None):
+    """Get the sparse combinatorial or normalized Laplacian matrix of an undirected graph.
+
+    The returned matrix is shared through the cache and must not be modified in place.
+
+    Arguments:
+        graph (igraph.Graph, ArrayGraph or spmatrix): the undirected graph, or its adjacency matrix
+        normalized (bool): if True, return the normalized Laplacian
+        weights (str or np.ndarray): the name of the edge attribute holding the weights, or the weights themselves
+
+    Returns:
+        L (csr_matrix): the Laplacian matrix
+    """
+    if scipy.sparse.issparse(graph):
+        return laplacian_from_adjacency(get_adjacency(graph), normalized)
+    def build():
+        return laplacian_from_adjacency(get_adjacency(graph, weights), normalized)
+    return __cached(graph, ('laplacian', normalized, weights), weights, build)
+
+class LaplacianOperator(LinearOperator):
+    """A matrix-free Laplacian computing L @ X from the sparse adjacency matrix and the degree vector,
+       without storing a second nnz-sized matrix.
+
+    Arguments:
+        adjacency (spmatrix): the symmetric adjacency matrix, with non-negative weights
+        kind (str): 'combinatorial' for D - A, 'normalized' for I - D^{-1/2} A D^{-1/2} (zero rows for isolated vertices),
+            or 'density' for (D - A) / trace(D - A), the density matrix of the von Neumann graph entropy
+        degree (np.ndarray): the row sums of the adjacency matrix, computed if None
+        factor (float): the scaling of the operator, 1 / trace(D - A) for 'density' and 1 otherwise if None
+        isolated (float): the diagonal entry of isolated vertices in the normalized Laplacian, 1 gives I - D^{-1/2} A D^{-1/2}
+    """
+    def __init__(self, adjacency, kind='combinatorial', degree=None, factor=None, isolated=0.0):
+        adjacency = scipy.sparse.csr_matrix(adjacency)
+        if degree is None:
+            degree = np.asarray(adjacency.sum(axis=1)).ravel()
+        degree = np.asarray(degree, dtype=adjacency.dtype)
+        super().__init__(adjacency.dtype, adjacency.shape)
+
+        self.adjacency = adjacency
+        self.degree = degree
+        self.kind = kind
+        self.isolated = isolated
+        if kind == 'combinatorial' or kind == 'density':
+            self.__diag = degree
+            self.__scale = None
+        elif kind == 'normalized':
+            with np.errstate(divide='ignore'):
+                scale = 1 / np.sqrt(degree)
+            scale[degree == 0] = 0
+            self.__diag = np.where(degree > 0, 1, isolated).astype(adjacency.dtype)
+            self.__scale = scale
+        else:
+            raise ValueError("Unknown Laplacian: expected one of ['combinatorial', 'normalized', 'density'], got", kind)
+        if factor is None:
+            trace = degree.sum() - adjacency.diagonal().sum()
+            factor = 1 / trace if kind == 'density' and trace > 0 else 1
+        self.factor = adjacency.dtype.type(factor)
+
+    def _matmat(self, X):
+        if self.__scale is None:
+            Y = spmm(self.adjacency, X)
+            np.subtract(self.__diag[:, None] * X, Y, out=Y)
+        else:
+            Y = spmm(self.adjacency, self.__scale[:, None] * X)
+            Y *= self.__scale[:, None]
+            np.subtract(self.__diag[:, None] * X, Y, out=Y)
+        if self.factor != 1:
+            Y *= self.factor
+        return Y
+
+    def _matvec(self, x):
+        return self._matmat(np.reshape(x, (-1, 1))).reshape(np.shape(x))
+
+    def _adjoint(self):
+        return self
+
+    def diagonal(self):
+        """Get the diagonal of the Laplacian matrix."""
+        loops = self.adjacency.diagonal()
+        if self.__scale is not None:
+            loops = loops * self.__scale ** 2
+        return self.factor * (self.__diag - loops)
+
+    def gershgorin_bounds(self):
+        """Bound the spectrum, by [0, 2 * max_degree] for the combinatorial Laplacian, scaled for the other kinds."""
+        if self.kind == 'normalized':
+            return 0.0, 2.0 * self.factor
+        return 0.0, float(2 * self.factor * self.degree.max()) if len(self.degree) > 0 else 0.0
+
+    def restrict(self, indices):
+        """Restrict the operator to the rows and columns of the given vertices, keeping the degrees and the scaling.
+           It is exact when the other vertices are isolated or form separate connected components."""
+        adjacency = self.adjacency[indices][:, indices]
+        return LaplacianOperator(adjacency, self.kind, self.degree[indices], self.factor, self.isolated)
+
+    def toarray(self):
+        """Materialize the Laplacian as a dense matrix."""
+        dense = self.adjacency.toarray()
+        if self.__scale is not None:
+            dense *= self.__scale[:, None]
+            dense *= self.__scale[None, :]
+        np.negative(dense, out=dense)
+        dense[np.diag_indices_from(dense)] += self.__diag
+        if self.factor != 1:
+            dense *= self.factor
+        return dense
+
+    def tocsr(self):
+        """Materialize the Laplacian as a sparse matrix."""
+        if self.__scale is None:
+            laplacian = scipy.sparse.diags(self.__diag) - self.adjacency
+        else:
+            scale = scipy.sparse.diags(self.__scale)
+            laplacian = scipy.sparse.diags(self.__diag) - scale @ self.adjacency @ scale
+        return (self.factor * laplacian).tocsr()
+
+def get_laplacian_operator(graph, kind='combinatorial', weights=None, dtype=np.float64):
+    """Get the matrix-free Laplacian operator of an undirected graph, sharing the cached adjacency matrix.
+
+    Arguments:
+        graph (igraph.Graph, ArrayGraph or spmatrix): the undirected graph, or its adjacency matrix
+        kind (str): 'combinatorial', 'normalized' or 'density', see LaplacianOperator
+        weights (str or np.ndarray): the name of the edge attribute holding the weights, or the weights themselves
+        dtype (np.dtype): the dtype of the operator
+
+    Returns:
+        L (LaplacianOperator): the Laplacian operator
+    """
+    adjacency = get_adjacency(graph, weights, dtype)
+    degree = get_degree(graph, weights) if np.dtype(dtype) == np.float64 else None
+    return LaplacianOperator(adjacency, kind, degree)
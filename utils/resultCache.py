@@ -0,0 +1,249 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+import time
+import numpy as np
+import scipy.sparse
+from igraph import Graph
+import settings
+from utils.arrayGraph import ArrayGraph
+from utils.arrayGraph import get_edge_array
+
+def graph_digest(graph, digest=None):
+    """Hash the content of a graph, independently of the order in which its edges were added.
+
+    The edges of an undirected graph are stored with their smaller endpoint first and sorted, so two graphs
+    with the same vertices, edges (and 'weight' attribute) get the same digest, whether held by igraph or by
+    an ArrayGraph. Sparse matrices are hashed by their canonical CSR arrays.
+
+    Arguments:
+        graph (igraph.Graph, ArrayGraph or spmatrix): the graph, or its adjacency matrix
+        digest (hashlib object): the digest to update, a new blake2b digest if None
+
+    Returns:
+        digest (hashlib object): the updated digest
+    """
+    if digest is None:
+        digest = hashlib.blake2b(digest_size=20)
+    if isinstance(graph, (Graph, ArrayGraph)):
+        edges = get_edge_array(graph)
+        if not graph.is_directed():
+            edges = np.sort(edges, axis=1)
+        order = np.lexsort((edges[:, 1], edges[:, 0]))
+        digest.update(repr(('graph', graph.vcount(), graph.is_directed())).encode())
+        digest.update(np.ascontiguousarray(edges[order]).tobytes())
+        if isinstance(graph, ArrayGraph):
+            weights = graph.weights()
+        else:
+            weights = graph.es['weight'] if 'weight' in graph.es.attributes() else None
+        if weights is not None:
+            digest.update(np.asarray(weights, dtype=np.float64)[order].tobytes())
+    elif scipy.sparse.issparse(graph):
+        matrix = scipy.sparse.csr_matrix(graph, copy=True)
+        matrix.sum_duplicates()
+        matrix.sort_indices()
+        digest.update(repr(('matrix', matrix.shape, matrix.dtype.str)).encode())
+        for array in (matrix.indptr, matrix.indices, matrix.data):
+            digest.update(np.ascontiguousarray(array).tobytes())
+    else:
+        raise TypeError("Cannot hash a graph of type", type(graph))
+    return digest
+
+def _update(digest, value):
+    # hash a parameter by content: graphs and arrays by their data, containers recursively, anything else by repr
+    if isinstance(value, (Graph, ArrayGraph)) or scipy.sparse.issparse(value):
+        graph_digest(value, digest)
+    elif isinstance(value, np.ndarray):
+        digest.update(repr(('array', value.shape, value.dtype.str)).encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(repr((type(value).__name__, len(value))).encode())
+        for item in value:
+            _update(digest, item)
+    elif isinstance(value, dict):
+        digest.update(repr(('dict', len(value))).encode())
+        for name in sorted(value):
+            digest.update(repr(name).encode())
+            _update(digest, value[name])
+    else:
+        digest.update(repr(value).encode())
+
+class ResultCache(object):
+    """A persistent, size-bounded LRU cache of metric results, keyed by a digest of the graph, the metric and its parameters.
+
+    Every result is pickled into its own file, written to a temporary file and renamed into place, so processes
+    sharing the directory never read a partial entry. The modification time of an entry is refreshed on every hit,
+    and the least recently used entries are removed once the directory exceeds 'max_bytes'. Results computed
+    in less than 'min_seconds' are not stored, as reading them back would not be faster.
+
+    The keys cover the arguments but not the code of the metrics, so a result stays valid until it is invalidated:
+    bump the 'version' of a metric in its 'memoize' decorator when its results change, bump the 'version' of the
+    cache (CACHE_SETTINGS in settings.py) to invalidate every entry at once, or call 'clear'.
+
+    Arguments:
+        directory (str): the directory holding the entries, created on the first write
+        max_bytes (int): the maximum total size of the entries
+        min_seconds (float): the minimum computation time of a stored result
+        enabled (bool): if False, every lookup misses and nothing is stored
+        version (int): the salt of every key, entries of other versions are never read
+    """
+    def __init__(self, directory='cache', max_bytes=1 << 30, min_seconds=0.5, enabled=False, version=1):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_seconds = min_seconds
+        self.enabled = enabled
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def key(self, name, arguments, version=1):
+        """Get the digest of a metric name, its version and its arguments, graphs included, as a hexadecimal string."""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(repr(('metric', name, version, 'cache', self.version)).encode())
+        _update(digest, arguments)
+        return digest.hexdigest()
+
+    def __path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def get(self, key):
+        """Get a cached result.
+
+        Returns:
+            found (bool): whether the entry exists
+            value (object): the cached result, None on a miss
+        """
+        path = self.__path(key)
+        try:
+            with open(path, 'rb') as file:
+                seconds, value = pickle.load(file)
+        except FileNotFoundError:
+            self.misses += 1
+            return False, None
+        except Exception: # a truncated or unreadable entry, e.g. pickled by another version of a class, is recomputed
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            self.misses += 1
+            return False, None
+        try:
+            os.utime(path)
+        except FileNotFoundError: # evicted by another process meanwhile
+            pass
+        self.hits += 1
+        self.saved_seconds += seconds
+        return True, value
+
+    def put(self, key, value, seconds=0.0):
+        """Store a result that took 'seconds' to compute, then evict the least recently used entries over the budget."""
+        os.makedirs(self.directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                pickle.dump((seconds, value), file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.__path(key))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.evict()
+
+    def __entries(self):
+        entries = []
+        try:
+            iterator = os.scandir(self.directory)
+        except FileNotFoundError:
+            return entries
+        with iterator:
+            for entry in iterator:
+                if not entry.name.endswith('.pkl'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in 'max_bytes'."""
+        entries = sorted(self.__entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        for _, _, path in self.__entries():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def stats(self):
+        """Get the hit and miss counts of this process, the computation time saved by hits, and the entries on disk."""
+        entries = self.__entries()
+        return dict(hits=self.hits, misses=self.misses, saved_seconds=self.saved_seconds,
+                    entries=len(entries), bytes=sum(size for _, size, _ in entries))
+
+    def __len__(self):
+        return len(self.__entries())
+
+result_cache = ResultCache(**settings.CACHE_SETTINGS)
+
+def memoize(name=None, seed=None, ignore=(), cache=None, version=1):
+    """Cache the results of a metric in a ResultCache.
+
+    The key covers the metric name, its version and all bound arguments with their defaults, graphs and arrays
+    by content. A randomized metric is only cached when its seed argument is not None, as its result is otherwise
+    not reproducible. Every call is timed, and its result is only stored when it took at least 'min_seconds'.
+
+    Arguments:
+        name (str): the name of the metric, by default the module and name of the function
+        seed (str): the name of the seed argument of a randomized metric
+        ignore (Iterable[str]): the arguments that do not change the result, e.g. the number of workers
+        cache (ResultCache): the cache, by default 'result_cache'
+        version (int): the version of the metric, to be bumped when a change of the code changes its results
+
+    Returns:
+        decorator (Callable): the decorator
+    """
+    def decorator(function):
+        metric = name or f'{function.__module__}.{function.__qualname__}'
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            store = result_cache if cache is None else cache
+            if not store.enabled:
+                return function(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            if seed is not None and bound.arguments[seed] is None:
+                return function(*args, **kwargs)
+            arguments = {k: v for k, v in bound.arguments.items() if k not in ignore}
+            key = store.key(metric, arguments, version)
+            found, value = store.get(key)
+            if found:
+                return value
+            tik = time.perf_counter()
+            value = function(*args, **kwargs)
+            seconds = time.perf_counter() - tik
+            if seconds >= store.min_seconds:
+                store.put(key, value, seconds)
+            return value
+        return wrapper
+    return decorator
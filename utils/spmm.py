@@ -0,0 +1,118 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import scipy.sparse
+
+# Products with fewer multiply-adds than this run on the calling thread, where the pool overhead would dominate.
+MIN_PARALLEL_WORK = 1 << 18
+
+def __cpu_count():
+    # the CPUs this process may run on, which can be fewer than os.cpu_count() in containers
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+__num_threads = int(os.environ.get('SPMM_NUM_THREADS', __cpu_count()))
+__executor = None
+__lock = threading.Lock()
+
+def __reset_after_fork():
+    # the pool threads do not survive a fork, the child process starts its own pool
+    global __executor, __lock
+    __executor = None
+    __lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=__reset_after_fork)
+
+def get_num_threads():
+    """Get the number of threads used by 'spmm'."""
+    return __num_threads
+
+def set_num_threads(num_threads):
+    """Set the number of threads used by 'spmm', the environment variable SPMM_NUM_THREADS sets the default.
+
+    Arguments:
+        num_threads (int): the number of threads, 1 runs every product on the calling thread
+    """
+    global __num_threads, __executor
+    if num_threads < 1:
+        raise ValueError("The number of threads must be positive, got", num_threads)
+    with __lock:
+        __num_threads = int(num_threads)
+        executor, __executor = __executor, None
+    # the blocks of a product are submitted under the lock, so the old pool finishes every product already started on it
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+def __submit(function, bounds):
+    # submit the row blocks to the shared pool, all of them before 'set_num_threads' can swap the pool
+    global __executor
+    with __lock:
+        if __executor is None:
+            __executor = ThreadPoolExecutor(max_workers=__num_threads, thread_name_prefix='spmm')
+        return [__executor.submit(function, start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+def row_blocks(matrix, nblocks):
+    """Split the rows of a CSR matrix into contiguous blocks holding about the same number of nonzeros.
+
+    Arguments:
+        matrix (csr_matrix): the sparse matrix
+        nblocks (int): the number of blocks
+
+    Returns:
+        bounds (np.ndarray): the nblocks + 1 row boundaries of the blocks
+    """
+    indptr = matrix.indptr
+    targets = np.linspace(0, indptr[-1], nblocks + 1)
+    bounds = np.searchsorted(indptr, targets, side='left')
+    bounds[0], bounds[-1] = 0, matrix.shape[0]
+    return np.unique(bounds)
+
+def __row_block(matrix, start, stop):
+    # a view of rows [start, stop) sharing the data and indices of the matrix
+    lo, hi = matrix.indptr[start], matrix.indptr[stop]
+    return scipy.sparse.csr_matrix((matrix.data[lo:hi], matrix.indices[lo:hi], matrix.indptr[start:stop + 1] - lo),
+                                   shape=(stop - start, matrix.shape[1]), copy=False)
+
+def spmm(matrix, X, num_threads=None):
+    """Multiply a sparse matrix with a dense block of vectors, splitting the CSR rows into blocks computed on a thread pool.
+
+    SciPy releases the GIL inside the sparse kernels, so the blocks run in parallel. Small products, non-CSR matrices
+    and other operators (e.g. a LaplacianOperator, which calls 'spmm' itself) are computed by 'matrix @ X'.
+
+    Arguments:
+        matrix (spmatrix or LinearOperator): the (n x p) matrix
+        X (np.ndarray): a (p x k) block of vectors, or a vector of length p
+        num_threads (int): the number of threads, by default 'get_num_threads()'
+
+    Returns:
+        Y (np.ndarray): the product matrix @ X
+    """
+    if num_threads is None:
+        num_threads = __num_threads
+    if not (scipy.sparse.issparse(matrix) and matrix.format == 'csr'):
+        return matrix @ X
+    X = np.asarray(X)
+    width = X.shape[1] if X.ndim == 2 else 1
+    if num_threads <= 1 or matrix.nnz * width < MIN_PARALLEL_WORK or matrix.shape[0] < 2 * num_threads:
+        return matrix @ X
+
+    bounds = row_blocks(matrix, num_threads)
+    Y = np.empty((matrix.shape[0],) + X.shape[1:], dtype=np.result_type(matrix.dtype, X.dtype))
+
+    def multiply(start, stop):
+        Y[start:stop] = __row_block(matrix, start, stop) @ X
+
+    if num_threads == __num_threads:
+        futures = __submit(multiply, bounds)
+        for future in futures:
+            future.result()
+        return Y
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        futures = [executor.submit(multiply, start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+        for future in futures:
+            future.result()
+    return Y
@@ -0,0 +1,78 @@
+from math import log2
+import numpy as np
+
+# x * log2(x) is taken as 0 for x <= EPSILON, the convention 0 * log(0) = 0 extended to rounding noise around 0.
+EPSILON = 1e-8
+
+class XLogXTable(object):
+    """A growable table of d * log2(d) for the integers d >= 0, indexed by d.
+
+    The table doubles whenever a larger integer is looked up, so incremental degree updates and greedy loops
+    pay one indexing operation per term instead of a logarithm. Negative integers map to 0, as for x <= EPSILON.
+
+    Arguments:
+        size (int): the initial number of entries
+    """
+    def __init__(self, size=1024):
+        self.__values = np.zeros(0, dtype=np.float64)
+        self.__list = []
+        self.grow(size)
+
+    def grow(self, size):
+        """Extend the table to hold at least the integers 0, ..., size - 1."""
+        if size <= len(self.__list):
+            return
+        size = max(size, 2 * len(self.__list))
+        d = np.arange(size, dtype=np.float64)
+        values = np.zeros(size, dtype=np.float64)
+        values[1:] = d[1:] * np.log2(d[1:])
+        self.__values = values
+        self.__list = values.tolist()
+
+    def lookup(self, degrees):
+        """Get d * log2(d) for an integer array of degrees."""
+        degrees = np.maximum(np.asarray(degrees, dtype=np.int64), 0)
+        if degrees.size > 0:
+            self.grow(int(degrees.max()) + 1)
+        return self.__values[degrees]
+
+    def __getitem__(self, d):
+        if d <= 0:
+            return 0.0
+        if d >= len(self.__list):
+            self.grow(d + 1)
+        return self.__list[d]
+
+    def __len__(self):
+        return len(self.__list)
+
+xlogx_table = XLogXTable()
+
+def xlogx(x):
+    """Compute x * log2(x) elementwise, 0 for x <= EPSILON.
+
+    Integer arrays are looked up in the shared table, real-valued ones (weighted degrees, probabilities, eigenvalues)
+    are computed in one vectorized pass.
+
+    Arguments:
+        x (np.ndarray): the integer or real values
+
+    Returns:
+        result (np.ndarray): the float64 results, with the shape of x
+    """
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.integer) or x.dtype == np.bool_:
+        return xlogx_table.lookup(x)
+    x = np.asarray(x, dtype=np.float64)
+    result = np.zeros(x.shape, dtype=np.float64)
+    mask = x > EPSILON
+    result[mask] = x[mask] * np.log2(x[mask])
+    return result
+
+def xlogx_scalar(x):
+    """Compute x * log2(x) for one integer or real value, 0 for x <= EPSILON, without creating arrays."""
+    if isinstance(x, (int, np.integer)):
+        return xlogx_table[int(x)]
+    if x <= EPSILON:
+        return 0.0
+    return x * log2(x)